@@ -15,7 +15,7 @@ import re
 
 import romaji
 import kana_kanji
-from exists import exists_lc
+from exists import exists_lc, name_index
 from progress import progress
 
 from aqt import mw
@@ -247,6 +247,7 @@ def dehashilate():
                 if do_rename:
                     src = os.path.join(mdir, old_name)
                     dst = os.path.join(mdir, new_name)
+                    mtime = os.stat(mdir).st_mtime
                     try:
                         os.rename(src, dst)
                     except OSError:
@@ -254,6 +255,7 @@ def dehashilate():
                         bad_mv_text += u'{0} → {1}\n'.format(src, dst)
                     else:
                         new_names_dict[old_name] = new_name
+                        name_index.rename(mdir, old_name, new_name, mtime)
                     n[name] = value.replace(old_name, new_name)
                     n.flush()
                     rename_exec_list.append(dict(nid=nid,
@@ -5,9 +5,68 @@
 #
 
 import os
+import threading
+import unicodedata
 from anki.utils import isWin, isMac
 
 
+def index_name(name):
+    return unicodedata.normalize('NFC', name.lower())
+
+
+class NameIndex(object):
+    """
+    The names of the files in a folder, by lower case NFC name.
+
+    Read the folder once, and again only when its mtime changes,
+    rather than for every name we test.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        self.mtime = None
+        self.names = {}
+
+    def refresh(self, path):
+        mtime = os.stat(path).st_mtime
+        if path == self.path and mtime == self.mtime:
+            return
+        self.names = {}
+        for fname in os.listdir(path):
+            self.names.setdefault(index_name(fname), []).append(fname)
+        self.path = path
+        self.mtime = mtime
+
+    def matches(self, path, name):
+        with self.lock:
+            self.refresh(path)
+            return list(self.names.get(index_name(name), []))
+
+    def rename(self, path, old_name, new_name, old_mtime):
+        """
+        Update the index after we renamed a file in the folder.
+
+        old_mtime is the mtime of the folder from just before the
+        rename.
+        """
+        with self.lock:
+            if path != self.path:
+                return
+            old_list = self.names.get(index_name(old_name), [])
+            if old_name in old_list:
+                old_list.remove(old_name)
+            self.names.setdefault(index_name(new_name), []).append(new_name)
+            if old_mtime == self.mtime:
+                # Only our own change since we read the folder.
+                self.mtime = os.stat(path).st_mtime
+            else:
+                # Someone else changed it, too. Read it again next time.
+                self.mtime = None
+
+
+name_index = NameIndex()
+
+
 def exists_lc(path, name):
     """
     Test if file name clashes with name of extant file.
@@ -15,7 +74,7 @@ def exists_lc(path, name):
     On Windows and Mac OS X, simply check if the file exists.
     On (other) POSIX systems, check if the name clashes with an
     existing file's name that is the same or differs only in
-    capitalization.
+    capitalization (or Unicode normalization).
 
     """
     # The point is tha like this syncing from Linux to
@@ -26,5 +85,4 @@ def exists_lc(path, name):
     # doing simple checks like if _exists_lc(...): will work as
     # expected. If this is not acceptable, a 'not not' can be added
     # before the opening '[' to return a Boolean.
-    return [fname for fname in os.listdir(path)
-            if fname.lower() == name.lower()]
+    return name_index.matches(path, name)
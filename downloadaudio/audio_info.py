@@ -0,0 +1,166 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+What we know about the sound of a processed file.
+
+The processor measures every file while it has it decoded anyway: the
+length, the peak and RMS level and how much of it was silence. That
+goes into an AudioInfo, which the review dialog shows and the batch
+fill uses to pick files.
+
+The AudioInfos are also kept in a small SQLite index, by the SHA-256
+of the processed file, the same hash dedup.py uses for the media
+folder. So we can look up a file we processed before without decoding
+it again. New AudioInfos are written in batches, and those of files we
+haven’t seen for max_age are removed when the index is opened.
+"""
+
+from collections import namedtuple
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+AudioInfo = namedtuple('AudioInfo', ['duration', 'peak', 'rms', 'silence'])
+# duration: seconds, after removing the silence. peak, rms: dBFS of
+# the sound as downloaded. silence: the part of the download we cut
+# off as silence, 0 to 1.
+
+min_level = -120.0
+# dBFS. What we write for digital silence instead of -infinity.
+
+write_batch_size = 20
+# Write new AudioInfos to disk after this many, or when flush() is
+# called.
+max_age = 180 * 24 * 60 * 60
+# Seconds. Forget the AudioInfos of files we haven’t processed or
+# looked up for this long.
+
+audio_info_db_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'audio_info.db')
+
+schema = u'''
+create table if not exists audio_info (
+  hash text primary key,
+  duration real,
+  peak real,
+  rms real,
+  silence real,
+  used integer not null default 0
+) without rowid;
+'''
+
+
+def level(dbfs):
+    u"""Return the level, with silence as min_level, not -infinity."""
+    return max(min_level, dbfs)
+
+
+def silence_ratio(kept_length, full_length):
+    u"""Return the part of full_length we didn’t keep."""
+    if not full_length:
+        return 0.0
+    return max(0.0, min(1.0, 1.0 - float(kept_length) / full_length))
+
+
+def info_text(info):
+    u"""Return a short description of the AudioInfo, for people."""
+    parts = []
+    if info.duration is not None:
+        parts.append(u'{0:.2f} s'.format(info.duration))
+    if info.peak is not None:
+        parts.append(u'peak {0:.1f} dB'.format(info.peak))
+    if info.rms is not None:
+        parts.append(u'RMS {0:.1f} dB'.format(info.rms))
+    if info.silence is not None:
+        parts.append(u'{0:.0%} silence'.format(info.silence))
+    return u', '.join(parts)
+
+
+class AudioInfoIndex(object):
+    u"""Hash -> AudioInfo, for the files we have processed."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = None
+        self.pending = {}
+        # hex digest -> AudioInfo, not yet written
+
+    def connect(self):
+        u"""Open the index and prune it. Call with the lock held."""
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.executescript(schema)
+            if u'used' not in [
+                    row[1] for row
+                    in self.db.execute(u'pragma table_info(audio_info)')]:
+                # A file from before we pruned. Count its rows as used
+                # now.
+                self.db.execute(
+                    u'alter table audio_info add column used integer not '
+                    u'null default 0')
+                self.db.execute(u'update audio_info set used = ?',
+                                (int(time.time()),))
+            self.prune()
+        return self.db
+
+    def prune(self):
+        u"""Remove the AudioInfos not used for max_age."""
+        self.db.execute(u'delete from audio_info where used < ?',
+                        (int(time.time() - max_age),))
+        self.db.commit()
+
+    def lookup(self, hex_digest):
+        u"""Return the AudioInfo of the file with this hash, or None."""
+        with self.lock:
+            try:
+                return self.pending[hex_digest]
+            except KeyError:
+                pass
+            row = self.connect().execute(
+                u'select duration, peak, rms, silence from audio_info '
+                u'where hash = ?', (hex_digest,)).fetchone()
+            if row is None:
+                return None
+            info = AudioInfo(*row)
+            # Write it again, to keep it from being pruned.
+            self.add_pending(hex_digest, info)
+            return info
+
+    def record(self, hex_digest, info):
+        with self.lock:
+            self.add_pending(hex_digest, info)
+
+    def add_pending(self, hex_digest, info):
+        self.pending[hex_digest] = info
+        if len(self.pending) >= write_batch_size:
+            self.write_pending()
+
+    def flush(self):
+        u"""Write the new AudioInfos to disk."""
+        with self.lock:
+            self.write_pending()
+
+    def write_pending(self):
+        if not self.pending:
+            return
+        used = int(time.time())
+        db = self.connect()
+        db.executemany(
+            u'insert or replace into audio_info (hash, duration, peak, '
+            u'rms, silence, used) values (?, ?, ?, ?, ?, ?)',
+            [(hex_digest,) + tuple(info) + (used,)
+             for hex_digest, info in self.pending.items()])
+        db.commit()
+        self.pending = {}
+
+
+audio_infos = AudioInfoIndex(audio_info_db_path)
+# The one index.
+atexit.register(audio_infos.flush)
@@ -0,0 +1,255 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Fill missing audio for many notes at once.
+
+Go through the notes of a search (e.g. the current deck) or of the
+card browser selection and download audio for the empty audio fields,
+without asking the user about every file. The best download for each
+field is picked by a simple ranking: the order of the downloaders
+list, skipping files the downloaders themselves mark as bad and files
+that are too short, too long, too quiet or mostly silence.
+
+Every step is written to a journal (see journal.py), so that a run
+that was cancelled or crashed can be resumed.
+"""
+
+import hashlib
+import os
+import time
+
+from PyQt5.QtWidgets import QAction, QProgressDialog
+
+from aqt import mw
+from aqt.utils import askUser, getText, tooltip
+from anki.lang import _
+
+from . import blacklist
+from .audio_info import audio_infos
+from .download_entry import Action
+from .get_fields import get_note_fields
+from .journal import Journal
+from .language import language_code_from_note
+from .note_writer import NoteWriter
+from .scheduler import DownloadJob
+from .timing import Stage, span
+
+notes_in_flight = 8
+# Number of notes we download for at the same time. The requests for
+# these notes share the scheduler’s thread pool.
+min_duration = 0.2
+max_duration = 10.0
+# Seconds. Files outside this range are not picked automatically. Too
+# short is usually a broken file, too long an advertisement or a
+# whole sentence.
+min_peak = -40.0
+# dBFS, as downloaded. Quieter files are usually broken, too.
+max_silence = 0.9
+# Files that were more silence than this are not picked either.
+poll_interval = 0.02
+# Seconds between two looks at the running downloads.
+notes_per_write = 200
+# Write the new sound tags to the collection after this many notes,
+# and at the end. The collection isn’t saved in between, so that the
+# whole run can be undone.
+
+journal_path = os.path.join(
+    mw.pm.addonFolder(), 'downloadaudio', 'batch_journal.db')
+
+
+class FinishedJob(object):
+    u"""Stand-in for a DownloadJob with entries from the journal."""
+    done = True
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def results(self):
+        return self.entries
+
+    def cancel(self):
+        pass
+
+
+def acceptable(entry):
+    u"""Whether an entry may be picked without asking the user."""
+    if entry.action != Action.Add:
+        # The downloader or the processor thinks this is bad.
+        return False
+    if entry.duration is not None and \
+            not min_duration <= entry.duration <= max_duration:
+        return False
+    info = entry.audio_info
+    if info is not None:
+        if info.peak is not None and info.peak < min_peak:
+            return False
+        if info.silence is not None and info.silence > max_silence:
+            return False
+    return True
+
+
+def rank_entries(entries):
+    u"""
+    Set the actions for the entries of one note.
+
+    Pick the first acceptable entry for every audio field. As the
+    entries come in the order of the downloaders list, this is the
+    one from the preferred site. Delete the others.
+    """
+    filled_fields = set()
+    for entry in entries:
+        if entry.audio_field_name not in filled_fields \
+                and acceptable(entry):
+            entry.action = Action.Add
+            filled_fields.add(entry.audio_field_name)
+        else:
+            entry.action = Action.Delete
+
+
+def missing_field_data(note):
+    u"""Return the FieldDatas for the empty audio fields of the note."""
+    return [fd for fd in get_note_fields(note)
+            if not fd.empty and not note[fd.audio_field_name].strip()]
+
+
+def fill_missing_audio(note_ids, description):
+    u"""
+    Download audio for the empty audio fields of the notes.
+
+    Download for several notes at the same time, pick the best file
+    for each field and write the notes in a few bulk updates. We set
+    one checkpoint before the first note and don’t save the collection
+    ourselves, so the whole run can be undone. The notes are marked
+    done in the journal only at the end, after the last write. The
+    reviewer is reset once at the end, too.
+    """
+    journal = Journal(journal_path)
+    journal.collect_garbage()
+    old_run = journal.unfinished_run(description)
+    if old_run is not None and askUser(
+            _(u'An earlier run for “{0}” was not finished. Continue where '
+              u'it stopped?').format(description)):
+        journal.resume_run(old_run)
+    else:
+        journal.start_run(description)
+    done_ids = journal.done_note_ids()
+    note_ids = [nid for nid in note_ids if nid not in done_ids]
+    if not note_ids:
+        tooltip(_(u'Nothing to download.'))
+        journal.finish_run()
+        journal.close()
+        return
+    progress = QProgressDialog(
+        _(u'Downloading audio…'), _(u'Cancel'), 0, len(note_ids), mw)
+    progress.setWindowTitle(_(u'Anki – Download audio'))
+    progress.setMinimumDuration(0)
+    progress.setValue(0)
+    notes_done = 0
+    notes_changed = 0
+    start_time = time.time()
+    waiting_ids = list(note_ids)
+    running = []
+    # (note, job) pairs. We keep notes_in_flight of these going.
+    writer = NoteWriter(mw.col)
+    written = []
+    # (note id, entries) of the notes given to the writer. They are
+    # marked done in the journal at the end of the run.
+    mw.checkpoint(_(u'Fill missing audio'))
+
+    def write_notes():
+        with span(Stage.NoteFlush):
+            writer.write()
+
+    while (waiting_ids or running) and not progress.wasCanceled():
+        while waiting_ids and len(running) < notes_in_flight:
+            note = mw.col.getNote(waiting_ids.pop(0))
+            entries = journal.reattach(note.id)
+            if entries:
+                # Processed in an earlier run that didn’t finish.
+                job = FinishedJob(entries)
+            else:
+                journal.forget_note(note.id)
+                job = DownloadJob(
+                    missing_field_data(note), language_code_from_note(note),
+                    observer=journal.observer(note.id))
+                job.start()
+            running.append((note, job))
+        finished = [(note, job) for note, job in running if job.done]
+        if not finished:
+            mw.app.processEvents()
+            time.sleep(poll_interval)
+            continue
+        running = [item for item in running if item not in finished]
+        for note, job in finished:
+            entries = job.results()
+            rank_entries(entries)
+            for entry in entries:
+                entry.dispatch(note, writer)
+            if any(entry.action == Action.Add for entry in entries):
+                notes_changed += 1
+            written.append((note.id, entries))
+        if len(writer) >= notes_per_write:
+            write_notes()
+        notes_done += len(finished)
+        progress.setValue(notes_done)
+        rate = notes_done / max(time.time() - start_time, 1) * 60
+        progress.setLabelText(
+            _(u'Downloading audio…\n{0} notes per minute').format(int(rate)))
+    for note, job in running:
+        # Only after a cancel. Throw away what we already have.
+        job.cancel()
+        for entry in job.results():
+            entry.action = Action.Delete
+            entry.dispatch(None)
+        journal.forget_note(note.id)
+    write_notes()
+    journal.notes_done(written)
+    blacklist.flush()
+    audio_infos.flush()
+    cancelled = progress.wasCanceled()
+    progress.close()
+    if not cancelled:
+        journal.finish_run()
+    journal.close()
+    mw.reset()
+    tooltip(_(u'Added audio to {0} of {1} notes.').format(
+        notes_changed, notes_done))
+
+
+def fill_missing_for_search():
+    u"""Ask for a search and fill the missing audio of the notes found."""
+    search, ok = getText(
+        prompt=_(u'<h4>Fill missing audio</h4>Download audio for all '
+                 u'notes found with this search:'),
+        default=u'deck:current', title=_(u'Fill missing audio'))
+    if not ok or not search:
+        return
+    fill_missing_audio(mw.col.findNotes(search), search)
+
+
+def fill_missing_for_browser(browser):
+    u"""Fill the missing audio of the notes selected in the browser."""
+    note_ids = browser.selectedNotes()
+    if not note_ids:
+        tooltip(_(u'No notes selected.'))
+        return
+    selection_hash = hashlib.sha1(
+        u','.join(str(nid) for nid in sorted(note_ids)).encode('utf-8'))
+    fill_missing_audio(
+        note_ids, u'browser selection of {0} notes ({1})'.format(
+            len(note_ids), selection_hash.hexdigest()[:8]))
+    browser.model.reset()
+
+
+def setup_browser_menu(browser):
+    u"""Add the fill action to the browser’s edit menu."""
+    fill_action = QAction(_(u'Fill missing audio'), browser)
+    fill_action.triggered.connect(
+        lambda __=None, b=browser: fill_missing_for_browser(b))
+    browser.form.menuEdit.addSeparator()
+    browser.form.menuEdit.addAction(fill_action)
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Time the downloaders against the replay server.
+
+Run this outside of Anki, but with the Python packages of the Anki
+version the add-on is for (anki and aqt) importable, e.g. from an
+Anki source tree on the PYTHONPATH:
+
+    python3 downloadaudio/benchmarks/downloader_benchmark.py \\
+        --report report.json [--compare old_report.json]
+
+No live site is asked. Every request goes to replay_server.py, which
+answers from the fixtures in fixtures/. The fixtures that come with
+the add-on are made up, but built like the real pages.
+
+We measure
+
+* for each site, the time per call of download_files(), split into
+  the time waiting for the server and the rest, mostly parsing,
+* a batch fill of a few notes per language, with notes_in_flight
+  notes at a time like batch.py, with one request after the other
+  (serial) and with the scheduler’s thread pool (concurrent), in notes
+  per second,
+* the peak of the Python memory use in each mode, and the maximum
+  resident size of the process.
+
+The results go to a JSON report. With --compare, the numbers are
+compared with an older report, and changes for the worse by more than
+regression_threshold are listed. The exit status is 1 then.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows.
+    resource = None
+
+from replay_server import ReplayServer
+
+addon_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+regression_threshold = 0.1
+notes_in_flight = 8
+# As in batch.py. The jobs of these notes share the pool and the
+# per-site limits.
+# Report changes for the worse by more than 10 %.
+
+words = [
+    ('en', u'word'), ('de', u'Wort'), ('fr', u'mot'), ('es', u'palabra'),
+    ('it', u'parola'), ('sv', u'ord'), ('da', u'ord'), ('is', u'orð'),
+    ('ja', u'言葉[ことば]')]
+# One word per language. The fixtures have answers for these.
+
+
+def load_addon():
+    u"""
+    Import the add-on modules we need, and return them.
+
+    We make a package object for the add-on directory by hand, so that
+    the add-on’s __init__, which sets up the Anki menus, isn’t run.
+    """
+    package = types.ModuleType('downloadaudio')
+    package.__path__ = [addon_dir]
+    sys.modules['downloadaudio'] = package
+    modules = types.SimpleNamespace()
+    for name in ('scheduler', 'site_stats', 'audio_info', 'timing',
+                 'download_entry', 'field_data', 'processors', 'downloaders',
+                 'downloaders.connection_pool',
+                 'downloaders.icon_cache', 'downloaders.resilience',
+                 'downloaders.response_cache'):
+        setattr(modules, name.split('.')[-1],
+                importlib.import_module('downloadaudio.' + name))
+    return modules
+
+
+def set_up(addon, server, process):
+    u"""Send everything to the server and turn off what would interfere."""
+    addon.connection_pool.replay_address = server.address
+    addon.response_cache.use_cache = False
+    # Every request should reach the server.
+    addon.resilience.requests_per_second = 1000.0
+    addon.resilience.burst = 1000
+    # The server doesn’t mind.
+    addon.icon_cache.with_pyqt = False
+    # The icons are loaded in the background, and would only add noise.
+    temp_dir = tempfile.mkdtemp(prefix='anki_audio_benchmark_')
+    addon.site_stats.site_stats.path = os.path.join(temp_dir, 'site_stats.db')
+    addon.audio_info.audio_infos.path = os.path.join(
+        temp_dir, 'audio_info.db')
+    if not process:
+        addon.processors.processor_backend = None
+
+
+def reset_site_stats(addon):
+    u"""Start each mode without knowing the sites."""
+    stats = addon.site_stats.site_stats
+    with stats.lock:
+        stats.stats = {}
+        stats.changed = set()
+
+
+def field_data(addon, language, word):
+    if language == 'ja':
+        return addon.field_data.JapaneseFieldData(
+            u'Expression', u'Audio', word)
+    return addon.field_data.FieldData(u'Expression', u'Audio', word)
+
+
+def remove_files(entries):
+    for entry in entries:
+        try:
+            os.remove(entry.file_path)
+        except OSError:
+            pass
+
+
+def measure_sites(addon, rounds):
+    u"""
+    Call every site for every language it knows, rounds times.
+
+    Return a dict of dicts by site: calls, hits, and the mean seconds
+    per call for download_files, waiting and parsing.
+    """
+    timings = addon.timing.timings
+    stage = addon.timing.Stage
+    timings.clear()
+    hits = {}
+    for __ in range(rounds):
+        for language, word in words:
+            for prototype in addon.downloaders.load_downloaders():
+                if not prototype.can_answer(language):
+                    continue
+                entries = addon.scheduler.run_task(
+                    prototype, field_data(addon, language, word), language)
+                site = addon.scheduler.site_key(prototype)
+                hits[site] = hits.get(site, 0) + len(entries)
+                remove_files(entries)
+    totals = {}
+    for row in timings.summary():
+        totals.setdefault(row['site'], {})[row['stage']] = row
+    sites = {}
+    for site, stages in totals.items():
+        if stage.DownloadFiles not in stages:
+            continue
+        calls = stages[stage.DownloadFiles]['count']
+        total = stages[stage.DownloadFiles]['total']
+        waiting = sum(stages[name]['total'] for name in (
+            stage.GetData, stage.GetFile) if name in stages)
+        sites[site] = dict(
+            calls=calls, hits=hits.get(site, 0),
+            download_files=total / calls, waiting=waiting / calls,
+            parsing=max(0.0, total - waiting) / calls)
+    return sites
+
+
+def set_workers(addon, workers):
+    u"""Give the scheduler a new thread pool with that many threads."""
+    scheduler = addon.scheduler
+    with scheduler._executor_lock:
+        if scheduler._executor is not None:
+            scheduler._executor.shutdown(wait=True)
+        scheduler._executor = None
+        scheduler.max_workers = workers
+        scheduler.site_gate = scheduler.SiteGate()
+
+
+def batch_fill(addon, notes):
+    u"""
+    Download like batch.py does, one job per note, notes_in_flight
+    at a time. Return the number of entries.
+    """
+    entry_count = 0
+    waiting = list(range(notes))
+    running = []
+    while waiting or running:
+        while waiting and len(running) < notes_in_flight:
+            language, word = words[waiting.pop(0) % len(words)]
+            job = addon.scheduler.DownloadJob(
+                [field_data(addon, language, word)], language)
+            job.start()
+            running.append(job)
+        finished = [job for job in running if job.done]
+        if not finished:
+            time.sleep(0.005)
+            continue
+        for job in finished:
+            running.remove(job)
+            entries = job.results()
+            entry_count += len(entries)
+            remove_files(entries)
+    return entry_count
+
+
+def measure_mode(addon, workers, notes, memory):
+    u"""Time a batch fill with that many threads, then its memory use."""
+    set_workers(addon, workers)
+    reset_site_stats(addon)
+    start_time = time.time()
+    entry_count = batch_fill(addon, notes)
+    seconds = time.time() - start_time
+    result = dict(
+        workers=workers, notes=notes, entries=entry_count, seconds=seconds,
+        notes_per_second=notes / seconds)
+    if memory:
+        # A second run, as tracemalloc slows everything down.
+        reset_site_stats(addon)
+        tracemalloc.start()
+        batch_fill(addon, notes)
+        result['python_peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return result
+
+
+def max_rss_kb():
+    u"""The maximum resident set size of the process so far, in kB."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # Bytes there, kB on Linux.
+        max_rss /= 1024.0
+    return max_rss
+
+
+def compare_reports(old, new):
+    u"""Return a list of lines for the numbers that got worse."""
+    checks = []
+    # (name, old value, new value, higher is better)
+    for site, numbers in sorted(new['sites'].items()):
+        if site in old.get('sites', {}):
+            checks.append((site + ' parsing', old['sites'][site]['parsing'],
+                           numbers['parsing'], False))
+    for mode, numbers in sorted(new['modes'].items()):
+        old_numbers = old.get('modes', {}).get(mode)
+        if not old_numbers:
+            continue
+        checks.append((mode + ' notes/s', old_numbers['notes_per_second'],
+                       numbers['notes_per_second'], True))
+        if 'python_peak_kb' in numbers and 'python_peak_kb' in old_numbers:
+            checks.append((mode + ' memory', old_numbers['python_peak_kb'],
+                           numbers['python_peak_kb'], False))
+    lines = []
+    for name, old_value, new_value, higher_is_better in checks:
+        if not old_value:
+            continue
+        change = (new_value - old_value) / old_value
+        if higher_is_better:
+            change = -change
+        if change > regression_threshold:
+            lines.append(u'{0}: {1:.4g} → {2:.4g} ({3:+.0%} worse)'.format(
+                name, old_value, new_value, change))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=u'Time the downloaders against recorded answers.')
+    parser.add_argument('--report', default='downloader_benchmark.json')
+    parser.add_argument('--compare', metavar='OLD_REPORT')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--notes', type=int, default=2 * len(words))
+    parser.add_argument(
+        '--latency', type=float, default=0.05,
+        help=u'seconds the server waits before each answer in the batch '
+        u'fill')
+    parser.add_argument('--process', action='store_true',
+                        help=u'also process the audio files')
+    parser.add_argument('--no-memory', action='store_true')
+    arguments = parser.parse_args()
+
+    addon = load_addon()
+    workers = addon.scheduler.max_workers
+    server = ReplayServer()
+    server.start()
+    set_up(addon, server, arguments.process)
+    try:
+        # No latency here. We want to see the parse time.
+        server.latency = 0.0
+        sites = measure_sites(addon, arguments.rounds)
+        server.latency = arguments.latency
+        modes = dict(
+            serial=measure_mode(
+                addon, 1, arguments.notes, not arguments.no_memory),
+            concurrent=measure_mode(
+                addon, workers, arguments.notes, not arguments.no_memory))
+    finally:
+        server.stop()
+    report = dict(
+        created=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        python=platform.python_version(), platform=platform.platform(),
+        lxml=importlib.import_module(
+            'downloadaudio.downloaders.extract').with_lxml,
+        processing=arguments.process, latency=arguments.latency,
+        requests=server.request_count, missing=server.missing_count,
+        sites=sites, modes=modes, max_rss_kb=max_rss_kb())
+    with open(arguments.report, 'w') as report_file:
+        json.dump(report, report_file, indent=1, sort_keys=True)
+    for site, numbers in sorted(sites.items()):
+        print(u'{0:32} {1:3} calls {2:3} hits  {3:7.4f} s waiting  '
+              u'{4:7.4f} s parsing'.format(
+                  site, numbers['calls'], numbers['hits'],
+                  numbers['waiting'], numbers['parsing']))
+    for mode, numbers in sorted(modes.items()):
+        print(u'{0:10} {1:6.2f} notes/s  {2:4} files  {3}'.format(
+            mode, numbers['notes_per_second'], numbers['entries'],
+            u'{0:.0f} kB peak'.format(numbers['python_peak_kb'])
+            if 'python_peak_kb' in numbers else u''))
+    print(u'Report written to {0}'.format(arguments.report))
+    if arguments.compare:
+        with open(arguments.compare) as old_file:
+            regressions = compare_reports(json.load(old_file), report)
+        for line in regressions:
+            print(u'Worse: ' + line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Time what loading the add-on costs at the start of Anki.
+
+Run this outside of Anki, with the Python packages of the Anki version
+the add-on is for (anki, aqt and PyQt5) importable:
+
+    python3 downloadaudio/benchmarks/import_benchmark.py \\
+        [--addon-dir old/downloadaudio] [--addon-dir downloadaudio]
+
+Give --addon-dir once for each copy of the add-on to compare, e.g. a
+git worktree of an older version and this one. Without it, this copy
+is measured.
+
+Every run is a fresh Python process. It imports what Anki has
+imported by the time it loads add-ons, makes a stand-in for the main
+window, then imports the modules the add-on’s __init__ imports, and
+measures
+* the time that took, and the number of new modules,
+* whether the heavy libraries (pydub, BeautifulSoup, lxml) and the
+  downloader modules were among them,
+* the time of the first download’s loading of the downloaders and the
+  audio processor, which was part of the start before,
+* the add-on modules that took longest to import, at the start or
+  the first download, from python -X importtime.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+this_addon_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+startup_modules = ('conflanguage', 'download', 'model')
+# What the add-on’s __init__ imports.
+heavy_modules = ('pydub', 'bs4', 'lxml', 'numpy')
+top_count = 8
+# Number of slowest add-on modules to list.
+
+child_code = u'''
+import importlib, json, os, sys, time, types
+addon_dir = sys.argv[1]
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PyQt5.QtWidgets import QApplication, QMainWindow, QMenu
+app = QApplication.instance() or QApplication(sys.argv[:1])
+import aqt
+for name in ('aqt.qt', 'aqt.utils', 'aqt.addcards', 'aqt.browser',
+             'aqt.editcurrent', 'aqt.deckconf', 'aqt.forms', 'anki.hooks',
+             'anki.lang', 'anki.utils', 'anki.sound', 'anki.stdmodels',
+             'anki.template'):
+    # Anki has these by the time it loads add-ons.
+    importlib.import_module(name)
+
+
+class StandInProfile(object):
+    def addonFolder(self):
+        return os.path.dirname(addon_dir)
+
+
+main_window = QMainWindow()
+main_window.form = types.SimpleNamespace(menuEdit=QMenu(main_window))
+main_window.pm = StandInProfile()
+main_window.reviewer = types.SimpleNamespace(card=None, state=None)
+aqt.mw = main_window
+package = types.ModuleType('downloadaudio')
+package.__path__ = [addon_dir]
+sys.modules['downloadaudio'] = package
+module_count = len(sys.modules)
+start_time = time.perf_counter()
+for name in {startup_modules!r}:
+    importlib.import_module('downloadaudio.' + name)
+startup = time.perf_counter() - start_time
+result = dict(
+    startup=startup, modules=len(sys.modules) - module_count,
+    heavy=[name for name in {heavy_modules!r} if name in sys.modules],
+    downloader_modules=len([
+        name for name in sys.modules
+        if name.startswith('downloadaudio.downloaders.')]))
+start_time = time.perf_counter()
+downloaders = importlib.import_module('downloadaudio.downloaders')
+if hasattr(downloaders, 'load_downloaders'):
+    downloaders.load_downloaders()
+processors = importlib.import_module('downloadaudio.processors')
+if hasattr(processors, 'load_processor'):
+    processors.load_processor()
+result['first_download'] = time.perf_counter() - start_time
+print(json.dumps(result))
+'''.format(startup_modules=startup_modules, heavy_modules=heavy_modules)
+
+
+def parse_importtime(text):
+    u"""Return {module: self time in seconds} from -X importtime output."""
+    times = {}
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            times[fields[2].strip()] = int(fields[0]) / 1e6
+        except (IndexError, ValueError):
+            # The header line.
+            continue
+    return times
+
+
+def measure_once(addon_dir):
+    u"""Load the add-on in a new process. Return the result dict."""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', child_code,
+         os.path.abspath(addon_dir)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = process.stderr.decode('utf-8', 'replace')
+    if process.returncode != 0:
+        raise RuntimeError(u'Loading {0} failed:\n{1}'.format(
+            addon_dir, stderr))
+    result = json.loads(process.stdout.decode('utf-8').splitlines()[-1])
+    result['self_times'] = dict(
+        (name, seconds) for name, seconds in parse_importtime(stderr).items()
+        if name.startswith('downloadaudio'))
+    return result
+
+
+def measure(addon_dir, runs):
+    u"""Return the medians over runs processes, and the slowest modules."""
+    results = [measure_once(addon_dir) for __ in range(runs)]
+    summary = dict(
+        addon_dir=os.path.abspath(addon_dir), runs=runs,
+        startup=statistics.median(r['startup'] for r in results),
+        first_download=statistics.median(
+            r['first_download'] for r in results),
+        modules=results[-1]['modules'], heavy=results[-1]['heavy'],
+        downloader_modules=results[-1]['downloader_modules'])
+    self_times = {}
+    for result in results:
+        for name, seconds in result['self_times'].items():
+            self_times.setdefault(name, []).append(seconds)
+    summary['slowest'] = sorted(
+        ((name, statistics.median(times))
+         for name, times in self_times.items()),
+        key=lambda item: -item[1])[:top_count]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=u'Time the loading of the add-on at the start of Anki.')
+    parser.add_argument('--addon-dir', action='append', dest='addon_dirs')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--report', metavar='JSON_FILE')
+    arguments = parser.parse_args()
+    summaries = [measure(addon_dir, arguments.runs)
+                 for addon_dir in arguments.addon_dirs or [this_addon_dir]]
+    for summary in summaries:
+        print(summary['addon_dir'])
+        print(u'  start:          {0:7.1f} ms, {1} modules'.format(
+            summary['startup'] * 1000, summary['modules']))
+        print(u'  heavy at start: {0}, {1} downloader modules'.format(
+            u', '.join(summary['heavy']) or u'none',
+            summary['downloader_modules']))
+        print(u'  first download: {0:7.1f} ms more'.format(
+            summary['first_download'] * 1000))
+        for name, seconds in summary['slowest']:
+            print(u'    {0:45} {1:6.1f} ms'.format(name, seconds * 1000))
+    if arguments.report:
+        with open(arguments.report, 'w') as report_file:
+            json.dump(summaries, report_file, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
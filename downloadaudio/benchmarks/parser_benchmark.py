@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Compare the tag extraction with a full BeautifulSoup parse.
+
+Run this outside of Anki, with BeautifulSoup (and lxml, if you want to
+see that, too) installed:
+
+    python3 downloadaudio/benchmarks/parser_benchmark.py [page_dir]
+
+The pages used by default are made up here. They are not saved pages
+from the sites, but are built like them: a few hundred navigation
+links, long article text, and the audio tags each scraper looks for
+somewhere in the middle. To measure with real pages, save them as
+<site>.html (e.g. oald.html, duden.html) in page_dir.
+"""
+
+import os
+import re
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'downloaders'))
+
+import extract  # noqa: E402
+
+repeats = 5
+sound_class = re.compile(r'\bsound\b')
+
+queries = {
+    # site: (name, attrs, inside, limit), as used by the scrapers.
+    'wiktionary': (('a', 'source', 'button'), None, None, None),
+    'oald': (None, {'class': sound_class, 'data-src-mp3': True}, None, None),
+    'macmillan': (
+        None, {'class': sound_class, 'data-src-mp3': True}, None, None),
+    'duden': ('a', {'target': '_blank', 'title': True}, None, None),
+    'collins': (
+        'a', {'class': 'hwd_sound sound audio_play_button'}, None, 1),
+    'den_danske_ordbog': (
+        'a', {'href': True}, ('div', {'class': 'searchResultBox'}), None),
+}
+
+audio_html = {
+    'wiktionary': (
+        u'<audio><source src="//upload.wikimedia.org/wikipedia/commons/'
+        u'a/ab/De-Wort.ogg"></audio><a href="//upload.wikimedia.org/'
+        u'wikipedia/commons/a/ab/De-Wort.ogg">Wort</a><button '
+        u'onclick=\'play({{"videoUrl":"//upload.wikimedia.org/a/ab/'
+        u'Fr-mot.ogg"}})\'>▶</button>'),
+    'oald': (
+        u'<div class="sound audio_play_button pron-uk" title="word '
+        u'pronunciation British" data-src-mp3="http://example.com/uk.mp3">'
+        u'</div><div class="sound audio_play_button pron-us" title="word '
+        u'pronunciation American" data-src-mp3="http://example.com/us.mp3">'
+        u'</div>'),
+    'macmillan': (
+        u'<img class="sound audio_play_button" alt="word" '
+        u'data-src-mp3="http://example.com/word.mp3" src="/speaker.png">'),
+    'duden': (
+        u'<a target="_blank" title="Als mp3 abspielen © Dudenverlag" '
+        u'href="http://www.duden.de/_media_/audio/Wort.mp3">Wort</a>'),
+    'collins': (
+        u'<a class="hwd_sound sound audio_play_button" '
+        u'data-src-mp3="/sounds/word.mp3">▶</a>'),
+    'den_danske_ordbog': (
+        u'<div class="searchResultBox"><div><a href="http://ordnet.dk/ddo/'
+        u'ordbog?query=ord">ord</a></div><div><a href="http://ordnet.dk/'
+        u'ddo/ordbog?query=ord&amp;select=2">ord 2</a></div></div>'),
+}
+
+
+def make_page(site):
+    u"""Return a made-up page of about 80 kB for site."""
+    parts = [u'<!DOCTYPE html><html><head><title>word</title>']
+    parts += [u'<link rel="stylesheet" href="/css/{0}.css">'.format(n)
+              for n in range(20)]
+    parts.append(u'<link rel="icon" href="/favicon.png"></head><body>')
+    parts.append(u'<ul class="nav">')
+    parts += [u'<li><a href="/wiki/Page_{0}" title="Page {0}">Page {0}'
+              u'</a></li>'.format(n) for n in range(300)]
+    parts.append(u'</ul><div id="content">')
+    for n in range(400):
+        if n == 150:
+            parts.append(audio_html[site])
+        parts.append(
+            u'<p class="text">Some <b>text</b> about the word, with '
+            u'<a href="/wiki/Other_{0}">a link</a> and <span class="x">'
+            u'more &amp; more</span> text in it.</p>'.format(n))
+    parts.append(u'</div><div id="footer">')
+    parts += [u'<a href="/about/{0}">About {0}</a>'.format(n)
+              for n in range(100)]
+    parts.append(u'</div></body></html>')
+    return u''.join(parts).encode('utf-8')
+
+
+def soup_find(data, name, attrs, inside, limit):
+    u"""What the scrapers used to do."""
+    page_soup = BeautifulSoup(data, 'html.parser')
+    if inside:
+        page_soup = page_soup.find(inside[0], inside[1])
+        if page_soup is None:
+            return []
+    return page_soup.find_all(
+        name if name is None or isinstance(name, str) else list(name),
+        attrs=attrs or {}, limit=limit)
+
+
+def key_value(tag):
+    u"""The attribute the scrapers use, to compare the results."""
+    for key in ('data-src-mp3', 'href', 'src', 'onclick'):
+        if tag.get(key):
+            return tag.get(key)
+    return None
+
+
+def time_it(function):
+    return min(timeit.repeat(function, number=1, repeat=repeats))
+
+
+def compare(site, data):
+    name, attrs, inside, limit = queries[site]
+    expected = [key_value(tag) for tag in soup_find(
+        data, name, attrs, inside, limit)]
+    soup_time = time_it(lambda: soup_find(data, name, attrs, inside, limit))
+    line = u'{0:18} {1:4.0f} kB  soup {2:7.4f} s'.format(
+        site, len(data) / 1024.0, soup_time)
+    extract.use_lxml = False
+    found = [key_value(tag) for tag in extract.find_all(
+        data, name, attrs, inside, limit)]
+    scan_time = time_it(
+        lambda: extract.find_all(data, name, attrs, inside, limit))
+    line += u'  scanner {0:7.4f} s {1:5.1f}× {2}'.format(
+        scan_time, soup_time / scan_time,
+        u'same' if found == expected else u'DIFFERENT')
+    if extract.with_lxml:
+        extract.use_lxml = True
+        found = [key_value(tag) for tag in extract.find_all(
+            data, name, attrs, inside, limit)]
+        lxml_time = time_it(
+            lambda: extract.find_all(data, name, attrs, inside, limit))
+        line += u'  lxml {0:7.4f} s {1:5.1f}× {2}'.format(
+            lxml_time, soup_time / lxml_time,
+            u'same' if found == expected else u'DIFFERENT')
+    print(line)
+
+
+if __name__ == '__main__':
+    page_dir = sys.argv[1] if len(sys.argv) > 1 else None
+    if page_dir:
+        print(u'Pages saved in {0}'.format(page_dir))
+    else:
+        print(u'Made-up pages, not saved from the sites')
+    for site in sorted(queries):
+        if page_dir:
+            try:
+                with open(os.path.join(page_dir, site + '.html'), 'rb') \
+                        as page_file:
+                    page_data = page_file.read()
+            except IOError:
+                continue
+        else:
+            page_data = make_page(site)
+        compare(site, page_data)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+A local stand-in for the dictionary sites.
+
+The server answers from recorded fixtures instead of the live sites.
+Point the downloaders at it with
+
+    downloaders.connection_pool.replay_address = server.address
+
+and every request goes to the server, with the real host name in the
+Host header. Each directory in fixtures/ holds a responses.json for
+one site: a list of responses, each with
+
+* url: scheme, host and path of the request, without the query,
+* query (optional): parameters the request must have,
+* prefix (optional): true when url only has to be the start of the
+  path,
+* status (optional, default 200) and content_type,
+* file: the body, relative to the directory, or audio: true for a
+  short tone made up on the fly.
+
+The first response that matches is used. Anything else gets a 404.
+
+To record new fixtures, run the server on its own with --record DIR.
+It then passes requests it has no fixture for on to the real site,
+and saves the answers in DIR/<host>/.
+
+    python3 downloadaudio/benchmarks/replay_server.py --record new
+"""
+
+import argparse
+import http.server
+import io
+import json
+import math
+import os
+import socketserver
+import struct
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import wave
+
+fixture_dir = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+tone_length = 0.4
+# Seconds.
+tone_rate = 22050
+
+
+def make_tone():
+    u"""Return a short 440 Hz tone as WAV data."""
+    frames = b''.join(
+        struct.pack('<h', int(8000 * math.sin(2 * math.pi * 440 * n
+                                              / tone_rate)))
+        for n in range(int(tone_length * tone_rate)))
+    wav_file = io.BytesIO()
+    wav_writer = wave.open(wav_file, 'wb')
+    wav_writer.setnchannels(1)
+    wav_writer.setsampwidth(2)
+    wav_writer.setframerate(tone_rate)
+    wav_writer.writeframes(frames)
+    wav_writer.close()
+    return wav_file.getvalue()
+
+
+class Response(object):
+    u"""One recorded response."""
+    def __init__(self, directory, info):
+        split_url = urllib.parse.urlsplit(info['url'])
+        self.host = split_url.netloc.lower()
+        self.path = split_url.path or '/'
+        self.query = info.get('query', {})
+        self.prefix = info.get('prefix', False)
+        self.status = info.get('status', 200)
+        self.content_type = info.get('content_type', 'text/html')
+        self.file_path = None
+        self.audio = info.get('audio', False)
+        if self.audio:
+            self.content_type = info.get('content_type', 'audio/wav')
+        else:
+            self.file_path = os.path.join(directory, info['file'])
+        self.body = None
+
+    def matches(self, host, path, query):
+        if host != self.host:
+            return False
+        if self.prefix:
+            if not path.startswith(self.path):
+                return False
+        elif path != self.path:
+            return False
+        return all(query.get(key) == [value]
+                   for key, value in self.query.items())
+
+    def data(self, tone):
+        if self.audio:
+            return tone
+        if self.body is None:
+            with open(self.file_path, 'rb') as body_file:
+                self.body = body_file.read()
+        return self.body
+
+
+def load_fixtures(directory=fixture_dir):
+    u"""Return the Responses of all sites, in the order of the files."""
+    responses = []
+    for site in sorted(os.listdir(directory)):
+        site_dir = os.path.join(directory, site)
+        try:
+            with open(os.path.join(site_dir, 'responses.json')) as json_file:
+                infos = json.load(json_file)
+        except IOError:
+            continue
+        responses += [Response(site_dir, info) for info in infos]
+    return responses
+
+
+class ReplayHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Keep-alive, like the sites.
+    disable_nagle_algorithm = True
+    # Or every answer waits 40 ms for the delayed ACK.
+
+    def do_GET(self):
+        self.answer()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self.answer()
+
+    def answer(self):
+        server = self.server
+        host = (self.headers.get('Host') or '').lower()
+        split_path = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(split_path.query)
+        with server.lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+        for response in server.responses:
+            if response.matches(host, split_path.path, query):
+                self.send(response.status, response.content_type,
+                          response.data(server.tone))
+                return
+        if server.record_dir:
+            self.record(host)
+            return
+        with server.lock:
+            server.missing_count += 1
+        self.send(404, 'text/plain', b'No fixture')
+
+    def record(self, host):
+        u"""Get the answer from the real site and keep it."""
+        url = 'http://{0}{1}'.format(host, self.path)
+        try:
+            real_response = urllib.request.urlopen(url, timeout=30)
+            status = real_response.code
+            content_type = real_response.headers.get(
+                'Content-Type', 'text/html')
+            data = real_response.read()
+        except urllib.error.HTTPError as error:
+            self.send(error.code, 'text/plain', b'')
+            return
+        except (IOError, ValueError):
+            self.send(502, 'text/plain', b'')
+            return
+        self.server.save(url, status, content_type, data)
+        self.send(status, content_type, data)
+
+    def send(self, status, content_type, data):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class ReplayServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    u"""
+    Serve the fixtures on localhost.
+
+    latency is added to every answer, in seconds, to look a bit more
+    like the real sites.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, directory=fixture_dir,
+                 record_dir=None):
+        http.server.HTTPServer.__init__(
+            self, ('127.0.0.1', port), ReplayHandler)
+        self.latency = latency
+        self.responses = load_fixtures(directory)
+        self.record_dir = record_dir
+        self.tone = make_tone()
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.missing_count = 0
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server_address[:2]
+
+    def start(self):
+        u"""Serve in a background thread."""
+        self.thread = threading.Thread(
+            target=self.serve_forever, name='replay server')
+        self.thread.daemon = True
+        self.thread.start()
+        return self.address
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def save(self, url, status, content_type, data):
+        u"""Add a recorded answer to the record_dir."""
+        split_url = urllib.parse.urlsplit(url)
+        site_dir = os.path.join(self.record_dir, split_url.netloc)
+        with self.lock:
+            try:
+                os.makedirs(site_dir)
+            except OSError:
+                pass
+            json_path = os.path.join(site_dir, 'responses.json')
+            try:
+                with open(json_path) as json_file:
+                    infos = json.load(json_file)
+            except IOError:
+                infos = []
+            info = dict(
+                url=urllib.parse.urlunsplit(split_url[:3] + ('', '')),
+                status=status, content_type=content_type,
+                file='response_{0}'.format(len(infos)))
+            query = dict(urllib.parse.parse_qsl(split_url.query))
+            if query:
+                info['query'] = query
+            with open(os.path.join(site_dir, info['file']), 'wb') \
+                    as body_file:
+                body_file.write(data)
+            infos.append(info)
+            with open(json_path, 'w') as json_file:
+                json.dump(infos, json_file, indent=1, ensure_ascii=False)
+            self.responses.append(Response(site_dir, info))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=u'Answer like the dictionary sites.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--record', metavar='DIR')
+    arguments = parser.parse_args()
+    replay_server = ReplayServer(
+        arguments.port, arguments.latency, record_dir=arguments.record)
+    print(u'Serving {0} responses on {1}:{2}'.format(
+        len(replay_server.responses), *replay_server.address))
+    try:
+        replay_server.serve_forever()
+    except KeyboardInterrupt:
+        replay_server.server_close()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Compare the NumPy silence trimming with the pydub one.
+
+Run this outside of Anki, with pydub and numpy installed:
+
+    python3 downloadaudio/benchmarks/trim_benchmark.py
+
+The clips are made up here: tone bursts with silence and a bit of
+noise around them, one as short as a single word, one as long as a
+sentence.
+
+Before timing, we check that both find exactly the same loud ranges,
+on random clips of 8 and 16 bit, mono and stereo audio.
+"""
+
+from array import array
+import importlib
+import os
+import random
+import sys
+import timeit
+import types
+
+from pydub import AudioSegment
+from pydub.generators import Sine, WhiteNoise
+from pydub.silence import detect_nonsilent
+
+addon_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+repeats = 5
+random_clips = 20
+# Random clips to check per sample width and channel count.
+
+
+def load_processor_modules():
+    u"""
+    Import the audio processor and the NumPy trimming, and return them.
+
+    They are part of the add-on package. We make a package object for
+    the add-on directory by hand, so that the add-on’s __init__, which
+    sets up the Anki menus, isn’t run.
+    """
+    package = types.ModuleType('downloadaudio')
+    package.__path__ = [addon_dir]
+    sys.modules['downloadaudio'] = package
+    return (
+        importlib.import_module('downloadaudio.processors.audio_processor'),
+        importlib.import_module('downloadaudio.processors.numpy_trim'))
+
+
+audio_processor, numpy_trim = load_processor_modules()
+
+
+def make_clip(words, lead_in=400, lead_out=600):
+    u"""Return a clip with words tone bursts and silence around them."""
+    clip = AudioSegment.silent(duration=lead_in, frame_rate=44100)
+    for n in range(words):
+        clip += Sine(220 + 40 * (n % 7)).to_audio_segment(
+            duration=350, volume=-6)
+        clip += AudioSegment.silent(duration=90, frame_rate=44100)
+    clip += AudioSegment.silent(duration=lead_out, frame_rate=44100)
+    noise = WhiteNoise().to_audio_segment(duration=len(clip), volume=-55)
+    return clip.overlay(noise).set_channels(2).normalize()
+
+
+def random_clip(rng, sample_width, channels):
+    u"""
+    Return a short clip of random loud and quiet stretches.
+
+    The quiet stretches have some just around the threshold, so that
+    a difference in the rounding would show.
+    """
+    frame_rate = rng.choice([8000, 22050, 44100])
+    max_amplitude = 2 ** (8 * sample_width - 1) - 1
+    threshold = 10 ** (audio_processor.silence_threshold / 20.0) \
+        * max_amplitude
+    samples = []
+    for __ in range(rng.randint(1, 6)):
+        level = rng.choice(
+            [0, threshold * 0.5, threshold, threshold * 1.5, max_amplitude])
+        frames = rng.randint(0, frame_rate // 2)
+        samples += [
+            int(max(-max_amplitude, min(max_amplitude, rng.gauss(0, level))))
+            for __ in range(frames * channels)]
+    sample_type = {1: 'b', 2: 'h'}[sample_width]
+    data = array(sample_type, samples).tobytes()
+    return AudioSegment(
+        data=data, sample_width=sample_width, frame_rate=frame_rate,
+        channels=channels)
+
+
+def check_ranges():
+    u"""Check that NumPy finds the same loud ranges as pydub."""
+    rng = random.Random(1)
+    for sample_width in (1, 2):
+        for channels in (1, 2):
+            for __ in range(random_clips):
+                clip = random_clip(rng, sample_width, channels)
+                pydub_ranges = detect_nonsilent(
+                    clip,
+                    min_silence_len=audio_processor.minimum_silence_length,
+                    silence_thresh=audio_processor.silence_threshold)
+                numpy_ranges = numpy_trim.loud_ranges(
+                    clip, audio_processor.silence_threshold,
+                    audio_processor.minimum_silence_length)
+                if pydub_ranges != numpy_ranges:
+                    raise AssertionError(
+                        u'{0} bit, {1} channel(s), {2} ms: pydub {3}, '
+                        u'NumPy {4}'.format(
+                            8 * sample_width, channels, len(clip),
+                            pydub_ranges, numpy_ranges))
+    print(u'Same loud ranges on {0} random clips.'.format(4 * random_clips))
+
+
+def compare(name, clip):
+    processor = audio_processor.AudioProcessor()
+    pydub_result = processor.trim_pydub(clip)
+    numpy_result = numpy_trim.trim(
+        clip, audio_processor.silence_threshold,
+        audio_processor.minimum_silence_length,
+        audio_processor.silence_fade_length,
+        audio_processor.rapid_fade_length)
+    pydub_time = min(timeit.repeat(
+        lambda: processor.trim_pydub(clip), number=1, repeat=repeats))
+    numpy_time = min(timeit.repeat(
+        lambda: numpy_trim.trim(
+            clip, audio_processor.silence_threshold,
+            audio_processor.minimum_silence_length,
+            audio_processor.silence_fade_length,
+            audio_processor.rapid_fade_length),
+        number=1, repeat=repeats))
+    print(u'{0}: {1:.1f} s clip, trimmed to {2} ms (pydub) and {3} ms '
+          u'(NumPy)'.format(
+              name, len(clip) / 1000.0, len(pydub_result), len(numpy_result)))
+    print(u'  pydub {0:8.4f} s   NumPy {1:8.4f} s   speedup {2:6.1f}×'.format(
+        pydub_time, numpy_time, pydub_time / numpy_time))
+
+
+if __name__ == '__main__':
+    check_ranges()
+    compare(u'short', make_clip(1))
+    compare(u'long', make_clip(60))
@@ -8,10 +8,22 @@
 
 '''
 Maintain a blacklist of undesired files.
+
+The hashes are kept in an SQLite file and, while Anki runs, in one
+set per list, so that a look-up doesn’t depend on the number of
+hashes. New hashes are written in batches. There can be several
+named lists. A downloader checks the lists it names, so that sites
+that send the same “sorry, not available” files can share one.
+
+The hashes in blacklist.json, which comes with the add-on, go into
+the default list the first time.
 '''
 
+import atexit
 import hashlib
 import os
+import sqlite3
+import threading
 
 # As in the main Anki code.
 try:
@@ -19,48 +31,143 @@ try:
 except ImportError:
     import json
 
+default_list = u'default'
+write_batch_size = 20
+# Write new hashes to disk after this many, or when flush() is called.
+chunk_size = 64 * 1024
+# Bytes we hash at a time.
 
-from aqt import mw
-
-blacklist_hashes = None
 bl_file_path = os.path.join(
-    mw.pm.addonFolder(), 'downloadaudio', 'blacklist.json')
+    os.path.dirname(os.path.abspath(__file__)), 'blacklist.json')
+bl_db_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'blacklist.db')
+
+schema = u'''
+create table if not exists hashes (
+  list text not null,
+  hash text not null,
+  primary key (list, hash)
+) without rowid;
+'''
 
 
-def get_hash(file_name):
+def file_sha256(file_name):
+    u"""Return the SHA-256 hash object of the file, read in chunks."""
+    file_sha = hashlib.sha256()
+    with open(file_name, 'rb') as hash_file:
+        for chunk in iter(lambda: hash_file.read(chunk_size), b''):
+            file_sha.update(chunk)
+    return file_sha
+
+
+class Blacklist(object):
+    u"""The blacklisted hashes, in memory and on disk."""
+    def __init__(self, db_path, seed_path):
+        self.db_path = db_path
+        self.seed_path = seed_path
+        self.lock = threading.Lock()
+        self.lists = None
+        # list name -> set of hex digests
+        self.pending = []
+        # (list name, hex digest) not yet written
+
+    def load(self):
+        u"""Read the hashes from disk. Call with the lock held."""
+        if self.lists is not None:
+            return
+        db = sqlite3.connect(self.db_path)
+        try:
+            db.executescript(schema)
+            if 0 == db.execute(u'pragma user_version').fetchone()[0]:
+                self.import_seed(db)
+            lists = {}
+            for list_name, hash_ in db.execute(
+                    u'select list, hash from hashes'):
+                lists.setdefault(list_name, set()).add(hash_)
+        finally:
+            db.close()
+        self.lists = lists
+
+    def import_seed(self, db):
+        u"""Copy the hashes from the old JSON list into the database."""
+        try:
+            with open(self.seed_path, 'r') as seed_file:
+                seed_hashes = json.load(seed_file)
+        except (IOError, OSError, ValueError):
+            seed_hashes = []
+        db.executemany(
+            u'insert or ignore into hashes (list, hash) values (?, ?)',
+            [(default_list, hash_) for hash_ in seed_hashes])
+        db.execute(u'pragma user_version = 1')
+        db.commit()
+
+    def contains(self, hex_digest, list_names=None):
+        u"""Whether the hash is in one of the lists."""
+        if list_names is None:
+            list_names = (default_list,)
+        with self.lock:
+            self.load()
+            return any(
+                hex_digest in self.lists.get(list_name, ())
+                for list_name in list_names)
+
+    def add(self, hex_digest, list_name=default_list):
+        with self.lock:
+            self.load()
+            self.lists.setdefault(list_name, set()).add(hex_digest)
+            self.pending.append((list_name, hex_digest))
+            if len(self.pending) >= write_batch_size:
+                self.write_pending()
+
+    def flush(self):
+        u"""Write the new hashes to disk."""
+        with self.lock:
+            self.write_pending()
+
+    def write_pending(self):
+        if not self.pending:
+            return
+        db = sqlite3.connect(self.db_path)
+        try:
+            db.executescript(schema)
+            db.executemany(
+                u'insert or ignore into hashes (list, hash) values (?, ?)',
+                self.pending)
+            db.commit()
+        finally:
+            db.close()
+        self.pending = []
+
+
+blacklist = Blacklist(bl_db_path, bl_file_path)
+atexit.register(blacklist.flush)
+
+
+def get_hash(file_name, list_names=None):
     """
     Return hash of the file.
 
     Return hash of the file file_name.  The more important function is
     that this throws a ValueError when the hash of the file is already
-    in the list.
+    in one of the lists list_names (by default, the default list).
     """
-    if not blacklist_hashes:
-        load_hashes()
-    retrieved_hash = hashlib.sha256(file(file_name, 'rb').read())
-    if retrieved_hash.hexdigest() in blacklist_hashes:
-        raise ValueError(
-            'Retrieved file is in blacklist. (No pronunciation found.)')
+    retrieved_hash = file_sha256(file_name)
+    check_hash(retrieved_hash, list_names)
     return retrieved_hash
 
 
-def add_black_hash(black_hash):
-    """Add a new hash to the list of blacklisted hashes."""
-    global blacklist_hashes
-    if not blacklist_hashes:
-        load_hashes()
-    blacklist_hashes.append(black_hash.hexdigest())
-    save_hashes()
+def check_hash(retrieved_hash, list_names=None):
+    u"""Raise a ValueError when the hash object is blacklisted."""
+    if blacklist.contains(retrieved_hash.hexdigest(), list_names):
+        raise ValueError(
+            'Retrieved file is in blacklist. (No pronunciation found.)')
 
 
-def load_hashes():
-    """Load the blacklist from disk."""
-    global blacklist_hashes
-    blacklist_hashes = json.load(open(bl_file_path, 'r'))
+def add_black_hash(black_hash, list_name=default_list):
+    """Add a new hash to the list of blacklisted hashes."""
+    blacklist.add(black_hash.hexdigest(), list_name)
 
 
-def save_hashes():
-    """Save the blacklist back to disk."""
-    blacklist_file = open(bl_file_path, 'w')
-    json.dump(blacklist_hashes, blacklist_file, indent=1)
-    blacklist_file.close()
+def flush():
+    u"""Write new hashes to disk."""
+    blacklist.flush()
@@ -15,8 +15,8 @@ from aqt.qt import QGridLayout, QLabel, QLineEdit
 from aqt.utils import getText, tooltip
 from anki.lang import _
 
-from .language import default_audio_language_code, fl_code_code, \
-    old_al_code_code
+from .language import default_audio_language_code, deck_languages, \
+    fl_code_code, old_al_code_code
 
 
 def setup_ui(self, Dialog):
@@ -54,6 +54,11 @@ def save_conf(self):
     self.conf[fl_code_code] = self.form.audio_download_language.text()
 
 
+def forget_deck_languages(*args):
+    u"""Read the deck languages again after the options were saved."""
+    deck_languages.clear()
+
+
 def ask_and_set_language_code():
     u"""Ask the user for the language code."""
     lang_code, ok = getText(
@@ -81,6 +86,7 @@ of the language you are learning.<br>
             conf[fl_code_code] = lang_code
             mw.col.decks.save(conf)
     mw.col.decks.flush()
+    deck_languages.clear()
 
 
 def rename_language_code():
@@ -102,6 +108,7 @@ def rename_language_code():
             old_code_found = True
     if old_code_found:
         mw.col.decks.flush()
+        deck_languages.clear()
     return old_code_found
 
 
@@ -123,3 +130,4 @@ addHook("profileLoaded", maybe_ask_language)
 dconf.Ui_Dialog.setupUi = wrap(dconf.Ui_Dialog.setupUi, setup_ui)
 DeckConf.loadConf = wrap(DeckConf.loadConf, load_conf)
 DeckConf.saveConf = wrap(DeckConf.saveConf, save_conf, 'before')
+DeckConf.saveConf = wrap(DeckConf.saveConf, forget_deck_languages)
@@ -0,0 +1,191 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Don’t put the same audio file into the media folder twice.
+
+The same word in two decks, or two kanji spellings with the same
+reading, often get the very same file. Remember the hash of every
+file we put into the media folder. When an identical file comes in,
+use the name of the one we already have.
+
+merge_duplicate_media() looks for copies that are already in the
+media folder and changes the notes to use one file of each set.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+
+from aqt import mw
+from aqt.utils import askUser, showInfo, tooltip
+from anki.lang import _
+
+from .blacklist import file_sha256
+
+audio_extensions = (
+    '.flac', '.mp3', '.ogg', '.oga', '.opus', '.spx', '.wav', '.m4a')
+# The files merge_duplicate_media() looks at.
+
+media_hash_db_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'media_hashes.db')
+
+schema = u'''
+create table if not exists media_files (
+  media_dir text not null,
+  hash text not null,
+  name text not null,
+  size integer not null,
+  primary key (media_dir, hash)
+);
+'''
+
+
+class MediaHashIndex(object):
+    u"""Hash -> media file name, for the files we have written."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = None
+
+    def connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.executescript(schema)
+        return self.db
+
+    def lookup(self, media_dir, hex_digest):
+        u"""
+        Return the name of the media file with this hash, or None.
+
+        The file must still be there and still have the hash.
+        """
+        with self.lock:
+            row = self.connect().execute(
+                u'select name, size from media_files where media_dir = ? '
+                u'and hash = ?', (media_dir, hex_digest)).fetchone()
+        if row is None:
+            return None
+        name, size = row
+        media_path = os.path.join(media_dir, name)
+        try:
+            if os.path.getsize(media_path) != size or \
+                    file_sha256(media_path).hexdigest() != hex_digest:
+                return None
+        except (IOError, OSError):
+            return None
+        return name
+
+    def record(self, media_dir, hex_digest, name, size):
+        self.record_many(media_dir, [(hex_digest, name, size)])
+
+    def record_many(self, media_dir, files):
+        u"""Remember (hash, name, size) tuples."""
+        with self.lock:
+            db = self.connect()
+            db.executemany(
+                u'insert or replace into media_files (media_dir, hash, '
+                u'name, size) values (?, ?, ?, ?)',
+                [(media_dir,) + tuple(item) for item in files])
+            db.commit()
+
+
+media_hashes = MediaHashIndex(media_hash_db_path)
+# The one index.
+
+
+def find_duplicates(media_dir):
+    u"""
+    Return lists of names of identical audio files.
+
+    The first name of each list is the one we keep: the shortest,
+    which is usually the one without a _1, _2 &c.
+    """
+    by_size = {}
+    for name in os.listdir(media_dir):
+        if not name.lower().endswith(audio_extensions):
+            continue
+        try:
+            size = os.path.getsize(os.path.join(media_dir, name))
+        except OSError:
+            continue
+        by_size.setdefault(size, []).append(name)
+    groups = []
+    # Only files of the same size can be the same, so we only hash
+    # those.
+    for size, names in by_size.items():
+        if len(names) < 2:
+            continue
+        by_hash = {}
+        for name in names:
+            try:
+                hex_digest = file_sha256(
+                    os.path.join(media_dir, name)).hexdigest()
+            except (IOError, OSError):
+                continue
+            by_hash.setdefault(hex_digest, []).append(name)
+        for hex_digest, same_names in by_hash.items():
+            if len(same_names) > 1:
+                same_names.sort(key=lambda name: (len(name), name))
+                groups.append((hex_digest, size, same_names))
+    return groups
+
+
+def replace_in_notes(renames):
+    u"""Change [sound:old] to [sound:new] in all notes. Return count."""
+    sound_re = re.compile(
+        r'\[sound:(' + u'|'.join(re.escape(name) for name in renames)
+        + r')\]')
+    changed = 0
+    nids = [nid for nid, flds in mw.col.db.execute(
+        u"select id, flds from notes where flds like '%[sound:%'")
+        if sound_re.search(flds)]
+    for nid in nids:
+        note = mw.col.getNote(nid)
+        for field_name, value in note.items():
+            note[field_name] = sound_re.sub(
+                lambda match: u'[sound:' + renames[match.group(1)] + u']',
+                value)
+        note.flush()
+        changed += 1
+    return changed
+
+
+def merge_duplicate_media():
+    u"""Make the notes use one file of each set of identical files."""
+    media_dir = mw.col.media.dir()
+    mw.progress.start(immediate=True)
+    try:
+        groups = find_duplicates(media_dir)
+    finally:
+        mw.progress.finish()
+    if not groups:
+        tooltip(_(u'No duplicate audio files found.'))
+        return
+    renames = {}
+    for __, __, names in groups:
+        for name in names[1:]:
+            renames[name] = names[0]
+    if not askUser(_(
+            u'Found {0} audio files that are copies of other files. '
+            u'Change the notes to use only one file of each set?').format(
+                len(renames))):
+        return
+    mw.checkpoint(_(u'Merge duplicate audio'))
+    mw.progress.start(immediate=True)
+    try:
+        changed = replace_in_notes(renames)
+    finally:
+        mw.progress.finish()
+    media_hashes.record_many(
+        media_dir, [(hex_digest, names[0], size)
+                    for hex_digest, size, names in groups])
+    mw.reset()
+    showInfo(_(
+        u'Changed {0} notes. The {1} copies are not used any more. Use '
+        u'Tools → Check Media to delete them.').format(changed, len(renames)))
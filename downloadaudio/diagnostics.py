@@ -0,0 +1,164 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+"""
+Show what the downloads are doing.
+
+A dialog with the state of the sites: circuit breakers and rate
+limits, connection reuse, the hit rates by site and language, and how
+long each stage of the downloads took. The times can be saved as JSON
+or CSV.
+"""
+
+from PyQt5.QtGui import QIcon
+from PyQt5.QtWidgets import QDialog, QDialogButtonBox, QFileDialog, \
+    QTextBrowser, QVBoxLayout
+
+from aqt import mw
+from aqt.utils import showWarning, tooltip
+from anki.lang import _
+
+from .downloaders.connection_pool import connection_stats
+from .downloaders.resilience import diagnostics as host_diagnostics
+from .site_stats import site_stats
+from .timing import timings
+
+
+def html_table(head, rows):
+    u"""Return a simple HTML table."""
+    cells = [u'<tr>' + u''.join(
+        u'<th align="left">{0}</th>'.format(cell) for cell in head)
+             + u'</tr>']
+    for row in rows:
+        cells.append(u'<tr>' + u''.join(
+            u'<td>{0}</td>'.format(cell) for cell in row) + u'</tr>')
+    return u'<table cellspacing="0" cellpadding="3">' + u''.join(cells) \
+        + u'</table>'
+
+
+def hosts_html():
+    hosts = host_diagnostics()
+    if not hosts:
+        return _(u'<p>No requests yet.</p>')
+    return html_table(
+        [_(u'Host'), _(u'State'), _(u'Failures in a row'),
+         _(u'Failures'), _(u'Retries'), _(u'Refused'), _(u'Next try'),
+         _(u'Waited for rate limit')],
+        [[host, info['state'], info['failures'], info['total_failures'],
+          info['retries'], info['short_circuited'],
+          u'{0:.0f} s'.format(info['reopens_in']) if info['reopens_in']
+          else u'', u'{0:.1f} s'.format(info['waited'])]
+         for host, info in sorted(hosts.items())])
+
+
+def connections_html():
+    hosts = connection_stats()
+    if not hosts:
+        return _(u'<p>No connections yet.</p>')
+    return html_table(
+        [_(u'Host'), _(u'Requests'), _(u'New connections'),
+         _(u'Reused'), _(u'Reuse ratio')],
+        [[host, info['requests'], info['new_connections'],
+          info['reused_connections'],
+          u'{0:.0%}'.format(info['reuse_ratio'])]
+         for host, info in sorted(hosts.items())])
+
+
+def sites_html():
+    sites = site_stats.as_dict()
+    if not sites:
+        return _(u'<p>No downloads yet.</p>')
+    return html_table(
+        [_(u'Site and language'), _(u'Requests'), _(u'Hits'),
+         _(u'Failed'), _(u'Hit rate'), _(u'Mean time')],
+        [[site, info['requests'], info['hits'], info['errors'],
+          u'{0:.0%}'.format(info['hit_rate']),
+          u'{0:.2f} s'.format(info['latency'])]
+         for site, info in sorted(sites.items())])
+
+
+def seconds_text(seconds):
+    if seconds is None:
+        return u''
+    if seconds < 1:
+        return u'{0:.0f} ms'.format(seconds * 1000)
+    return u'{0:.2f} s'.format(seconds)
+
+
+def timings_html():
+    rows = timings.summary()
+    if not rows:
+        return _(u'<p>Nothing measured yet.</p>')
+    return html_table(
+        [_(u'Stage'), _(u'Site'), _(u'Count'), _(u'p50'), _(u'p95'),
+         _(u'Max')],
+        [[row['stage'], row['site'] or u'', row['count'],
+          seconds_text(row['p50']), seconds_text(row['p95']),
+          seconds_text(row['maximum'])] for row in rows])
+
+
+def diagnostics_html():
+    u"""Return the whole text of the dialog."""
+    return u''.join([
+        _(u'<h4>Hosts</h4>'), hosts_html(),
+        _(u'<h4>Connections</h4>'), connections_html(),
+        _(u'<h4>Sites</h4>'), sites_html(),
+        _(u'<h4>Times</h4>'), timings_html()])
+
+
+class DiagnosticsDialog(QDialog):
+    """A dialog that shows the state of the downloads."""
+    def __init__(self, parent=None):
+        QDialog.__init__(self, parent)
+        self.text_browser = None
+        self.initUI()
+
+    def initUI(self):
+        u"""Build the dialog box."""
+        self.setWindowTitle(_(u'Anki – Download diagnostics'))
+        self.setWindowIcon(QIcon(":/icons/anki.png"))
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+        self.text_browser = QTextBrowser(self)
+        layout.addWidget(self.text_browser)
+        dialog_buttons = QDialogButtonBox(self)
+        dialog_buttons.addButton(QDialogButtonBox.Close)
+        refresh_button = dialog_buttons.addButton(
+            _(u'Refresh'), QDialogButtonBox.ActionRole)
+        refresh_button.clicked.connect(self.refresh)
+        export_button = dialog_buttons.addButton(
+            _(u'Save times…'), QDialogButtonBox.ActionRole)
+        export_button.clicked.connect(self.export_timings)
+        dialog_buttons.rejected.connect(self.reject)
+        layout.addWidget(dialog_buttons)
+        self.resize(640, 480)
+        self.refresh()
+
+    def refresh(self):
+        self.text_browser.setHtml(diagnostics_html())
+
+    def export_timings(self):
+        u"""Save the times as JSON or CSV, depending on the name."""
+        path, __ = QFileDialog.getSaveFileName(
+            self, _(u'Save times'), u'download_times.json',
+            _(u'JSON (*.json);;CSV (*.csv)'))
+        if not path:
+            return
+        try:
+            if path.lower().endswith('.csv'):
+                timings.export_csv(path)
+            else:
+                timings.export_json(path)
+        except (IOError, OSError) as error:
+            showWarning(str(error))
+            return
+        tooltip(_(u'Saved.'))
+
+
+def show_diagnostics():
+    u"""Show the diagnostics dialog."""
+    DiagnosticsDialog(mw).exec_()
@@ -32,6 +32,10 @@ manual.
    potentially ahead of time.
  * Manual works like current note, but shows a list of candidate
    strings that can be modified before the requests are sent.
+
+At the start of Anki we only set up the menus and the editor button.
+The rest, downloaders, parsers and audio processing, is imported at
+the first download.
 """
 
 import os
@@ -43,13 +47,8 @@ from aqt import mw
 from aqt.utils import tooltip
 from anki.hooks import addHook
 
-from .downloaders import downloaders
-from .download_entry import DownloadEntry, Action
-from .get_fields import get_note_fields, get_side_fields
-from .language import language_code_from_card, language_code_from_editor
-from .processors import processor
-from .review_gui import review_entries
-from .update_gui import update_data
+from .prefetch import prefetch_enabled, prefetcher, set_prefetch_enabled
+from .timing import Stage, span, timed
 
 DOWNLOAD_NOTE_SHORTCUT = "q"
 DOWNLOAD_SIDE_SHORTCUT = "t"
@@ -59,53 +58,48 @@ icons_dir = os.path.join(mw.pm.addonFolder(), 'downloadaudio', 'icons')
 # Place were we keep our megaphone icon.
 
 
-def do_download(note, field_data_list, language, hide_text=False):
+@timed(Stage.Download)
+def do_download(note, field_data_list, language, hide_text=False, job=None):
     """
     Download audio data.
 
-    Go through the list of words and list of sites and download each
-    word from each site. Then call a function that asks the user what
-    to do.
+    Download each word from each site, all at the same time, and
+    show the dialog that asks the user what to do right away. The
+    files show up there as they arrive. When job is given, it is an
+    already started DownloadJob for the fields, e.g. from the
+    prefetcher.
     """
-    retrieved_entries = []
-    for field_data in field_data_list:
-        if field_data.empty:
-            continue
-        for dloader in downloaders:
-            # Use a public variable to set the language.
-            dloader.language = language
-            try:
-                # Make it easer inside the downloader. If anything
-                # goes wrong, don't catch, or raise whatever you want.
-                dloader.download_files(field_data)
-            except:
-                #  # Uncomment this raise while testing a new
-                #  # downloaders.  Also use the “For testing”
-                #  # downloaders list with your downloader in
-                #  # downloaders.__init__
-                # raise
-                continue
-            retrieved_entries += dloader.downloads_list
-    # Significantly changed the logic. Put all entries in one
-    # list, do stuff with that list of DownloadEntries.
-    for entry in retrieved_entries:
-        # Do the processing before the reviewing now.
-        entry.process()
+    from . import blacklist
+    from .audio_info import audio_infos
+    from .download_entry import Action
+    from .review_gui import review_entries
+    from .scheduler import DownloadJob
+    if job is None:
+        job = DownloadJob(field_data_list, language)
+        job.start()
     try:
-        retrieved_entries = review_entries(note, retrieved_entries, hide_text)
+        with span(Stage.ReviewDialog):
+            review_entries(note, job, hide_text)
         # Now just the dialog, which sets the fields in the entries
     except ValueError as ve:
         tooltip(str(ve))
+        for entry in job.results():
+            entry.action = Action.Delete
     except RuntimeError as rte:
         if 'cancel' in str(rte):
-            for entry in retrieved_entries:
+            for entry in job.results():
                 entry.action = Action.Delete
         else:
             raise
+    # The job is cancelled by now, so this is the final list.
+    retrieved_entries = job.results()
     for entry in retrieved_entries:
         entry.dispatch(note)
+    blacklist.flush()
+    audio_infos.flush()
     if any(entry.action == Action.Add for entry in retrieved_entries):
-        note.flush()
+        with span(Stage.NoteFlush):
+            note.flush()
         # We have to do different things here, for download during
         # review, we should reload the card and replay. When we are in
         # the add dialog, we do a field update there.
@@ -130,13 +124,16 @@ def download_for_side():
     Download audio for all audio fields on the currently visible card
     side.
     """
+    from .get_fields import get_side_fields
+    from .language import language_code_from_card
     card = mw.reviewer.card
     if not card:
         return
     note = card.note()
     field_data = get_side_fields(card, note)
     do_download(
-        note, field_data, language_code_from_card(card), hide_text=True)
+        note, field_data, language_code_from_card(card), hide_text=True,
+        job=prefetcher.take(card, field_data))
 
 
 def download_for_note(ask_user=False, note=None, editor=None):
@@ -147,6 +144,9 @@ def download_for_note(ask_user=False, note=None, editor=None):
     note. When ask_user is true, show a dialog that lets the user
     modify these texts.
     """
+    from .get_fields import get_note_fields
+    from .language import language_code_from_card, language_code_from_editor
+    from .update_gui import update_data
     if not note:
         try:
             card = mw.reviewer.card
@@ -181,6 +181,30 @@ def download_manual():
     download_for_note(ask_user=True)
 
 
+def fill_missing_for_search():
+    u"""Fill the missing audio of the notes of a search."""
+    from . import batch
+    batch.fill_missing_for_search()
+
+
+def setup_browser_menu(browser):
+    u"""Add our action to the browser’s edit menu."""
+    from . import batch
+    batch.setup_browser_menu(browser)
+
+
+def merge_duplicate_media():
+    u"""Make the notes use one file of each set of identical files."""
+    from . import dedup
+    dedup.merge_duplicate_media()
+
+
+def show_diagnostics():
+    u"""Show what we know about the sites and downloads."""
+    from . import diagnostics
+    diagnostics.show_diagnostics()
+
+
 def download_off():
     u"""Deactivate the download menus."""
     mw.note_download_action.setEnabled(False)
@@ -255,9 +279,45 @@ mw.manual_download_action.setShortcut(DOWNLOAD_MANUAL_SHORTCUT)
 mw.manual_download_action.triggered.connect(download_manual)
 
 
+mw.fill_missing_download_action = QAction(mw)
+mw.fill_missing_download_action.setText(u"Fill missing audio…")
+mw.fill_missing_download_action.setIcon(
+    QIcon(os.path.join(icons_dir, 'download_note_audio.png')))
+mw.fill_missing_download_action.setToolTip(
+    "Download audio for the empty audio fields of many notes.")
+mw.fill_missing_download_action.triggered.connect(fill_missing_for_search)
+
+
+mw.merge_duplicates_action = QAction(mw)
+mw.merge_duplicates_action.setText(u"Merge duplicate audio…")
+mw.merge_duplicates_action.setToolTip(
+    "Make the notes use one file of each set of identical audio files.")
+mw.merge_duplicates_action.triggered.connect(merge_duplicate_media)
+
+
+mw.prefetch_download_action = QAction(mw)
+mw.prefetch_download_action.setText(u"Prefetch audio while reviewing")
+mw.prefetch_download_action.setToolTip(
+    "Download audio for the next cards in the background.")
+mw.prefetch_download_action.setCheckable(True)
+mw.prefetch_download_action.setChecked(prefetch_enabled)
+mw.prefetch_download_action.toggled.connect(set_prefetch_enabled)
+
+
+mw.download_diagnostics_action = QAction(mw)
+mw.download_diagnostics_action.setText(u"Download diagnostics…")
+mw.download_diagnostics_action.setToolTip(
+    "Show the state of the download sites.")
+mw.download_diagnostics_action.triggered.connect(show_diagnostics)
+
+
 mw.edit_media_submenu.addAction(mw.note_download_action)
 mw.edit_media_submenu.addAction(mw.side_download_action)
 mw.edit_media_submenu.addAction(mw.manual_download_action)
+mw.edit_media_submenu.addAction(mw.fill_missing_download_action)
+mw.edit_media_submenu.addAction(mw.merge_duplicates_action)
+mw.edit_media_submenu.addAction(mw.prefetch_download_action)
+mw.edit_media_submenu.addAction(mw.download_diagnostics_action)
 
 # Todo: switch off at start and on when we get to reviewing.
 # # And start with the acitons off.
@@ -265,3 +325,4 @@ mw.edit_media_submenu.addAction(mw.manual_download_action)
 
 
 addHook("setupEditorButtons", editor_add_download_editing_button)
+addHook('browser.setupMenus', setup_browser_menu)
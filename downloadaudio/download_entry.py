@@ -8,14 +8,12 @@
 
 import os
 
+from .audio_info import audio_infos
 from .blacklist import add_black_hash
-from .processors import processor
+from .processors import load_processor
+from .processors.processing_pool import pool as processing_pool
 from .mediafile_utils import unmunge_to_mediafile
-
-if processor:
-    import pydub
-    # See processors/__init__.py. We try the import there. If we have
-    # a processor, this import should work.
+from .timing import Stage, timings
 
 class DownloadEntry(object):
     u"""Data about a single file downloaded by a downloader"""
@@ -34,6 +32,21 @@ class DownloadEntry(object):
         self.icon = icon
         # The downloader’s favicon
         self.action = Action.Add
+        self.duration = None
+        # Length in seconds, after processing. Set by the processor.
+        self.audio_info = None
+        # AudioInfo: duration, levels and silence. Set by the processor.
+        self.content_hash = None
+        # Hex SHA-256 of the processed file.
+        self.processing_time = None
+        # Seconds the processor took for this file.
+        self.site = None
+        self.url = None
+        # Which downloader got the file, and from where. Set by the
+        # scheduler.
+        self.task_index = None
+        # The position of the field and site in the job’s configured
+        # order. Set by the scheduler.
 
     @property
     def display_word(self):
@@ -58,29 +71,62 @@ class DownloadEntry(object):
         (i.e. normalize, remove silence, convert to preferred format)
         and update self.
         """
-        if processor:
-            try:
-                new_fp, new_sffx = processor.process(self)
-            except pydub.exceptions.CouldntDecodeError:
-                self.action = Action.Delete
-            else:
-                self.file_path = new_fp
-                self.file_extension = new_sffx
-
-    def dispatch(self, note):
+        self.finish_processing(self.start_processing())
+
+    def start_processing(self, background=False):
+        u"""Send the file to the processing pool, return the future.
+
+        Return None when we have no processor. Files of background
+        jobs get the pool’s background share.
+        """
+        if not load_processor():
+            return None
+        return processing_pool.submit(
+            self.file_path, self.file_extension, background)
+
+    def finish_processing(self, future):
+        u"""Wait for the processing pool and update self.
+
+        A concurrent.futures.CancelledError flies through here when
+        the processing has been cancelled.
+        """
+        if future is None:
+            return
+        processor = load_processor()
+        try:
+            new_fp, new_sffx, self.audio_info, self.content_hash, \
+                self.processing_time = future.result()
+        except processor.decode_errors:
+            self.action = Action.Delete
+        else:
+            self.file_path = new_fp
+            self.file_extension = new_sffx
+            self.duration = self.audio_info.duration
+            audio_infos.record(self.content_hash, self.audio_info)
+            # The processing ran in another process, so we measure
+            # there and count here.
+            timings.add(Stage.Process, self.site, self.processing_time)
+
+    def dispatch(self, note, writer=None):
         u"""Do what should be done with the downloaded file
 
         Depending on self.action, do that action.
 
         * That is, move the file do the media folder if we want it
           on the note or just want to keep it.
-        * Add it to the note if that’s what we want.
+        * Add it to the note if that’s what we want. With a
+          NoteWriter, the sound tag goes there instead of into the
+          Note object.
         * Delete it if we want just delete or blacklist it.
         * Blacklist the hash if that’s what we want."""
         if self.action == Action.Add or self.action == Action.Keep:
             media_fn = unmunge_to_mediafile(self)
             if self.action == Action.Add:
-                note[self.audio_field_name] += '[sound:' + media_fn + ']'
+                sound_tag = '[sound:' + media_fn + ']'
+                if writer is not None:
+                    writer.append(note.id, self.audio_field_name, sound_tag)
+                else:
+                    note[self.audio_field_name] += sound_tag
         if self.action == Action.Delete or self.action == Action.Blacklist:
             os.remove(self.file_path)
         if self.action == Action.Blacklist:
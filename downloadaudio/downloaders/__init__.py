@@ -11,58 +11,64 @@ They are intended for use with the Anki2 audiodownload add-on, but can
 possibly be used alone. For each downloader in the list, setting its
 language variable and then calling download_files(text, base, ruby,
 split) downloads audio files to temp files and fills its
-downloads_list with the file names.
+downloads_list with the file names. When more than one download runs
+at the same time, do that on a copy from request_copy(language).
 
 When PyQt4 is installed, this downolads the site icon (favicon) for
 each site first.
-"""
 
-from .beolingus import BeolingusDownloader
-from .collins_french import CollinsFrenchDownloader
-from .collins_german import CollinsGermanDownloader
-from .collins_italian import CollinsItalianDownloader
-from .collins_spanish import CollinsSpanishDownloader
-from .den_danske_ordbog import DenDanskeOrdbogDownloader
-from .duden import DudenDownloader
-from .howjsay import HowJSayDownloader
-from .islex import IslexDownloader
-from .japanesepod import JapanesepodDownloader
-from .leo import LeoDownloader
-from .lexin import LexinDownloader
-from .macmillan_american import MacmillanAmericanDownloader
-from .macmillan_british import MacmillanBritishDownloader
-from .mw import MerriamWebsterDownloader
-from .oald import OaldDownloader
-from .wiktionary import WiktionaryDownloader
+The downloader modules are only imported by load_downloaders(), so
+that they, and the libraries they use, don’t slow down the start of
+Anki.
+"""
 
+import importlib
+import threading
 
-downloaders = [
-    JapanesepodDownloader(),
-    WiktionaryDownloader(),
-    LeoDownloader(),
-    LexinDownloader(),
-    MerriamWebsterDownloader(),
-    # MacmillanAmericanDownloader(),
-    MacmillanBritishDownloader(),
-    OaldDownloader(),
-    DudenDownloader(),
-    DenDanskeOrdbogDownloader(),
-    HowJSayDownloader(),
-    IslexDownloader(),
-    CollinsFrenchDownloader(),
-    CollinsGermanDownloader(),
-    CollinsItalianDownloader(),
-    CollinsSpanishDownloader(),
-    BeolingusDownloader(),
+downloader_names = [
+    'japanesepod.JapanesepodDownloader',
+    'wiktionary.WiktionaryDownloader',
+    'leo.LeoDownloader',
+    'lexin.LexinDownloader',
+    'mw.MerriamWebsterDownloader',
+    # 'macmillan_american.MacmillanAmericanDownloader',
+    'macmillan_british.MacmillanBritishDownloader',
+    'oald.OaldDownloader',
+    'duden.DudenDownloader',
+    'den_danske_ordbog.DenDanskeOrdbogDownloader',
+    'howjsay.HowJSayDownloader',
+    'islex.IslexDownloader',
+    'collins_french.CollinsFrenchDownloader',
+    'collins_german.CollinsGermanDownloader',
+    'collins_italian.CollinsItalianDownloader',
+    'collins_spanish.CollinsSpanishDownloader',
+    'beolingus.BeolingusDownloader',
 ]
 # For each word field, these downloader sites are tried in the order
 # they appear here. Lines starting with a “#” are not tried. Change
 # the order, or which lines get the “#”, to taste
 
 
-# # For testing. See also the “Uncomment this …” bit in ..download
-# downloaders = [
-#     DictNNDownloader(),
+# # For testing. See also the “Uncomment this …” bit in ..scheduler
+# downloader_names = [
+#     'dict_nn.DictNNDownloader',
 # ]
 
-__all__ = ['downloaders']
+downloaders = []
+# The downloader objects, in the order of downloader_names. Filled by
+# load_downloaders(), at the first download.
+_load_lock = threading.Lock()
+
+
+def load_downloaders():
+    u"""Import the downloaders the first time, return the list of them."""
+    with _load_lock:
+        if not downloaders:
+            for name in downloader_names:
+                module_name, class_name = name.rsplit('.', 1)
+                module = importlib.import_module('.' + module_name, __name__)
+                downloaders.append(getattr(module, class_name)())
+        return downloaders
+
+
+__all__ = ['downloaders', 'load_downloaders']
@@ -37,6 +37,7 @@ class BeolingusDownloader(AudioDownloader):
         # Mapping of languages to "services".
         # We can get pronunciations for the keys in this
         # dictionary.
+        self.languages = tuple(self.services_dict)
         self.service = None
 
     def download_files(self, field_data):
@@ -55,8 +56,8 @@ class BeolingusDownloader(AudioDownloader):
         if not field_data.word:
             return
         word = field_data.word
-        word_soup = self.get_soup_from_url(self.build_word_url(word))
-        href_list = [a['href'] for a in word_soup.findAll('a')]
+        href_list = [a['href'] for a in self.get_tags_from_url(
+            self.build_word_url(word), 'a', {'href': True})]
         href_list = uniqify_list(href_list)
         href_list = [href for href in href_list
                      if self.speak_code + self.language in href]
@@ -100,9 +101,9 @@ class BeolingusDownloader(AudioDownloader):
         word_encoded = urllib.parse.quote(word.encode('utf-8'))
         popup_url = re.sub(';text=.*$', ';text=' + word_encoded, popup_url)
         popup_url = urllib.parse.urljoin(self.site_url, popup_url)
-        popup_soup = self.get_soup_from_url(popup_url)
         # The audio link should be the only link.
-        href_list = [a['href'] for a in popup_soup.findAll('a')]
+        href_list = [a['href'] for a in self.get_tags_from_url(
+            popup_url, 'a', {'href': True})]
         href_list = [href for href in href_list if "speak" in href]
         href_list = [href for href in href_list
                      if href.endswith(self.file_extension)]
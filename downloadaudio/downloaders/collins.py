@@ -52,13 +52,13 @@ class CollinsDownloader(AudioDownloader):
         if not field_data.word:
             return
         lword = field_data.word.lower()
-        # Do our parsing with BeautifulSoup
-        word_soup = self.get_soup_from_url(
-            self.url + urllib.parse.quote(lword.encode('utf-8')))
-        html_tag_with_audio_url = word_soup.find(
-            name='a', attrs={'class': 'hwd_sound sound audio_play_button'})
-        if not html_tag_with_audio_url:
+        # We only want the first sound button.
+        audio_tags = self.get_tags_from_url(
+            self.url + urllib.parse.quote(lword.encode('utf-8')), 'a',
+            {'class': 'hwd_sound sound audio_play_button'}, limit=1)
+        if not audio_tags:
             return
+        html_tag_with_audio_url = audio_tags[0]
         audio_url = self.base_url + html_tag_with_audio_url['data-src-mp3']
         self.maybe_get_icon()
         word_path = self.get_tempfile_from_url(audio_url)
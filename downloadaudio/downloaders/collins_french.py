@@ -21,6 +21,7 @@ class CollinsFrenchDownloader(CollinsDownloader):
         self.url \
             = 'http://www.collinsdictionary.com/dictionary/french-english/'
         self.lang = 'fr'
+        self.languages = (self.lang,)
         self.lang_code = u'/fr_/'
         self.icon_url = self.url
         self.extras = dict(Source="Collins French")
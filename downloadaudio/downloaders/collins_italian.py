@@ -21,6 +21,7 @@ class CollinsItalianDownloader(CollinsDownloader):
         self.url \
             = 'http://www.collinsdictionary.com/dictionary/italian-english/'
         self.lang = 'it'
+        self.languages = (self.lang,)
         self.lang_code = u'/it_/'
         self.icon_url = self.url
         self.extras = dict(Source="Collins Italian")
@@ -21,6 +21,7 @@ class CollinsSpanishDownloader(CollinsDownloader):
         self.url \
             = 'http://www.collinsdictionary.com/dictionary/spanish-english/'
         self.lang = 'es'
+        self.languages = (self.lang,)
         self.lang_code = u'/es_/'
         self.icon_url = self.url
         self.extras = dict(Source="Collins Spanish")
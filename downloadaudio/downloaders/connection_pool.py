@@ -0,0 +1,294 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Keep-alive HTTP connections shared by all downloaders.
+
+Multi-step sites (Merriam-Webster, BeoLingus, Islex, …) load two or
+three URLs from the same host per word. Keep the connections open and
+reuse them, rather than doing a new TCP (and TLS) handshake for every
+request the way urllib.request.urlopen() does.
+
+Note that this does not use the proxy settings from the environment
+the way urllib does.
+'''
+
+import http.client
+import threading
+import urllib.error
+import urllib.parse
+import zlib
+
+default_timeout = 15
+# Seconds we wait for a connection or for data before giving up.
+max_idle_per_host = 4
+# Number of idle connections we keep open for each host.
+max_redirects = 5
+replay_address = None
+# (host, port) of a local replay server, see
+# benchmarks/replay_server.py. When set, every request goes there over
+# plain HTTP, with the real host name in the Host header.
+
+redirect_codes = (301, 302, 303, 307, 308)
+connection_errors = (
+    http.client.RemoteDisconnected, http.client.BadStatusLine,
+    ConnectionResetError, BrokenPipeError)
+# What we get when the server has closed an idle connection.
+
+
+class ConnectionStats(object):
+    u"""Count how often we could reuse a connection to a host."""
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    @property
+    def reuse_ratio(self):
+        if not self.requests:
+            return 0.0
+        return float(self.reused_connections) / self.requests
+
+    def as_dict(self):
+        return dict(
+            requests=self.requests, new_connections=self.new_connections,
+            reused_connections=self.reused_connections,
+            reuse_ratio=self.reuse_ratio)
+
+
+class PoolResponse(object):
+    u"""
+    A response read from a pooled connection.
+
+    This looks enough like what urlopen() returns for our use: code,
+    msg, headers, url and read(). The content is decoded when the site
+    sent it gzip- or deflate-compressed. When the response has been
+    read completely, the connection goes back to the pool.
+    """
+    def __init__(self, pool, key, connection, response, url):
+        self.pool = pool
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.url = url
+        self.code = response.status
+        self.status = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+        self.decoder = None
+        encoding = response.getheader('Content-Encoding', '').lower()
+        if encoding in ('gzip', 'x-gzip'):
+            self.decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self.decoder = DeflateDecoder()
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def read(self, amt=None):
+        u"""Read and decode (part of) the body."""
+        if self.connection is None:
+            return b''
+        if amt is None:
+            data = self.response.read()
+        else:
+            data = self.response.read(amt)
+        finished = amt is None or not data or self.response.isclosed()
+        if self.decoder is not None:
+            data = self.decoder.decompress(data)
+            if finished:
+                data += self.decoder.flush()
+        if finished:
+            self.release()
+        return data
+
+    def release(self):
+        u"""Give the connection back, or close it if we can’t reuse it."""
+        if self.connection is None:
+            return
+        if self.response.isclosed() and not self.response.will_close:
+            self.pool.put_connection(self.key, self.connection)
+        else:
+            self.connection.close()
+        self.connection = None
+
+    def close(self):
+        u"""Stop reading. Don’t reuse a half-read connection."""
+        if self.connection is None:
+            return
+        if not self.response.isclosed():
+            self.response.close()
+            self.connection.close()
+            self.connection = None
+            return
+        self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class DeflateDecoder(object):
+    u"""
+    Decode “deflate” content.
+
+    Some servers send raw deflate data, some the zlib format the RFC
+    asks for. Try zlib first, and switch to raw when that fails.
+    """
+    def __init__(self):
+        self.first_try = True
+        self.data = b''
+        self.decoder = zlib.decompressobj()
+
+    def decompress(self, data):
+        if not self.first_try:
+            return self.decoder.decompress(data)
+        self.data += data
+        try:
+            decompressed = self.decoder.decompress(self.data)
+        except zlib.error:
+            self.first_try = False
+            self.decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self.decoder.decompress(self.data)
+        if decompressed:
+            self.first_try = False
+            self.data = b''
+        return decompressed
+
+    def flush(self):
+        return self.decoder.flush()
+
+
+class ConnectionPool(object):
+    u"""Keep idle HTTP(S) connections, by scheme, host and port."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        # (scheme, host, port) -> list of idle connections
+        self.stats = {}
+        # host -> ConnectionStats
+
+    def get_connection(self, key, timeout):
+        u"""Return an idle connection, or a new one, and whether reused."""
+        scheme, host, port = key
+        with self.lock:
+            host_stats = self.stats.setdefault(host, ConnectionStats())
+            host_stats.requests += 1
+            try:
+                connection = self.idle[key].pop()
+            except (KeyError, IndexError):
+                host_stats.new_connections += 1
+            else:
+                host_stats.reused_connections += 1
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+        if scheme == 'https':
+            return http.client.HTTPSConnection(
+                host, port, timeout=timeout), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def put_connection(self, key, connection):
+        u"""Keep a connection for later reuse."""
+        with self.lock:
+            idle_list = self.idle.setdefault(key, [])
+            if len(idle_list) < max_idle_per_host:
+                idle_list.append(connection)
+                return
+        connection.close()
+
+    def request(self, url, data=None, headers=None, timeout=None):
+        u"""
+        Send a request and return a PoolResponse.
+
+        Send a GET, or a POST when data is given. Redirects are
+        followed. Error codes raise an urllib.error.HTTPError, just
+        like urlopen() does.
+        """
+        if timeout is None:
+            timeout = default_timeout
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', 'gzip, deflate')
+        for __ in range(max_redirects + 1):
+            response = self.request_once(url, data, headers, timeout)
+            if response.code not in redirect_codes:
+                break
+            location = response.getheader('Location')
+            response.read()
+            if not location:
+                break
+            url = urllib.parse.urljoin(url, location)
+            if response.code == 303 or \
+                    (data is not None and response.code in (301, 302)):
+                data = None
+                headers.pop('Content-Type', None)
+        if response.code >= 400:
+            response.read()
+            raise urllib.error.HTTPError(
+                url, response.code, response.msg, response.headers, None)
+        return response
+
+    def request_once(self, url, data, headers, timeout):
+        u"""Send one request, retrying once on a stale connection."""
+        split_url = urllib.parse.urlsplit(url)
+        scheme = split_url.scheme.lower() or 'http'
+        if scheme not in ('http', 'https'):
+            raise ValueError('Can’t load {0} URLs'.format(scheme))
+        port = split_url.port
+        if port is None:
+            port = 443 if scheme == 'https' else 80
+        key = (scheme, split_url.hostname, port)
+        if replay_address is not None:
+            key = ('http',) + tuple(replay_address)
+            headers = dict(headers, Host=split_url.netloc)
+        path = split_url.path or '/'
+        if split_url.query:
+            path += '?' + split_url.query
+        method = 'GET' if data is None else 'POST'
+        while True:
+            connection, reused = self.get_connection(key, timeout)
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+            except connection_errors:
+                connection.close()
+                if reused:
+                    # The server closed it while it was idle. Try
+                    # again with another one.
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            return PoolResponse(self, key, connection, response, url)
+
+    def connection_stats(self):
+        u"""Return the reuse statistics, as a dict of dicts by host."""
+        with self.lock:
+            return dict(
+                (host, stats.as_dict()) for host, stats in self.stats.items())
+
+    def close_all(self):
+        u"""Close all idle connections."""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+pool = ConnectionPool()
+# The one pool used by all downloaders.
+
+
+def connection_stats():
+    u"""Return the reuse statistics of the shared pool."""
+    return pool.connection_stats()
@@ -14,7 +14,7 @@ Download pronunciations for Danish from Den Danske Ordbog
 
 import urllib.request, urllib.parse, urllib.error
 from urllib.error import HTTPError
-from html.parser import HTMLParser
+from . import extract
 from .downloader import AudioDownloader
 from ..download_entry import DownloadEntry
 
@@ -24,6 +24,7 @@ class DenDanskeOrdbogDownloader(AudioDownloader):
 
     def __init__(self):
         AudioDownloader.__init__(self)
+        self.languages = ('da',)
         self.url = 'http://ordnet.dk/ddo/ordbog?'
         self.icon_url = 'http://ordnet.dk/'
 
@@ -35,29 +36,26 @@ class DenDanskeOrdbogDownloader(AudioDownloader):
             return
         if not field_data.word:
             return
-        search_soup = self.get_soup_from_url(
-            self.url + urllib.parse.urlencode(dict(query=field_data.word)))
-        search_results = search_soup.find(
-            'div', {'class': 'searchResultBox'}).findAll('a')
+        search_results = self.get_tags_from_url(
+            self.url + urllib.parse.urlencode(dict(query=field_data.word)),
+            'a', {'href': True},
+            inside=('div', {'class': 'searchResultBox'}))
         if search_results:
             self.maybe_get_icon()
         for link in search_results:
             try:
-                word_soup = self.get_soup_from_url(
-                    link['href'].encode('utf-8'))
-                audio_link = word_soup.find('audio').find('a')['href']
+                word_page = self.get_data_from_url(link['href'])
+                audio_tag = extract.find(
+                    word_page, 'a', {'href': True}, inside=('audio', {}))
                 entry = DownloadEntry(
-                    field_data, self.get_tempfile_from_url(audio_link),
+                    field_data, self.get_tempfile_from_url(audio_tag['href']),
                     dict(Source='Den Danske Ordbog'), self.site_icon)
-            except (AttributeError, KeyError, HTTPError):
+            except (TypeError, HTTPError):
+                # TypeError: no audio tag. (None['href'].)
                 # Getting HTTPErrors sometimes. Could be rate limiting.
                 continue
             # Try to get the display name from the dictionary
-            try:
-                # BeautifulSoup doesn't unescape properly, so do it
-                # this way.
-                entry.word = HTMLParser().unescape(
-                    word_soup.find('span', {'class': 'match'}).getText())
-            except AttributeError:
-                pass
+            match_tag = extract.find(word_page, 'span', {'class': 'match'})
+            if match_tag is not None:
+                entry.word = match_tag.text
             self.downloads_list.append(entry)
@@ -12,11 +12,17 @@ Class to download a files from a speaking dictionary or TTS service.
 '''
 
 
+import copy
+import hashlib
+import os
 import tempfile
-import urllib.request, urllib.error, urllib.parse
 import urllib.parse
 from bs4 import BeautifulSoup as soup
 
+from . import extract, icon_cache, resilience, response_cache
+from .connection_pool import pool
+from ..timing import Stage, timed
+
 # Make this work without PyQt
 with_pyqt = True
 try:
@@ -26,6 +32,10 @@ except ImportError:
     with_pyqt = False
 
 
+chunk_size = 64 * 1024
+# Bytes we read and write at a time when we download audio.
+
+
 def uniqify_list(seq):
     """Return a copy of the list with every element appearing only once."""
     # From http://www.peterbe.com/plog/uniqifiers-benchmark
@@ -46,7 +56,12 @@ class AudioDownloader(object):
     def __init__(self):
         self.language = ''
         # The language used.
-        # This is used as a public variable and set for every download.
+        # This is used as a public variable and set for every
+        # download. Set it on a copy, see request_copy().
+        self.languages = None
+        # The language codes (or their starts, like 'en') this site
+        # has audio for. None means it may have anything. The
+        # scheduler doesn’t ask sites for other languages.
         self.downloads_list = []
         # Store for downloaded data.
         # This is where self.download_files should store the results
@@ -61,6 +76,15 @@ class AudioDownloader(object):
         # User agent string that can be used for requests.
         # At least Google TTS won’t give out their translations unless
         # we pretend to be some typical browser.
+        self.timeout = None
+        # Seconds to wait for the site. None means the
+        # connection_pool.default_timeout.
+        self.rate_limit = None
+        # Requests per second to this site. None means the
+        # resilience.requests_per_second.
+        self.cache_ttl = None
+        # Seconds we use cached responses from this site. None means
+        # the response_cache.default_ttl, 0 means don’t cache.
         self.use_temp_files = False
         # Whether to use files created by tempfiles or not.
         # Where to write the downloaded files, in /tmp/ or into the Anki
@@ -77,6 +101,37 @@ class AudioDownloader(object):
         # The sites’s favicon.
         self.file_extension = u'.mp3'
         # Most sites have mp3 files.
+        self.file_urls = {}
+        # Temp file path -> URL it was loaded from.
+        self.max_file_size = 10 * 1024 * 1024
+        # Bytes. We stop downloading audio files larger than this.
+        self.bad_content_types = ('text/html',)
+        # Content types that are never audio. Usually an error page
+        # sent with code 200.
+        self.bad_prefixes = ()
+        # Byte strings. Files starting with one of these are not what
+        # we want.
+
+    def request_copy(self, language):
+        u"""
+        Return a copy of this downloader for a single request.
+
+        The downloaders keep the state of a download (language,
+        downloads_list, field_data, …) as instance variables. To run
+        several downloads at the same time, each one works on its own
+        shallow copy. Caches like the site icon stay shared.
+        """
+        dl_copy = copy.copy(self)
+        dl_copy.language = language
+        dl_copy.downloads_list = []
+        dl_copy.file_urls = {}
+        return dl_copy
+
+    def can_answer(self, language):
+        u"""Whether this site may have audio for the language."""
+        if self.languages is None:
+            return True
+        return language.lower().startswith(tuple(self.languages))
 
     def download_files(self, field_data):
         """Downloader functon
@@ -103,90 +158,112 @@ class AudioDownloader(object):
         u"""
         Get icon for the site as a QImage if we haven’t already.
 
-        Get the site icon, either the 'rel="icon"' or the favicon, for
-        the web page at url or passed in as page_html and store it as
-        a QImage. This function can be called repeatedly and loads the
-        icon only once.
+        Take the icon from the icon cache. This never waits for the
+        network. When the cache doesn’t have the icon yet, it loads it
+        in the background with fetch_icon(), and we go without for
+        now. This function can be called repeatedly.
         """
         if self.site_icon:
             return
         if not with_pyqt:
             self.site_icon = None
             return
-        page_request = urllib.request.Request(self.icon_url)
-        if self.user_agent:
-            page_request.add_header('User-agent', self.user_agent)
-        page_response = urllib.request.urlopen(page_request)
+        self.site_icon = icon_cache.cache.get(
+            self.icon_key(), self.request_copy(self.language).fetch_icon)
+
+    def icon_key(self):
+        u"""Return the name of the site icon in the icon cache."""
+        return type(self).__name__
+
+    def fetch_icon(self):
+        u"""
+        Load the icon for the site, return a QImage or None.
+
+        Get the site icon, either the 'rel="icon"' or the favicon, for
+        the web page at icon_url. This is called by the icon cache, in
+        a background thread.
+        """
+        page_response = self.open_url(self.icon_url)
         if 200 != page_response.code:
-            self.get_favicon()
-            return
-        page_soup = soup(page_response, 'html.parser')
+            page_response.close()
+            return self.fetch_favicon()
         try:
-            icon_url = page_soup.find(
-                name='link', attrs={'rel': 'icon'})['href']
+            icon_url = extract.find(
+                page_response.read(), 'link', {'rel': 'icon'})['href']
         except (TypeError, KeyError):
-            self.get_favicon()
-            return
+            return self.fetch_favicon()
         # The url may be absolute or relative.
         if not urllib.parse.urlsplit(icon_url).netloc:
             icon_url = urllib.parse.urljoin(
                 self.url, urllib.parse.quote(icon_url.encode('utf-8')))
-        icon_request = urllib.request.Request(icon_url)
-        if self.user_agent:
-            icon_request.add_header('User-agent', self.user_agent)
-        icon_response = urllib.request.urlopen(icon_request)
+        return self.fetch_icon_from_url(icon_url)
+
+    def fetch_favicon(self):
+        u"""
+        Load the favicon for the site, return a QImage or None.
+
+        This is used when the icon_url can’t be loaded or when that
+        page doesn’t contain a link tag with rel set to icon (the new
+        way of doing site icons.)
+        """
+        return self.fetch_icon_from_url(
+            urllib.parse.urljoin(self.icon_url, "/favicon.ico"))
+
+    def fetch_icon_from_url(self, icon_url):
+        u"""Load an icon, return it as a QImage scaled to max_icon_size."""
+        icon_response = self.open_url(icon_url)
         if 200 != icon_response.code:
-            self.site_icon = None
-            return
-        self.site_icon = QImage.fromData(icon_response.read())
+            icon_response.close()
+            return None
+        icon = QImage.fromData(icon_response.read())
         max_size = QSize(self.max_icon_size, self.max_icon_size)
-        icon_size = self.site_icon.size()
+        icon_size = icon.size()
         if icon_size.width() > max_size.width() \
                 or icon_size.height() > max_size.height():
-            self.site_icon = self.site_icon.scaled(
+            icon = icon.scaled(
                 max_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        return icon
 
-    def get_favicon(self):
+    def open_url(self, url_in, data=None, headers=None):
         u"""
-        Get favicon for the site.
+        Send a request and return the response.
 
-        This is called when the site_url can’t be loaded or when that
-        page doesn’t contain a link tag with rel set to icon (the new
-        way of doing site icons.)
+        Helper function. The request goes through the shared
+        connection pool, so we reuse connections to the same host,
+        and through the rate limit and circuit breaker of the host
+        (see resilience.py). GET requests are tried again after
+        transient errors. When data is given, this is a POST request.
         """
-        if self.site_icon:
-            return
-        if not with_pyqt:
-            self.site_icon = None
-            return
-        ico_url = urllib.parse.urljoin(self.icon_url, "/favicon.ico")
-        ico_request = urllib.request.Request(ico_url)
+        request_headers = {}
         if self.user_agent:
-            ico_request.add_header('User-agent', self.user_agent)
-        ico_response = urllib.request.urlopen(ico_request)
-        if 200 != ico_response.code:
-            self.site_icon = None
-            return
-        self.site_icon = QImage.fromData(ico_response.read())
-        max_size = QSize(self.max_icon_size, self.max_icon_size)
-        ico_size = self.site_icon.size()
-        if ico_size.width() > max_size.width() \
-                or ico_size.height() > max_size.height():
-            self.site_icon = self.site_icon.scaled(
-                max_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            request_headers['User-agent'] = self.user_agent
+        if headers:
+            request_headers.update(headers)
+        return resilience.guarded_request(
+            url_in, lambda: pool.request(
+                url_in, data=data, headers=request_headers,
+                timeout=self.timeout),
+            rate=self.rate_limit, retry=data is None)
 
-    def get_data_from_url(self, url_in):
+    @timed(Stage.GetData, per_site=True)
+    def get_data_from_url(self, url_in, data=None, headers=None):
         """
         Return raw data loaded from an URL.
 
         Helper function. Put in an URL and it sets the agent, sends
         the requests, checks that we got error code 200 and returns
-        the raw data only when everything is OK.
+        the raw data only when everything is OK. GET requests are
+        answered from the response cache when possible.
         """
-        request = urllib.request.Request(url_in)
-        request.add_header('User-agent', self.user_agent)
-        response = urllib.request.urlopen(request)
+        if data is None and response_cache.use_cache:
+            def load(extra_headers):
+                all_headers = dict(headers or {})
+                all_headers.update(extra_headers)
+                return self.open_url(url_in, headers=all_headers)
+            return response_cache.cache.get_data(url_in, load, self.cache_ttl)
+        response = self.open_url(url_in, data=data, headers=headers)
         if 200 != response.code:
+            response.close()
             raise ValueError(str(response.code) + ': ' + response.msg)
         return response.read()
 
@@ -198,19 +275,74 @@ class AudioDownloader(object):
         """
         return soup(self.get_data_from_url(url_in), 'html.parser')
 
+    def get_tags_from_url(
+            self, url_in, name=None, attrs=None, inside=None, limit=None):
+        u"""
+        Return the matching tags from the page at url_in.
+
+        Much faster than get_soup_from_url() when we only want a few
+        tags. See extract.find_all() for the arguments.
+        """
+        return extract.find_all(
+            self.get_data_from_url(url_in), name, attrs, inside, limit)
+
     def get_tempfile_from_url(self, url_in):
         """
         Download raw data from url and put into a tempfile
 
-        Wrapper helper function aronud self.get_data_from_url().
+        Wrapper helper function aronud self.stream_to_tempfile().
+        """
+        return self.stream_to_tempfile(url_in)[0]
+
+    @timed(Stage.GetFile, per_site=True)
+    def stream_to_tempfile(self, url_in):
+        """
+        Download url to a tempfile, return its path and SHA-256 hash.
+
+        The data goes to disk chunk by chunk, and is hashed on the
+        way, so neither the whole file nor a second read is needed.
+        Give up with a ValueError when the site sends a bad content
+        type, one of the bad_prefixes or more than max_file_size
+        bytes. Audio files don’t go through the response cache.
         """
-        data = self.get_data_from_url(url_in)
-        # We put the data into RAM first so that we don’t have to
-        # clean up the temp file when the get does not work. (Bad
-        # get_data raises all kinds of exceptions that fly through
-        # here.)
+        response = self.open_url(url_in)
+        if 200 != response.code:
+            response.close()
+            raise ValueError(str(response.code) + ': ' + response.msg)
+        content_type = (response.getheader('Content-Type') or '').lower()
+        if any(content_type.startswith(bad_type)
+               for bad_type in self.bad_content_types):
+            response.close()
+            raise ValueError(u'Not audio: ' + content_type)
+        prefix_length = max([len(p) for p in self.bad_prefixes] or [0])
+        file_sha = hashlib.sha256()
         tfile = tempfile.NamedTemporaryFile(
             delete=False, prefix=u'anki_audio_', suffix=self.file_extension)
-        tfile.write(data)
-        tfile.close()
-        return tfile.name
+        try:
+            with response, tfile:
+                size = 0
+                head = b''
+                while True:
+                    chunk = response.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_file_size:
+                        raise ValueError(u'File too large')
+                    if len(head) < prefix_length:
+                        head += chunk[:prefix_length - len(head)]
+                        if len(head) >= prefix_length and \
+                                head.startswith(self.bad_prefixes):
+                            raise ValueError(u'Known bad file')
+                    file_sha.update(chunk)
+                    tfile.write(chunk)
+            if head and head.startswith(self.bad_prefixes):
+                # Shorter than the longest prefix.
+                raise ValueError(u'Known bad file')
+            if not size:
+                raise ValueError(u'Empty file')
+        except:
+            os.remove(tfile.name)
+            raise
+        self.file_urls[tfile.name] = url_in
+        return tfile.name, file_sha
@@ -45,6 +45,7 @@ class DudenDownloader(AudioDownloader):
     """Download audio from Duden"""
     def __init__(self):
         AudioDownloader.__init__(self)
+        self.languages = ('de',)
         self.icon_url = 'http://www.duden.de/'
         self.url = 'http://www.duden.de/rechtschreibung/'
 
@@ -61,8 +62,8 @@ class DudenDownloader(AudioDownloader):
             return
         m_word = munge_word(field_data.word)
         self.maybe_get_icon()
-        word_soup = self.get_soup_from_url(self.url + m_word)
-        blank_links = word_soup.findAll(name='a', target="_blank", title=True)
+        blank_links = self.get_tags_from_url(
+            self.url + m_word, 'a', {'target': '_blank', 'title': True})
         for link in blank_links:
             # I expect no more than one result. So we don't catch
             # anything here. When something goes wrong with the first
@@ -0,0 +1,252 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Pick the few tags we want out of a dictionary page.
+
+The scrapers only want a handful of links or data-src-mp3 attributes
+from each page. Building a full BeautifulSoup tree of the whole page
+for that is slow. find_all() uses lxml with an XPath query when lxml
+is installed. Without it, a streaming scanner looks at the start tags
+one by one, builds no tree and stops as soon as it has limit tags.
+
+Tags are matched like in BeautifulSoup: attrs maps attribute names to
+True (the attribute must be there), a string or a compiled regular
+expression. For class and rel, a string matches one of the words or
+the whole value.
+'''
+
+import html.parser
+
+# lxml is faster, but not part of Anki.
+with_lxml = True
+try:
+    import lxml.html
+except ImportError:
+    with_lxml = False
+
+use_lxml = True
+# Set to False to always use the scanner.
+
+multi_valued = ('class', 'rel')
+void_tags = (
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr')
+# Tags without end tag. We don’t wait for those to collect their text.
+
+
+class Tag(object):
+    u"""A tag we found: name, attributes and the text inside."""
+    def __init__(self, name, attrs, text=u''):
+        self.name = name
+        self.attrs = attrs
+        self.text = text
+
+    def __getitem__(self, key):
+        return self.attrs[key]
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+    def __repr__(self):
+        return u'Tag({0!r}, {1!r})'.format(self.name, self.attrs)
+
+
+def names_tuple(name):
+    u"""Return name as a tuple of tag names, or None for any tag."""
+    if name is None:
+        return None
+    if isinstance(name, str):
+        return (name,)
+    return tuple(name)
+
+
+def value_matches(key, value, wanted):
+    if value is None:
+        return False
+    if wanted is True:
+        return True
+    if hasattr(wanted, 'search'):
+        return wanted.search(value) is not None
+    if key in multi_valued:
+        return value == wanted or wanted in value.split()
+    return value == wanted
+
+
+def attrs_match(attrs, wanted_attrs):
+    u"""Whether the attrs dict has all the wanted_attrs."""
+    if not wanted_attrs:
+        return True
+    return all(value_matches(key, attrs.get(key), wanted)
+               for key, wanted in wanted_attrs.items())
+
+
+def decode(data):
+    u"""Return the page as str."""
+    if isinstance(data, str):
+        return data
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+class StopScanning(Exception):
+    pass
+
+
+class TagScanner(html.parser.HTMLParser):
+    u"""Collect matching tags from a page without building a tree."""
+    def __init__(self, names, attrs, inside, limit):
+        html.parser.HTMLParser.__init__(self, convert_charrefs=True)
+        self.names = names
+        self.wanted_attrs = attrs
+        self.limit = limit
+        self.inside_name = None
+        self.inside_attrs = None
+        if inside:
+            self.inside_name, self.inside_attrs = inside
+        self.inside_depth = 0
+        # How deep we are in tags that match inside. 0: not inside.
+        self.found = []
+        self.open_tags = []
+        # [tag, depth] for the found tags we collect text for.
+
+    def handle_starttag(self, name, attr_list):
+        if self.inside_name is not None:
+            if self.inside_depth:
+                if name == self.inside_name:
+                    self.inside_depth += 1
+            elif name == self.inside_name and attrs_match(
+                    dict(attr_list), self.inside_attrs):
+                self.inside_depth = 1
+                return
+            if not self.inside_depth:
+                return
+        for open_tag in self.open_tags:
+            if open_tag[0].name == name:
+                open_tag[1] += 1
+        if self.names is not None and name not in self.names:
+            return
+        attrs = dict((key, value or u'') for key, value in attr_list)
+        if not attrs_match(attrs, self.wanted_attrs):
+            return
+        tag = Tag(name, attrs)
+        self.found.append(tag)
+        if name in void_tags:
+            self.check_limit()
+        else:
+            self.open_tags.append([tag, 1])
+
+    def handle_startendtag(self, name, attr_list):
+        self.handle_starttag(name, attr_list)
+        self.handle_endtag(name)
+
+    def handle_endtag(self, name):
+        if self.inside_depth and name == self.inside_name:
+            self.inside_depth -= 1
+        closed = False
+        for open_tag in self.open_tags:
+            if open_tag[0].name == name:
+                open_tag[1] -= 1
+                closed = closed or open_tag[1] == 0
+        if closed:
+            self.open_tags = [
+                open_tag for open_tag in self.open_tags if open_tag[1]]
+            self.check_limit()
+
+    def handle_data(self, data):
+        for open_tag in self.open_tags:
+            open_tag[0].text += data
+
+    def check_limit(self):
+        u"""Stop when we have enough tags, with all their text."""
+        if self.limit and len(self.found) >= self.limit \
+                and not self.open_tags:
+            raise StopScanning()
+
+
+def scan(data, names, attrs, inside, limit):
+    scanner = TagScanner(names, attrs, inside, limit)
+    try:
+        scanner.feed(decode(data))
+        scanner.close()
+    except StopScanning:
+        pass
+    return scanner.found[:limit] if limit else scanner.found
+
+
+def xpath_step(names, attrs, variables):
+    u"""
+    Return an XPath step for the tag names and attrs.
+
+    The values go into variables, so we don’t have to quote them.
+    Regular expressions are only tested for presence here.
+    """
+    if names is None:
+        step = u'*'
+    elif len(names) == 1:
+        step = names[0]
+    else:
+        step = u'*[{0}]'.format(u' or '.join(
+            u'self::{0}'.format(name) for name in names))
+    for key, wanted in (attrs or {}).items():
+        if wanted is True or hasattr(wanted, 'search'):
+            step += u'[@{0}]'.format(key)
+            continue
+        variable = u'v{0}'.format(len(variables))
+        variables[variable] = wanted
+        if key in multi_valued:
+            step += (u"[@{0}=${1} or contains(concat(' ', "
+                     u"normalize-space(@{0}), ' '), "
+                     u"concat(' ', ${1}, ' '))]").format(key, variable)
+        else:
+            step += u'[@{0}=${1}]'.format(key, variable)
+    return step
+
+
+def lxml_find(data, names, attrs, inside, limit):
+    try:
+        root = lxml.html.fromstring(data)
+    except (ValueError, lxml.etree.ParserError):
+        return []
+    variables = {}
+    query = u'//' + xpath_step(names, attrs, variables)
+    if inside:
+        query = u'//' + xpath_step(
+            names_tuple(inside[0]), inside[1], variables) + query
+    found = []
+    for element in root.xpath(query, **variables):
+        tag = Tag(element.tag, dict(element.attrib), element.text_content())
+        # The regular expressions.
+        if attrs_match(tag.attrs, attrs):
+            found.append(tag)
+            if limit and len(found) >= limit:
+                break
+    return found
+
+
+def find_all(data, name=None, attrs=None, inside=None, limit=None):
+    u"""
+    Return the tags in the page data that match, as a list of Tags.
+
+    name may be a tag name, a tuple of names or None for any tag. With
+    inside, a (name, attrs) pair, only tags within such a tag count.
+    With limit, return at most that many tags, and stop looking once
+    we have them.
+    """
+    names = names_tuple(name)
+    if with_lxml and use_lxml:
+        return lxml_find(data, names, attrs, inside, limit)
+    return scan(data, names, attrs, inside, limit)
+
+
+def find(data, name=None, attrs=None, inside=None):
+    u"""Return the first matching tag, or None."""
+    found = find_all(data, name, attrs, inside, limit=1)
+    return found[0] if found else None
@@ -21,6 +21,7 @@ class HowJSayDownloader(AudioDownloader):
     """Download audio from HowJSay"""
     def __init__(self):
         AudioDownloader.__init__(self)
+        self.languages = ('en',)
         self.icon_url = 'http://howjsay.com'
         self.url = 'http://howjsay.com/mp3/'
 
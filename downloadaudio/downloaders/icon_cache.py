@@ -0,0 +1,117 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Keep the site icons on disk.
+
+Getting a site icon can mean loading and parsing a whole web page,
+and that used to happen in the middle of the first download from each
+site. Now the icons are kept as PNG files, one per site (and language,
+where the icon depends on it). They are read from disk the first time
+they are needed. Icons we don’t have yet, or that are old, are loaded
+in a background thread. A download never waits for an icon; without
+one it just shows none until the next time.
+'''
+
+import os
+import threading
+import time
+
+# Make this work without PyQt
+with_pyqt = True
+try:
+    from PyQt5.QtGui import QImage
+except ImportError:
+    with_pyqt = False
+
+refresh_age = 30 * 24 * 60 * 60
+# Seconds. Load icons older than this again, in the background.
+icon_dir = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'icon_cache')
+
+
+class IconCache(object):
+    u"""Site icons in memory and as PNG files."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.icons = {}
+        # key -> QImage or None
+        self.loading = set()
+        # Keys we are loading or have tried to load in this session.
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.png')
+
+    def get(self, key, fetch_function):
+        u"""
+        Return the icon for key, or None.
+
+        fetch_function() should load the icon from the web and return
+        a QImage or None. It is called in a background thread when we
+        don’t have the icon or it is old.
+        """
+        if not with_pyqt:
+            return None
+        with self.lock:
+            if key in self.icons:
+                return self.icons[key]
+        icon = None
+        stale = True
+        icon_path = self.path(key)
+        try:
+            stale = time.time() - os.path.getmtime(icon_path) > refresh_age
+        except OSError:
+            pass
+        else:
+            icon = QImage(icon_path)
+            if icon.isNull():
+                icon = None
+                stale = True
+        with self.lock:
+            self.icons[key] = icon
+        if stale:
+            self.refresh(key, fetch_function)
+        return icon
+
+    def refresh(self, key, fetch_function):
+        u"""Load the icon in the background, once per session."""
+        with self.lock:
+            if key in self.loading:
+                return
+            self.loading.add(key)
+        fetch_thread = threading.Thread(
+            target=self.fetch, args=(key, fetch_function),
+            name='icon ' + key)
+        fetch_thread.daemon = True
+        fetch_thread.start()
+
+    def fetch(self, key, fetch_function):
+        try:
+            icon = fetch_function()
+        except:
+            # No icon this time. We try again next session.
+            return
+        if icon is None or icon.isNull():
+            return
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            # Typically it’s already there.
+            pass
+        icon_path = self.path(key)
+        temp_icon_path = icon_path + '.part'
+        if icon.save(temp_icon_path, 'PNG'):
+            os.replace(temp_icon_path, icon_path)
+        with self.lock:
+            self.icons[key] = icon
+
+
+cache = IconCache(icon_dir)
+# The one icon cache used by all downloaders.
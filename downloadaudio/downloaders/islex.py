@@ -22,6 +22,7 @@ class IslexDownloader(AudioDownloader):
 
     def __init__(self):
         AudioDownloader.__init__(self)
+        self.languages = ('is',)
         self.url = 'http://islex.is/'
         self.icon_url = 'http://islex.is/'
         self.file_extension = u'.mp3'
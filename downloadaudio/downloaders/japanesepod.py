@@ -19,7 +19,7 @@ import re
 import urllib.request, urllib.error, urllib.parse
 import urllib.parse
 
-from ..blacklist import get_hash
+from ..blacklist import check_hash, default_list
 from ..download_entry import JpodDownloadEntry
 from .downloader import AudioDownloader
 
@@ -40,6 +40,7 @@ class JapanesepodDownloader(AudioDownloader):
     """Download audio from Japanesepod"""
     def __init__(self):
         AudioDownloader.__init__(self)
+        self.languages = ('ja',)
         self.user_agent = 'Mozilla/5.0 (X11; Ubuntu; Linux i686; rv:15.0) ' \
             'Gecko/20100101 Firefox/15.0.1'
         self.icon_url = 'http://www.japanesepod101.com/'
@@ -48,6 +49,10 @@ class JapanesepodDownloader(AudioDownloader):
         self.wwwjdic_url = u'http://www.edrdg.org/cgi-bin/wwwjdic/wwwjdic' \
             u'?1MUJ{kana}_2_50'
         self.extras = {'Source': 'JapanesePod'}
+        self.cache_ttl = 30 * 24 * 60 * 60
+        # Neither the clips nor the wwwjdic entries change much.
+        self.blacklist_names = (default_list,)
+        # The blacklists with the “not available” files we check.
         self.field_data = None
 
     def download_files(self, field_data):
@@ -89,9 +94,10 @@ class JapanesepodDownloader(AudioDownloader):
             kanji = self.field_data.kanji
         if not kana:
             kana = self.field_data.kana
-        file_path = self.get_tempfile_from_url(self.jpod_url(kanji, kana))
+        file_path, item_hash = self.stream_to_tempfile(
+            self.jpod_url(kanji, kana))
         try:
-            item_hash = get_hash(file_path)
+            check_hash(item_hash, self.blacklist_names)
         except ValueError:
             # Clean up
             os.remove(file_path)
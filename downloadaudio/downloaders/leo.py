@@ -16,13 +16,6 @@ import re
 import urllib.request, urllib.parse, urllib.error
 import xml.etree.ElementTree as ElementTree
 
-# Make this work without PyQt
-with_pyqt = True
-try:
-    from PyQt5.QtGui import QImage
-except ImportError:
-    with_pyqt = False
-
 from .downloader import AudioDownloader
 from ..download_entry import DownloadEntry
 
@@ -42,9 +35,7 @@ class LeoDownloader(AudioDownloader):
         self.language_dict = {'de': 'de', 'en': 'en', 'fr': 'fr', 'es': 'es'}
         # As of 2015-01-26, leo.org has no audio for these languages:
         # 'it': 'it', 'zh': 'ch', 'ru': 'ru', 'pt': 'pt', 'pl': 'pl'
-        self.site_icon_dict = {}
-        # We should keep a number of site icons handy, with the right
-        # flag for the request.
+        self.languages = tuple(self.language_dict)
         self.icon_url_dict = {
             'de': 'http://dict.leo.org/img/favicons/ende.ico',
             'en': 'http://dict.leo.org/img/favicons/ende.ico',
@@ -128,21 +119,18 @@ class LeoDownloader(AudioDownloader):
         Set self.site_icon to the right icon.
 
         We should use different icons, depending on the request
-        language.  We store these icons in self.site_icon_dict and use the
-        AudioDownloader.maybe_get_icon() if we don't have it yet.
+        language. The icon cache keeps one for each language.
         """
-        if not with_pyqt:
-            return
-        try:
-            # If this works we already have it.
-            self.site_icon = self.site_icon_dict[self.language]
-        except KeyError:
-            # We have to get it ourself. (We know it's just 16x16, so
-            # no resize. And we know the address).
-            self.site_icon_dict[self.language] = \
-                QImage.fromData(self.get_data_from_url(
-                    self.icon_url_dict[self.language]))
-            self.site_icon = self.site_icon_dict[self.language]
+        self.site_icon = None
+        self.maybe_get_icon()
+
+    def icon_key(self):
+        return u'{0}_{1}'.format(type(self).__name__, self.language)
+
+    def fetch_icon(self):
+        # We know the address of the icon for the language. (And we
+        # know it's just 16x16, so the scaling does nothing.)
+        return self.fetch_icon_from_url(self.icon_url_dict[self.language])
 
     def normalize(self, word):
         """
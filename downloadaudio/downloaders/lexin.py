@@ -13,7 +13,6 @@ Download pronunciations from Lexin.
 """
 
 import unicodedata
-import urllib.request, urllib.error, urllib.parse
 import json
 from bs4 import BeautifulSoup
 
@@ -48,6 +47,7 @@ class LexinDownloader(AudioDownloader):
     """Download audio from Lexin"""
     def __init__(self):
         AudioDownloader.__init__(self)
+        self.languages = ('sv',)
         self.icon_url = 'http://lexin.nada.kth.se/lexin/'
         self.url = 'http://lexin.nada.kth.se/lexin/lexin/lookupword'
         self.audio_url = 'http://lexin.nada.kth.se/sound/'
@@ -74,18 +74,16 @@ class LexinDownloader(AudioDownloader):
             'FCDCCA88916BAACF8B03FB48D294BA89|'
             'se.jojoman.lexin.lexingwt.client.LookUpService|'
             'lookUpWord|se.jojoman.lexin.lexingwt.client.LookUpRequest/682723451|swe_swe|' +
-            field_data.word.encode('utf-8') + '|1|2|3|4|1|5|5|1|6|1|7|')
-        request = urllib.request.Request(
-            self.url,
-            payload, headers)
+            field_data.word + '|1|2|3|4|1|5|5|1|6|1|7|').encode('utf-8')
         try:
-            response = urllib.request.urlopen(request)
+            data = self.get_data_from_url(
+                self.url, data=payload, headers=headers)
         except:
             self.download_v1(field_data)
             return
         # Strip leading '//OK' and
         # exchange invalid hex escapes with unicode escapes
-        data = response.read()[4:].replace('\\x', '\\u00')
+        data = data[4:].decode('utf-8').replace('\\x', '\\u00')
         # data is now valid json.
         # Each word has a corresponding xml string
         # inside the list.
@@ -20,7 +20,6 @@ import urllib.request, urllib.parse, urllib.error
 from .downloader import AudioDownloader
 from ..download_entry import DownloadEntry
 
-# Work-around for broken BeautifulSoup
 sound_class = re.compile(r'\bsound\b')
 
 
@@ -28,6 +27,7 @@ class MacmillanDownloader(AudioDownloader):
     """Download audio from Macmillan Dictionary."""
     def __init__(self):
         AudioDownloader.__init__(self)
+        self.languages = ('en',)
         self.icon_url = 'http://www.macmillandictionary.com/'
         self.extras = {}  # Set in the derived classes.
 
@@ -48,14 +48,13 @@ class MacmillanDownloader(AudioDownloader):
             return
         word = field_data.word.replace("'", "-")
         self.maybe_get_icon()
-        # Do our parsing with BeautifulSoup
-        word_soup = self.get_soup_from_url(
-            self.url + urllib.parse.quote(word.encode('utf-8')))
-        # The audio clips are stored as images with class sound and
-        # the link hidden in the onclick bit.
-        sounds = word_soup.findAll(True, {'class': sound_class})
+        # The audio clips are tags with class sound and the link in
+        # the data-src-mp3 attribute.
+        sounds = self.get_tags_from_url(
+            self.url + urllib.parse.quote(word.encode('utf-8')),
+            attrs={'class': sound_class, 'data-src-mp3': True})
         for sound_tag in sounds:
-            audio_url = sound_tag.get('data-src-mp3')
+            audio_url = sound_tag['data-src-mp3']
             if not audio_url:
                 continue
             file_path = self.get_tempfile_from_url(audio_url)
@@ -0,0 +1,253 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Be nice to the sites, and don’t wait for dead ones.
+
+Every request to a host goes through a HostGuard with
+
+* a token bucket, so that we send no more than a few requests per
+  second, even when filling a whole deck,
+* a few retries with exponential backoff for timeouts, dropped
+  connections and 5xx errors, and
+* a circuit breaker. After a few failures in a row we stop asking the
+  host for a while. Requests fail at once then, instead of costing a
+  full timeout each. After the cooldown one request may try again.
+
+The scheduler sets the deadline of the job for the thread that runs a
+download, with request_deadline(). We don’t start a retry that would
+have to wait past it, as nobody would wait for its result.
+'''
+
+import contextlib
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+requests_per_second = 2.0
+burst = 4
+# The token bucket: on average this many requests per second, but up
+# to burst at once. A downloader can set its own rate_limit.
+max_retries = 2
+# Further tries after a failure. Only for GET requests.
+backoff_base = 0.5
+backoff_max = 8.0
+# Seconds. We wait base, 2 × base, 4 × base, … plus some jitter.
+failure_threshold = 5
+# Failures in a row that open the circuit.
+cooldown = 5 * 60
+# Seconds the circuit stays open.
+
+transient_codes = (429, 500, 502, 503, 504)
+# HTTP codes worth trying again.
+
+_local = threading.local()
+# The deadline of the download running in this thread, or None.
+
+
+class CircuitOpenError(IOError):
+    u"""We don’t ask this host at the moment."""
+    pass
+
+
+class TokenBucket(object):
+    u"""Allow rate requests per second on average, burst at once."""
+    def __init__(self, rate, burst_size):
+        self.rate = rate
+        self.burst_size = burst_size
+        self.tokens = float(burst_size)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+        self.waited = 0.0
+        # Seconds all requests together waited for a token.
+
+    def reserve(self):
+        u"""Take a token. Return the seconds to wait until it’s valid."""
+        with self.lock:
+            now = time.time()
+            self.tokens = min(
+                self.burst_size,
+                self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            wait_time = -self.tokens / self.rate
+            self.waited += wait_time
+            return wait_time
+
+    def acquire(self):
+        wait_time = self.reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class CircuitState(object):
+    Closed, Open, HalfOpen = u'closed', u'open', u'half open'
+
+
+class CircuitBreaker(object):
+    u"""Stop asking a host after failure_threshold failures in a row."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = CircuitState.Closed
+        self.failures = 0
+        # In a row.
+        self.total_failures = 0
+        self.opened_at = None
+        self.short_circuited = 0
+        # Requests we refused.
+
+    def allow(self):
+        u"""Whether a request may go out now."""
+        with self.lock:
+            if self.state == CircuitState.Closed:
+                return True
+            if self.state == CircuitState.Open and \
+                    time.time() - self.opened_at >= cooldown:
+                # Let one request find out whether the host is back.
+                self.state = CircuitState.HalfOpen
+                return True
+            self.short_circuited += 1
+            return False
+
+    def success(self):
+        with self.lock:
+            self.state = CircuitState.Closed
+            self.failures = 0
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.total_failures += 1
+            if self.state == CircuitState.HalfOpen or \
+                    self.failures >= failure_threshold:
+                self.state = CircuitState.Open
+                self.opened_at = time.time()
+
+    def reopens_in(self):
+        u"""Seconds until the next try, when open."""
+        with self.lock:
+            if self.state != CircuitState.Open:
+                return 0
+            return max(0, cooldown - (time.time() - self.opened_at))
+
+
+class HostGuard(object):
+    u"""Rate limit and circuit breaker for one host."""
+    def __init__(self, host, rate=None):
+        self.host = host
+        if rate is None:
+            rate = requests_per_second
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+        self.retries = 0
+
+    def before_request(self):
+        u"""Wait for our turn. Raise CircuitOpenError when we may not."""
+        if not self.breaker.allow():
+            raise CircuitOpenError(
+                u'Not asking {0} for {1:.0f} s after {2} failures'.format(
+                    self.host, self.breaker.reopens_in(),
+                    self.breaker.failures))
+        self.bucket.acquire()
+
+    def as_dict(self):
+        return dict(
+            state=self.breaker.state, failures=self.breaker.failures,
+            total_failures=self.breaker.total_failures,
+            short_circuited=self.breaker.short_circuited,
+            reopens_in=self.breaker.reopens_in(), retries=self.retries,
+            rate=self.bucket.rate, waited=self.bucket.waited)
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def guard_for(url, rate=None):
+    u"""Return the HostGuard for the host of url."""
+    host = urllib.parse.urlsplit(url).hostname or u''
+    with _guards_lock:
+        try:
+            return _guards[host]
+        except KeyError:
+            _guards[host] = HostGuard(host, rate)
+            return _guards[host]
+
+
+def is_transient(error):
+    u"""Whether an error is worth trying again (and counts as failure)."""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in transient_codes
+    return isinstance(error, OSError) and \
+        not isinstance(error, CircuitOpenError)
+
+
+def backoff(attempt):
+    u"""Return the seconds to wait before try number attempt + 1."""
+    return min(backoff_max, backoff_base * 2 ** (attempt - 1)) \
+        * random.uniform(0.5, 1.0)
+
+
+@contextlib.contextmanager
+def request_deadline(deadline):
+    u"""Don’t retry the requests of the with block past deadline."""
+    old_deadline = getattr(_local, 'deadline', None)
+    _local.deadline = deadline
+    try:
+        yield
+    finally:
+        _local.deadline = old_deadline
+
+
+def time_for(wait_time):
+    u"""Whether we can wait wait_time seconds and still try again."""
+    deadline = getattr(_local, 'deadline', None)
+    return deadline is None or time.time() + wait_time < deadline
+
+
+def guarded_request(url, send_function, rate=None, retry=True):
+    u"""
+    Call send_function() for url with rate limit, retries and breaker.
+
+    send_function should send the request and return the response.
+    Errors that are not transient, like a 404, are passed on at once.
+    They show that the host is alive.
+    """
+    host_guard = guard_for(url, rate)
+    attempt = 0
+    while True:
+        host_guard.before_request()
+        try:
+            response = send_function()
+        except Exception as error:
+            if not is_transient(error):
+                host_guard.breaker.success()
+                raise
+            host_guard.breaker.failure()
+            attempt += 1
+            if not retry or attempt > max_retries:
+                raise
+            wait_time = backoff(attempt)
+            if not time_for(wait_time):
+                raise
+            host_guard.retries += 1
+            time.sleep(wait_time)
+            continue
+        host_guard.breaker.success()
+        return response
+
+
+def diagnostics():
+    u"""Return the state of all hosts, as a dict of dicts by host."""
+    with _guards_lock:
+        guards = list(_guards.values())
+    return dict((guard.host, guard.as_dict()) for guard in guards)
@@ -0,0 +1,225 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Keep the data we load from the web on disk.
+
+When we fill audio for a whole deck, the same dictionary pages are
+requested again and again. Keep the responses to GET requests in a
+cache folder, one file per request, named after the hash of the URL.
+Entries are served until their time to live runs out. After that we
+ask the site whether the page has changed (ETag, Last-Modified) and
+only load it again when it has. The total size is limited; the least
+recently used entries are removed first.
+
+In offline mode we never go to the network and serve only what we
+have.
+'''
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+use_cache = True
+# Switch this to False to always load everything from the web.
+offline = False
+# Set this to True to only use what we already have. Requests we
+# can’t answer from the cache raise a ValueError.
+default_ttl = 7 * 24 * 60 * 60
+# Seconds before we ask the site again. Each downloader can set its
+# own cache_ttl. A ttl of 0 means don’t cache.
+max_cache_size = 200 * 1024 * 1024
+# Bytes. When we have more, we remove the least recently used entries.
+cache_dir = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'http_cache')
+# Where we keep the cache. This is inside the add-on folder. To use
+# another folder, e.g. with recorded test data, set cache.directory.
+
+body_suffix = '.body'
+meta_suffix = '.json'
+
+
+def cache_key(url):
+    u"""Return the name of the cache entry for url."""
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+class ResponseCache(object):
+    u"""An on-disk cache of response bodies with LRU eviction."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.total_size = None
+        # Bytes, computed on first write.
+
+    def paths(self, key):
+        return (os.path.join(self.directory, key + body_suffix),
+                os.path.join(self.directory, key + meta_suffix))
+
+    def read_entry(self, url):
+        u"""Return the (metadata, body path) for url, or (None, None)."""
+        body_path, meta_path = self.paths(cache_key(url))
+        try:
+            with open(meta_path, 'r') as meta_file:
+                meta = json.load(meta_file)
+        except (IOError, OSError, ValueError):
+            return None, None
+        if meta.get('url') != url or not os.path.exists(body_path):
+            return None, None
+        return meta, body_path
+
+    def touch(self, body_path):
+        u"""Mark an entry as just used, for the LRU eviction."""
+        try:
+            os.utime(body_path, None)
+        except OSError:
+            pass
+
+    def get_data(self, url, load_function, ttl=None):
+        u"""
+        Return the data for url, from the cache or from the web.
+
+        load_function(extra_headers) should send the request and
+        return the response. We add the revalidation headers when we
+        have a stale entry.
+        """
+        if ttl is None:
+            ttl = default_ttl
+        meta, body_path = self.read_entry(url)
+        if meta is not None:
+            if offline or time.time() - meta['time'] < ttl:
+                self.touch(body_path)
+                return self.read_body(body_path)
+        elif offline:
+            raise ValueError(
+                u'Not in the cache and working offline: {0}'.format(url))
+        if not ttl:
+            return self.load_checked(load_function, {})
+        extra_headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                extra_headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                extra_headers['If-Modified-Since'] = meta['last_modified']
+        response = load_function(extra_headers)
+        if 304 == response.code and meta is not None:
+            response.read()
+            meta['time'] = time.time()
+            self.write_meta(url, meta)
+            self.touch(body_path)
+            return self.read_body(body_path)
+        if 200 != response.code:
+            response.close()
+            raise ValueError(str(response.code) + ': ' + response.msg)
+        data = response.read()
+        self.store(url, data, response)
+        return data
+
+    @staticmethod
+    def load_checked(load_function, extra_headers):
+        response = load_function(extra_headers)
+        if 200 != response.code:
+            response.close()
+            raise ValueError(str(response.code) + ': ' + response.msg)
+        return response.read()
+
+    @staticmethod
+    def read_body(body_path):
+        with open(body_path, 'rb') as body_file:
+            return body_file.read()
+
+    def write_meta(self, url, meta):
+        __, meta_path = self.paths(cache_key(url))
+        with open(meta_path, 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+    def store(self, url, data, response):
+        u"""Write a response to the cache and evict old entries."""
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            # Typically it’s already there.
+            pass
+        body_path, meta_path = self.paths(cache_key(url))
+        meta = dict(
+            url=url, time=time.time(), size=len(data),
+            etag=response.getheader('ETag'),
+            last_modified=response.getheader('Last-Modified'))
+        with self.lock:
+            # Write to a temp name first, so that another thread never
+            # sees half a file.
+            temp_body_path = body_path + '.part{0}'.format(
+                threading.current_thread().ident)
+            try:
+                old_size = os.stat(body_path).st_size
+            except OSError:
+                # Not cached yet.
+                old_size = 0
+            with open(temp_body_path, 'wb') as body_file:
+                body_file.write(data)
+            os.replace(temp_body_path, body_path)
+            with open(meta_path, 'w') as meta_file:
+                json.dump(meta, meta_file)
+            if self.total_size is None:
+                self.total_size = self.disk_size()
+            else:
+                self.total_size += len(data) - old_size
+            if self.total_size > max_cache_size:
+                self.evict()
+
+    def entries(self):
+        u"""Return (last use, size, key) for all cache entries."""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(body_suffix):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append(
+                (stat.st_mtime, stat.st_size, name[:-len(body_suffix)]))
+        return entries
+
+    def disk_size(self):
+        return sum(size for __, size, __ in self.entries())
+
+    def evict(self):
+        u"""Remove the least recently used entries until we fit."""
+        # Go down to 90 %, so that we don’t do this on every write.
+        target_size = max_cache_size * 0.9
+        for __, size, key in sorted(self.entries()):
+            if self.total_size <= target_size:
+                break
+            for path in self.paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.total_size -= size
+
+    def clear(self):
+        u"""Remove everything from the cache."""
+        with self.lock:
+            for __, __, key in self.entries():
+                for path in self.paths(key):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            self.total_size = 0
+
+
+cache = ResponseCache(cache_dir)
+# The one cache used by all downloaders.
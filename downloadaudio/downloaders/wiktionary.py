@@ -18,14 +18,6 @@ import urllib.parse
 from .downloader import AudioDownloader, uniqify_list
 from ..download_entry import DownloadEntry
 
-# Make this work without PyQt
-with_pyqt = True
-try:
-    from PyQt5.QtGui import QImage
-    from PyQt5.QtCore import QSize, Qt
-except ImportError:
-    with_pyqt = False
-
 
 class WiktionaryDownloader(AudioDownloader):
     """Download audio from Wiktionary"""
@@ -43,6 +35,8 @@ class WiktionaryDownloader(AudioDownloader):
         # This seems to work to extract the url from a <button> tag's
         # onclick attribute.
         self.button_onclick_re = '"videoUrl":"([^"]+)"'
+        self.cache_ttl = 24 * 60 * 60
+        # Wiktionary pages get edited all the time. Ask again daily.
 
     @property
     def url(self):
@@ -66,49 +60,31 @@ class WiktionaryDownloader(AudioDownloader):
         u_word = urllib.parse.quote(field_data.word.encode('utf-8'))
         self.maybe_get_icon()
         self.language = self.language[:2]
-        word_soup = self.get_soup_from_url(self.url + u_word)
         # There are a number of ways the audio files can be present:
+        # As simple links, as source tags inside audio tags, and, at
+        # least at fr.wiktionary.org, in the onclick of a button. Get
+        # all of them in one go.
+        tag_list = self.get_tags_from_url(
+            self.url + u_word, ('a', 'source', 'button'))
+        word_re = self.word_ogg_re.format(word=re.escape(u_word))
         ogg_url_list = []
-        # As simple links:
-        a_list = word_soup.findAll('a')
-        for a in a_list:
-            try:
-                # Caveat. I have seen an <a> without a href! (It was '<a
-                # id="top"></a>', maybe they handle it with CSS.) So href_list
-                # = [a['href'] for a in a_list] might not work.
-                href = a['href']
-            except KeyError:
-                continue
+        for tag in tag_list:
+            if tag.name == 'button':
+                try:
+                    candidate_url = re.search(
+                        self.button_onclick_re, tag['onclick']).group(1)
+                except (KeyError, AttributeError):
+                    continue
+            else:
+                # Caveat. I have seen an <a> without a href! (It was
+                # '<a id="top"></a>', maybe they handle it with CSS.)
+                candidate_url = tag.get('href') or tag.get('src')
+                if not candidate_url:
+                    continue
             # We look for links to ogg files (and not the description
             # pages) that contain our word.
-            if re.search(self.word_ogg_re.format(word=re.escape(u_word)), href,
-                         flags=re.IGNORECASE):
-                ogg_url_list.append(href)
-        # Next, look for source and src. Seen those inside audio tags.
-        # I'm not sure if this is any use, but i guess it does no harm.
-        source_list = word_soup.findAll('source')
-        for source in source_list:
-            try:
-                # Take the same precaution as above
-                src = source['src']
-            except KeyError:
-                continue
-            # We might have other source tags, for whatever. Use the
-            # same re as above. Should work out fine.
-            if re.search(self.word_ogg_re.format(word=re.escape(u_word)), src,
-                         flags=re.IGNORECASE):
-                ogg_url_list.append(src)
-        # At least from fr.wiktionary.org i got a <button>.
-        button_list = word_soup.findAll('button')
-        for button in button_list:
-            try:
-                video_url = re.search(
-                    self.button_onclick_re, button['onclick']).group(1)
-            except (KeyError, AttributeError):
-                continue
-            if re.search(self.word_ogg_re.format(word=re.escape(u_word)),
-                         video_url, flags=re.IGNORECASE):
-                ogg_url_list.append(video_url)
+            if re.search(word_re, candidate_url, flags=re.IGNORECASE):
+                ogg_url_list.append(candidate_url)
         ogg_url_list = uniqify_list(ogg_url_list)
         for url_to_get in ogg_url_list:
             # We may have to add a scheme or a scheme and host
@@ -124,21 +100,8 @@ class WiktionaryDownloader(AudioDownloader):
             entry.file_extension = self.file_extension
             self.downloads_list.append(entry)
 
-    def maybe_get_icon(self):
-        if self.site_icon:
-            return
-        if not with_pyqt:
-            self.site_icon = None
-            return
+    def fetch_icon(self):
         try:
-            icon_data = self.get_data_from_url(self.full_icon_url)
+            return self.fetch_icon_from_url(self.full_icon_url)
         except:
-            AudioDownloader.maybe_get_icon(self)
-        else:
-            self.site_icon = QImage.fromData(icon_data)
-            max_size = QSize(self.max_icon_size, self.max_icon_size)
-            ico_size = self.site_icon.size()
-            if ico_size.width() > max_size.width() \
-                    or ico_size.height() > max_size.height():
-                self.site_icon = self.site_icon.scaled(
-                    max_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            return AudioDownloader.fetch_icon(self)
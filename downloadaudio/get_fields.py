@@ -7,6 +7,10 @@
 
 """
 Extract field data to download.
+
+Which field the text for an audio field comes from only depends on
+the note type and the template, so we work that out once per note
+type, template and side and keep it until the note type changes.
 """
 
 from collections import namedtuple
@@ -55,22 +59,13 @@ def uniqify_list(seq):
     return no_dupes
 
 
-def field_data(note, audio_field, reading=False):
-    u"""Return FieldData when we have a source field
-
-    Return FieldData when we have a matching source field for our
-    audio field.  """
-    def return_data(idx):
-        source_name = field_names[idx]
-        if reading:
-            return JapaneseFieldData(
-                source_name, audio_field, note[source_name])
-        else:
-            return FieldData(
-                source_name, audio_field, note[source_name])
+def source_field_name(field_names, audio_field, reading=False):
+    u"""Return the name of the source field for our audio field
 
+    Look through the field_names of a note type for the field we
+    take the text for audio_field from. Raise a KeyError when there
+    is none."""
     a_name = audio_field.lower()
-    field_names = [item[0] for item in note.items()]
     f_names = [fn.lower() for fn in field_names]
     # First, look for just audio fields
     for afk in audio_field_keys:
@@ -82,13 +77,13 @@ def field_data(note, audio_field, reading=False):
             for cnd in sources_list:
                 for idx, lname in enumerate(f_names):
                     if cnd == lname:
-                        return return_data(idx)
+                        return field_names[idx]
             # At this point: The target name is good, but we found no
             # source name.
             if not reading:
                 # Don't give for most languages. Simply use the first
                 # field. That should work for a lot of people
-                return return_data(0)
+                return field_names[0]
             else:
                 # But that doesn't really work for Japanese.
                 raise KeyError('No source name found (case 1)')
@@ -117,7 +112,7 @@ def field_data(note, audio_field, reading=False):
         for cnd in sources_list:
             for idx, lname in enumerate(f_names):
                 if cnd == lname:
-                    return return_data(idx)
+                    return field_names[idx]
         # We do have audio or sound as sub-string but did not find a
         # maching field.
         raise KeyError('No source field found. (case 2)')
@@ -125,62 +120,130 @@ def field_data(note, audio_field, reading=False):
     raise KeyError('No source field found. (case 3)')
 
 
-def field_data_from_kanji_kana(note, fn):
-    # Do the search twice
-    base_fd = field_data(note, fn)
-    # base_fd contains the kanji
-    read_fd = field_data(note, fn, True)
-    # read_fd is the right type but needs to be updated.
-    read_fd.kanji = base_fd.word
-    read_fd.word = base_fd.word  # Not used, Set anyway.
-    read_fd.word_field_name = base_fd.word_field_name
-    return read_fd
+def field_data(note, audio_field, reading=False):
+    u"""Return FieldData when we have a source field
+
+    Return FieldData when we have a matching source field for our
+    audio field.  """
+    source_name = source_field_name(
+        [item[0] for item in note.items()], audio_field, reading)
+    if reading:
+        return JapaneseFieldData(source_name, audio_field, note[source_name])
+    return FieldData(source_name, audio_field, note[source_name])
+
+
+FieldSource = namedtuple(
+    'FieldSource', ['audio_field', 'word_field', 'reading_field'])
+# What to download for one audio field. word_field is None for a
+# reading download, reading_field None for a normal one. With both,
+# the kanji come from word_field and the kana from reading_field.
+
+_field_sources = {}
+# (note type id, template ord, side) -> (note type mod, list of
+# FieldSources). Template ord and side are None for whole notes.
+
+
+def field_sources(field_names, audio_field_names, reading_first):
+    u"""Return the FieldSources for the audio fields, in order."""
+    sources = []
+
+    def add_source(word=False, reading=False):
+        try:
+            sources.append(FieldSource(
+                audio_field,
+                source_field_name(field_names, audio_field)
+                if word else None,
+                source_field_name(field_names, audio_field, True)
+                if reading else None))
+        except KeyError:
+            # No source field.
+            pass
+
+    for audio_field in audio_field_names:
+        if not reading_first:
+            add_source(word=True)
+        add_source(word=split_kanji_kana, reading=True)
+        if reading_first:
+            add_source(word=True)
+    return sources
+
+
+def cached_field_sources(model, key, audio_field_names, reading_first):
+    u"""Return the FieldSources for the key, working them out once
+
+    audio_field_names is called with the list of field names of the
+    note type when we have nothing cached for the key. The cache is
+    renewed when the note type was changed."""
+    try:
+        mod, sources = _field_sources[key]
+    except KeyError:
+        pass
+    else:
+        if mod == model[u'mod']:
+            return sources
+    field_names = [fld[u'name'] for fld in model[u'flds']]
+    sources = field_sources(
+        field_names, audio_field_names(field_names), reading_first)
+    _field_sources[key] = (model[u'mod'], sources)
+    return sources
+
+
+def field_data_list_for(note, sources):
+    u"""Return the FieldDatas for the note from the FieldSources."""
+    field_data_list = []
+    for source in sources:
+        if source.reading_field is None:
+            field_data_list.append(FieldData(
+                source.word_field, source.audio_field,
+                note[source.word_field]))
+            continue
+        read_fd = JapaneseFieldData(
+            source.reading_field, source.audio_field,
+            note[source.reading_field])
+        if source.word_field is not None:
+            # Kanji from one field, kana from the other.
+            read_fd.kanji = FieldData(
+                source.word_field, source.audio_field,
+                note[source.word_field]).word
+            read_fd.word = read_fd.kanji  # Not used, Set anyway.
+            read_fd.word_field_name = source.word_field
+        field_data_list.append(read_fd)
+    return field_data_list
 
 
-def get_side_fields(card, note):
+def get_side_fields(card, note, side=None):
     u"""Return a list of FieldDatas for the currently visible side
 
     Go through the fields of the currently visible side and return
     relevant data, as FieldData objects, for audio fields where we
-    have matching text fields."""
-    if 'question' == mw.reviewer.state:
-        template = card.template()[u'qfmt']
+    have matching text fields. Pass 'question' or 'answer' as side to
+    look at that side instead."""
+    if side is None:
+        side = mw.reviewer.state
+    template = card.template()
+    if 'question' == side:
+        template_text = template[u'qfmt']
     else:
-        template = card.template()[u'afmt']
-    audio_field_names = []
-    all_field_names = [item[0] for item in note.items()]
-    for afk in audio_field_keys:
-        # Append all fields in the current template/side that contain
-        # 'audio' or 'sound'
-        audio_field_names += re.findall(
-            field_name_re % afk, template, flags=re.IGNORECASE)
-        # We use the (old style) % operator rather than
-        # unicode.format() because we look for {}s in the re, which
-        # would get more complicated with format().
-    audio_field_names = uniqify_list(audio_field_names)
-    # Filter out non-existing fields.
-    audio_field_names = [
-        fn for fn in audio_field_names if fn in all_field_names]
-    field_data_list = []
-    for audio_field in audio_field_names:
-        try:
-            field_data_list.append(field_data(note, audio_field))
-        except (KeyError, ValueError):
-            # No or empty reading field
-            pass
-        if not split_kanji_kana:
-            try:
-                field_data_list.append(
-                    field_data(note, audio_field, reading=True))
-            except (KeyError, ValueError):
-                pass
-        else:
-            try:
-                field_data_list.append(
-                    field_data_from_kanji_kana(note, audio_field))
-            except (KeyError, ValueError):
-                pass
-    return field_data_list
+        template_text = template[u'afmt']
+
+    def side_audio_field_names(all_field_names):
+        audio_field_names = []
+        for afk in audio_field_keys:
+            # Append all fields in the current template/side that
+            # contain 'audio' or 'sound'
+            audio_field_names += re.findall(
+                field_name_re % afk, template_text, flags=re.IGNORECASE)
+            # We use the (old style) % operator rather than
+            # unicode.format() because we look for {}s in the re, which
+            # would get more complicated with format().
+        audio_field_names = uniqify_list(audio_field_names)
+        # Filter out non-existing fields.
+        return [fn for fn in audio_field_names if fn in all_field_names]
+
+    model = note.model()
+    return field_data_list_for(note, cached_field_sources(
+        model, (model[u'id'], template[u'ord'], side),
+        side_audio_field_names, False))
 
 
 def get_note_fields(note):
@@ -189,28 +252,10 @@ def get_note_fields(note):
     Go through the note’s fields and return relevant data, as
     FieldData objects, for audio fields where we have matching text
     fields."""
-    field_names = [item[0] for item in note.items()]
-    field_data_list = []
-    for afk in audio_field_keys:
-        for fn in field_names:
-            if afk not in fn.lower():
-                continue
-            if not split_kanji_kana:
-                try:
-                    field_data_list.append(field_data(note, fn, reading=True))
-                except (KeyError, ValueError):
-                    # No or empty source field.
-                    pass
-            else:
-                try:
-                    field_data_list.append(
-                        field_data_from_kanji_kana(note, fn))
-                except (KeyError, ValueError):
-                    # No or empty source field.
-                    pass
-            try:
-                field_data_list.append(field_data(note, fn))
-            except (KeyError, ValueError):
-                # No or empty source field.
-                pass
-    return field_data_list
+    def note_audio_field_names(field_names):
+        return [fn for afk in audio_field_keys for fn in field_names
+                if afk in fn.lower()]
+
+    model = note.model()
+    return field_data_list_for(note, cached_field_sources(
+        model, (model[u'id'], None, None), note_audio_field_names, True))
@@ -0,0 +1,366 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+A crash-safe journal for the batch downloads.
+
+Every step of every downloaded file is written to an SQLite
+database: note id, audio field, site, URL, temp file path, hash and
+state. When a run is restarted after a crash, the notes that are
+done are skipped, and files that were already downloaded and
+processed are used again instead of being downloaded again. Temp files
+nobody knows about any more are removed.
+"""
+
+from collections import namedtuple
+import glob
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from .audio_info import AudioInfo, audio_infos
+from .blacklist import file_sha256
+from .download_entry import Action, DownloadEntry
+
+orphan_age = 6 * 60 * 60
+# Seconds. Temp files older than this that are not in the journal are
+# removed. Younger files may belong to a download that is running.
+temp_file_pattern = u'anki_audio_*'
+
+schema = u'''
+create table if not exists runs (
+  id integer primary key,
+  description text not null,
+  started real not null,
+  finished real
+);
+create table if not exists notes (
+  run integer not null,
+  nid integer not null,
+  state text not null,
+  primary key (run, nid)
+);
+create table if not exists entries (
+  id integer primary key,
+  run integer not null,
+  nid integer not null,
+  audio_field text,
+  site text,
+  url text,
+  temp_path text,
+  hash text,
+  state text not null,
+  data text,
+  modified real not null,
+  task_index integer
+);
+create index if not exists ix_entries_run_nid on entries (run, nid);
+'''
+
+
+class EntryStep(object):
+    u"""The states of a file in the journal."""
+    Downloaded = u'downloaded'
+    Processed = u'processed'
+    Added = u'added'
+    Kept = u'kept'
+    Deleted = u'deleted'
+
+
+live_steps = (EntryStep.Downloaded, EntryStep.Processed)
+# Files in these states are still temp files.
+
+action_steps = {
+    Action.Add: EntryStep.Added, Action.Keep: EntryStep.Kept,
+    Action.Delete: EntryStep.Deleted, Action.Blacklist: EntryStep.Deleted}
+
+
+JournalFieldData = namedtuple(
+    'JournalFieldData', ['word', 'word_field_name', 'audio_field_name'])
+# What a DownloadEntry needs of a FieldData, from the journal.
+
+
+def file_hash(path):
+    u"""Return the hex SHA-256 of the file."""
+    return file_sha256(path).hexdigest()
+
+
+class ReattachedEntry(DownloadEntry):
+    u"""A processed file from an earlier run, rebuilt from the journal."""
+    def __init__(self, data, file_path, hex_digest, task_index=None):
+        DownloadEntry.__init__(
+            self, JournalFieldData(
+                data['word'], data['word_field_name'],
+                data['audio_field_name']),
+            file_path, data['extras'], None)
+        self.file_extension = data['file_extension']
+        self.action = data['action']
+        self.duration = data['duration']
+        if data.get('audio_info'):
+            self.audio_info = AudioInfo(*data['audio_info'])
+        else:
+            # Journals from before we had them.
+            self.audio_info = audio_infos.lookup(hex_digest)
+        self.content_hash = hex_digest
+        self.site = data['site']
+        self.url = data['url']
+        self.reattached_base_name = data['base_name']
+        self.reattached_display_word = data['display_word']
+        self.journal_id = None
+        self.task_index = task_index
+
+    @property
+    def base_name(self):
+        return self.reattached_base_name
+
+    @property
+    def display_word(self):
+        return self.reattached_display_word
+
+    def start_processing(self, background=False):
+        # Done in the earlier run.
+        return None
+
+
+class Journal(object):
+    u"""The journal of batch runs, in an SQLite file."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # The workers write here, too.
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # With a write-ahead log, a commit is an append to the log
+        # and a sync only at checkpoints.
+        self.db.execute(u'pragma journal_mode=wal')
+        self.db.execute(u'pragma synchronous=normal')
+        self.db.executescript(schema)
+        if u'task_index' not in [
+                row[1] for row
+                in self.db.execute(u'pragma table_info(entries)')]:
+            # A journal from before we kept the order.
+            self.db.execute(
+                u'alter table entries add column task_index integer')
+        self.db.commit()
+        self.run_id = None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def unfinished_run(self, description):
+        u"""Return the id of an unfinished run of the same job, or None."""
+        with self.lock:
+            row = self.db.execute(
+                u'select id from runs where description = ? and finished '
+                u'is null order by started desc', (description,)).fetchone()
+        return row[0] if row else None
+
+    def resume_run(self, run_id):
+        self.run_id = run_id
+
+    def start_run(self, description):
+        u"""Start a new run. Abandon unfinished ones of the same job."""
+        old_run = self.unfinished_run(description)
+        if old_run is not None:
+            self.abandon_run(old_run)
+        with self.lock:
+            self.run_id = self.db.execute(
+                u'insert into runs (description, started) values (?, ?)',
+                (description, time.time())).lastrowid
+            self.db.commit()
+
+    def abandon_run(self, run_id):
+        u"""Remove the temp files of a run and mark it as finished."""
+        with self.lock:
+            rows = self.db.execute(
+                u'select temp_path from entries where run = ? and state in '
+                u'(?, ?)', (run_id,) + live_steps).fetchall()
+            for temp_path, in rows:
+                try:
+                    os.remove(temp_path)
+                except (OSError, TypeError):
+                    pass
+            self.db.execute(
+                u'update entries set state = ?, modified = ? where run = ? '
+                u'and state in (?, ?)',
+                (EntryStep.Deleted, time.time(), run_id) + live_steps)
+            self.db.execute(
+                u'update runs set finished = ? where id = ?',
+                (time.time(), run_id))
+            self.db.commit()
+
+    def finish_run(self):
+        with self.lock:
+            self.db.execute(
+                u'update runs set finished = ? where id = ?',
+                (time.time(), self.run_id))
+            self.db.commit()
+
+    def done_note_ids(self):
+        with self.lock:
+            return set(row[0] for row in self.db.execute(
+                u'select nid from notes where run = ?', (self.run_id,)))
+
+    def record(self, nid, entry, step):
+        u"""
+        Write a step of an entry.
+
+        This may be called from the worker threads. We write the hash
+        once the file is processed, as that is the file we keep. Only
+        that step is committed: a file that was just downloaded is
+        downloaded again after a crash anyway.
+        """
+        file_hash_ = None
+        if step == EntryStep.Processed:
+            file_hash_ = entry.content_hash
+            if file_hash_ is None:
+                try:
+                    file_hash_ = file_hash(entry.file_path)
+                except (IOError, OSError):
+                    pass
+        data = json.dumps(dict(
+            word=entry.word, word_field_name=entry.word_field_name,
+            audio_field_name=entry.audio_field_name,
+            file_extension=entry.file_extension, extras=entry.extras,
+            action=entry.action, duration=entry.duration,
+            audio_info=entry.audio_info, site=entry.site,
+            url=entry.url, base_name=entry.base_name,
+            display_word=entry.display_word))
+        with self.lock:
+            journal_id = getattr(entry, 'journal_id', None)
+            if journal_id is None:
+                entry.journal_id = self.db.execute(
+                    u'insert into entries (run, nid, audio_field, site, url, '
+                    u'temp_path, hash, state, data, modified, task_index) '
+                    u'values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (self.run_id, nid, entry.audio_field_name, entry.site,
+                     entry.url, entry.file_path, file_hash_, step, data,
+                     time.time(), entry.task_index)).lastrowid
+            else:
+                self.db.execute(
+                    u'update entries set temp_path = ?, '
+                    u'hash = coalesce(?, hash), state = ?, data = ?, '
+                    u'modified = ? where id = ?',
+                    (entry.file_path, file_hash_, step, data, time.time(),
+                     journal_id))
+            if step == EntryStep.Processed:
+                self.db.commit()
+
+    def observer(self, nid):
+        u"""Return a function to pass as a DownloadJob’s observer."""
+        # Import here to avoid a circular import at load time.
+        from .scheduler import EntryState
+
+        def observe(state, entry):
+            if state == EntryState.Pending:
+                self.record(nid, entry, EntryStep.Downloaded)
+            else:
+                self.record(nid, entry, EntryStep.Processed)
+        return observe
+
+    def notes_done(self, notes):
+        u"""
+        Write what we did with the entries and mark the notes done.
+
+        notes is a list of (note id, entries). Call this only once
+        the notes are written to the collection.
+        """
+        now = time.time()
+        with self.lock:
+            for nid, entries in notes:
+                for entry in entries:
+                    journal_id = getattr(entry, 'journal_id', None)
+                    if journal_id is None:
+                        continue
+                    self.db.execute(
+                        u'update entries set state = ?, modified = ? '
+                        u'where id = ?',
+                        (action_steps[entry.action], now, journal_id))
+                self.db.execute(
+                    u'insert or replace into notes (run, nid, state) '
+                    u'values (?, ?, ?)', (self.run_id, nid, u'done'))
+            self.db.commit()
+
+    def reattach(self, nid):
+        u"""
+        Return the processed entries of a note from an earlier try.
+
+        Only files that are still there and have the hash we wrote are
+        used. Return an empty list when anything is missing, so that
+        the note is downloaded again. The entries come in the order of
+        the job’s tasks, like DownloadJob.results() returns them, and
+        in the order the site gave them within a task.
+        """
+        with self.lock:
+            rows = self.db.execute(
+                u'select id, temp_path, hash, state, data, task_index '
+                u'from entries where run = ? and nid = ? and state in '
+                u'(?, ?) order by task_index, id',
+                (self.run_id, nid) + live_steps).fetchall()
+        entries = []
+        for journal_id, temp_path, hash_, state, data, task_index in rows:
+            if state != EntryStep.Processed or not hash_:
+                # Half done. Start over with this note.
+                return []
+            try:
+                if file_hash(temp_path) != hash_:
+                    return []
+            except (IOError, OSError, TypeError):
+                return []
+            entry = ReattachedEntry(
+                json.loads(data), temp_path, hash_, task_index)
+            entry.journal_id = journal_id
+            entries.append(entry)
+        return entries
+
+    def forget_note(self, nid):
+        u"""Drop the unfinished entries of a note we download again."""
+        with self.lock:
+            rows = self.db.execute(
+                u'select temp_path from entries where run = ? and nid = ? '
+                u'and state in (?, ?)', (self.run_id, nid) + live_steps)
+            for temp_path, in rows.fetchall():
+                try:
+                    os.remove(temp_path)
+                except (OSError, TypeError):
+                    pass
+            self.db.execute(
+                u'update entries set state = ?, modified = ? where run = ? '
+                u'and nid = ? and state in (?, ?)',
+                (EntryStep.Deleted, time.time(), self.run_id, nid)
+                + live_steps)
+            self.db.commit()
+
+    def collect_garbage(self):
+        u"""
+        Remove orphaned temp files.
+
+        Remove our temp files that are older than orphan_age and that
+        are not the live file of an unfinished run.
+        """
+        with self.lock:
+            live_paths = set(row[0] for row in self.db.execute(
+                u'select e.temp_path from entries e join runs r on '
+                u'e.run = r.id where r.finished is null and e.state in '
+                u'(?, ?)', live_steps))
+        now = time.time()
+        removed = 0
+        for path in glob.glob(
+                os.path.join(tempfile.gettempdir(), temp_file_pattern)):
+            if path in live_paths:
+                continue
+            try:
+                if now - os.path.getmtime(path) < orphan_age:
+                    continue
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+        return removed
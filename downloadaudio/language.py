@@ -7,6 +7,10 @@
 
 """
 Return a language code.
+
+The language of a deck is set in its options group. We read the
+languages of all decks once and keep them in deck_languages, until the
+options are saved again.
 """
 
 from collections import Counter
@@ -30,6 +34,65 @@ old_al_code_code = 'addon_foreign_language'
 # after all.)
 fl_code_code = 'addon_audio_download_language'
 
+lang_tag_re = re.compile(r'^lang_([a-z]{2,3})$', flags=re.IGNORECASE)
+
+
+class DeckLanguages(object):
+    u"""The download language of every deck, read once."""
+    def __init__(self):
+        self.col = None
+        self.languages = None
+        # deck id -> language code, or None when the options group has
+        # none (or the deck is a filtered deck)
+        self.missing = set()
+        # Deck ids we looked for in vain since the last load.
+
+    def load(self):
+        u"""Read the language of every deck."""
+        self.col = mw.col
+        self.languages = {}
+        self.missing = set()
+        conf_languages = {}
+        # options group id -> language code
+        for deck in self.col.decks.all():
+            if deck.get(u'dyn'):
+                self.languages[deck[u'id']] = None
+                continue
+            conf_id = deck[u'conf']
+            if conf_id not in conf_languages:
+                try:
+                    conf_languages[conf_id] = self.col.decks.confForDid(
+                        deck[u'id']).get(fl_code_code)
+                except (TypeError, AttributeError, AssertionError):
+                    conf_languages[conf_id] = None
+            self.languages[deck[u'id']] = conf_languages[conf_id]
+
+    def language(self, did):
+        u"""
+        Return the language code for the deck.
+
+        Raise a KeyError when the deck doesn’t exist, a ValueError
+        when it has no language.
+        """
+        if self.languages is None or mw.col is not self.col:
+            self.load()
+        if did not in self.languages and did not in self.missing:
+            # Maybe a new deck.
+            self.load()
+            if did not in self.languages:
+                self.missing.add(did)
+        lang = self.languages[did]
+        if not lang:
+            raise ValueError('No language set for deck')
+        return lang
+
+    def clear(self):
+        u"""Forget the languages. Call this when deck options change."""
+        self.languages = None
+
+
+deck_languages = DeckLanguages()
+
 
 def elect_language(note):
     u"""
@@ -39,10 +102,11 @@ def elect_language(note):
     them use.
     """
     votes = Counter()
-    for card in note.cards():
+    for did in mw.col.db.list(
+            u'select did from cards where nid = ?', note.id):
         try:
-            lang = mw.col.decks.confForDid(card.did)[fl_code_code]
-        except (TypeError, KeyError, AssertionError):
+            lang = deck_languages.language(did)
+        except (KeyError, ValueError):
             continue
         else:
             votes.update((lang, ))
@@ -62,14 +126,29 @@ def elect_language(note):
 def language_code_from_tags(note):
     u"""Get the language set by the user for individual notes."""
     for tag in note.tags:
-        try:
-            return re.search('^lang_([a-z]{2,3})$', tag,
-                             flags=re.IGNORECASE).group(1).lower()
-        except AttributeError:
-            continue
+        match = lang_tag_re.match(tag)
+        if match:
+            return match.group(1).lower()
     raise ValueError('No language tag found')
 
 
+def language_code_from_note(note):
+    u"""
+    Return a language code for a note without a card.
+
+    Use the lang_NN tag, or else the most popular language of the
+    note’s cards, or else the default language code.
+    """
+    try:
+        return language_code_from_tags(note)
+    except ValueError:
+        pass
+    try:
+        return elect_language(note)
+    except IndexError:
+        return default_audio_language_code
+
+
 def language_code_from_editor(note, card_edit):
     u"""
     Return a language code
@@ -96,9 +175,9 @@ def language_code_from_editor(note, card_edit):
         return language_code_from_card(mw.reviewer.card)
     if isinstance(edit_parent, AddCards):
         try:
-            return mw.col.decks.confForDid(
-                edit_parent.deckChooser.selectedId())[fl_code_code]
-        except (TypeError, KeyError):
+            return deck_languages.language(
+                edit_parent.deckChooser.selectedId())
+        except (KeyError, ValueError):
             return default_audio_language_code
     return default_audio_language_code
 
@@ -114,15 +193,17 @@ def language_code_from_card(card):
         return language_code_from_tags(note)
     except ValueError:
         pass
-    # Look at the deck conf. First get it.
+    # Look at the deck conf.
     try:
-        deck_conf = mw.col.decks.confForDid(card.did)
-    except AssertionError:
+        return deck_languages.language(card.did)
+    except KeyError:
         # Somehow it is possible to have notes with a did pointing
         # nowhere. (When you have deleted the deck they were created
         # in. Maybe there are more steps necessary.)
-        deck_conf = mw.col.decks.confForDid(1)
+        pass
+    except ValueError:
+        return default_audio_language_code
     try:
-        return deck_conf[fl_code_code]
-    except (TypeError, KeyError):
+        return deck_languages.language(1)
+    except (KeyError, ValueError):
         return default_audio_language_code
@@ -15,11 +15,80 @@ Helper function to deal with file names.
 import os
 import re
 import shutil
+import threading
 import unicodedata
 
 from aqt import mw
 from anki.utils import isMac, stripHTML
 
+from .blacklist import file_sha256
+from .dedup import media_hashes
+from .timing import Stage, timed
+
+
+def index_name(name):
+    u"""Return the name as we keep it in the index."""
+    return unicodedata.normalize('NFC', name.lower())
+
+
+class MediaNameIndex(object):
+    u"""
+    The names of the files in a folder, lower case and NFC normalized.
+
+    Looking for a free name used to mean reading the whole media
+    folder for every name we tried. Now we read it once, and again
+    only when its modification time changes. The files we add
+    ourselves go straight into the index.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        self.mtime = None
+        self.names = set()
+
+    def refresh(self, path):
+        u"""Read the folder again if it has changed."""
+        mtime = os.stat(path).st_mtime
+        if path == self.path and mtime == self.mtime:
+            return
+        self.names = set(index_name(fname) for fname in os.listdir(path))
+        self.path = path
+        self.mtime = mtime
+
+    def contains(self, path, name):
+        with self.lock:
+            self.refresh(path)
+            return index_name(name) in self.names
+
+    def add(self, path, name, old_mtime):
+        u"""
+        Add a file we have just put into the folder.
+
+        old_mtime is the modification time of the folder from just
+        before we did.
+        """
+        with self.lock:
+            if path != self.path:
+                return
+            self.names.add(index_name(name))
+            if old_mtime == self.mtime:
+                # Only our own change since we read the folder. Don’t
+                # read everything again because of it.
+                self.mtime = os.stat(path).st_mtime
+            else:
+                # Someone else changed the folder, too. Read it again
+                # next time.
+                self.mtime = None
+
+    def forget(self):
+        u"""Read the folder again next time."""
+        with self.lock:
+            self.mtime = None
+
+
+media_index = MediaNameIndex()
+# The index of the media folder.
+
 
 def free_media_name(base, end):
     u"""Return a useful media name
@@ -63,22 +132,40 @@ def exists_lc(path, name):
     # do on Macs, then.
     if isMac:
         return os.path.exists(os.path.join(path, name))
-    ln_name = unicodedata.normalize('NFC', name.lower())
-    for fname in os.listdir(path):
-        if unicodedata.normalize('NFC', fname.lower()) == ln_name:
-            return True
-    # After the loop, none found.
-    return False
+    return media_index.contains(path, name)
 
 
+@timed(Stage.ToMedia)
 def unmunge_to_mediafile(dl_entry):
     u"""
     Move the data to the media folder.
 
     Determine a free media name and move the data there from the
-    tempfile.
+    tempfile. When we already put the same file into the media
+    folder, remove the tempfile and use that name instead.
     """
+    mdir = mw.col.media.dir()
+    hex_digest = dl_entry.content_hash
+    if hex_digest is None:
+        # Not processed, so not hashed yet.
+        hex_digest = file_sha256(dl_entry.file_path).hexdigest()
+    old_name = media_hashes.lookup(mdir, hex_digest)
+    if old_name is not None:
+        os.remove(dl_entry.file_path)
+        return old_name
     media_path, media_file_name = free_media_name(
         dl_entry.base_name, dl_entry.file_extension)
+    if os.path.exists(media_path):
+        # Someone put a file there since we last read the folder. Look
+        # again.
+        media_index.forget()
+        media_path, media_file_name = free_media_name(
+            dl_entry.base_name, dl_entry.file_extension)
+        if os.path.exists(media_path):
+            raise ValueError('Could not find free name.')
+    size = os.path.getsize(dl_entry.file_path)
+    old_mtime = os.stat(os.path.dirname(media_path)).st_mtime
     shutil.move(dl_entry.file_path, media_path)
+    media_index.add(os.path.dirname(media_path), media_file_name, old_mtime)
+    media_hashes.record(mdir, hex_digest, media_file_name, size)
     return media_file_name
@@ -0,0 +1,85 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Write the new sound tags of many notes at once.
+
+note.flush() writes one note with its own SQL statement and its own
+card generation. When we fill hundreds of notes, that is mostly
+Python call overhead. The NoteWriter collects (note id, field name,
+text to append) instead, and writes all of them with one executemany,
+in the collection’s current transaction. The sort field, the checksum,
+mod and usn are updated like flush() does, and the cards are
+generated once for all notes.
+
+The fields are read from the database when we write, not from the
+Note objects, so nothing is lost when a note was changed meanwhile.
+"""
+
+from anki.utils import fieldChecksum, ids2str, intTime, joinFields, \
+    splitFields, stripHTMLMedia
+
+
+class NoteWriter(object):
+    u"""Text to append to the fields of many notes."""
+    def __init__(self, col):
+        self.col = col
+        self.appends = {}
+        # note id -> list of (field name, text)
+
+    def append(self, note_id, field_name, text):
+        self.appends.setdefault(note_id, []).append((field_name, text))
+
+    def __len__(self):
+        u"""The number of notes with something to write."""
+        return len(self.appends)
+
+    def write(self):
+        u"""
+        Append the texts to the notes. Return the ids of the notes changed.
+
+        Fields that no longer exist, e.g. after a change of the note
+        type, are skipped.
+        """
+        if not self.appends:
+            return []
+        models = {}
+        # mid -> (field map, sort field index)
+        usn = self.col.usn()
+        mod = intTime()
+        rows = []
+        for note_id, mid, flds in self.col.db.execute(
+                u'select id, mid, flds from notes where id in '
+                + ids2str(self.appends)):
+            if mid not in models:
+                model = self.col.models.get(mid)
+                models[mid] = (
+                    self.col.models.fieldMap(model),
+                    self.col.models.sortIdx(model))
+            field_map, sort_idx = models[mid]
+            fields = splitFields(flds)
+            changed = False
+            for field_name, text in self.appends[note_id]:
+                try:
+                    fields[field_map[field_name][0]] += text
+                except KeyError:
+                    continue
+                changed = True
+            if changed:
+                rows.append((
+                    joinFields(fields), stripHTMLMedia(fields[sort_idx]),
+                    fieldChecksum(fields[0]), mod, usn, note_id))
+        self.appends = {}
+        if not rows:
+            return []
+        self.col.db.executemany(
+            u'update notes set flds = ?, sfld = ?, csum = ?, mod = ?, '
+            u'usn = ? where id = ?', rows)
+        note_ids = [row[-1] for row in rows]
+        # Like Note.flush(): new text may make new cards.
+        self.col.genCards(note_ids)
+        return note_ids
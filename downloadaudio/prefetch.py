@@ -0,0 +1,158 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Download audio for the next cards while the user reviews.
+
+When prefetching is on, we look at the next few cards every time a
+question is shown. For each side of those cards whose audio fields are
+all empty, a background DownloadJob downloads and processes the files.
+It runs in the scheduler’s small background pool and only starts
+requests on sites no download the user waits for is using. A request
+it has already started still runs to its end, though, and takes its
+share of the host’s rate limit and of the processing. The files stay
+in the temp folder.
+
+When the user presses t on such a card, the review dialog gets the
+prefetched job, made a foreground job, and shows what it found at
+once. Nothing goes into the note or the media folder before the user
+says so in that dialog. Jobs for cards that are no longer coming up
+are cancelled and their files deleted.
+
+Anki has no public way to look ahead in the review queues, so we peek
+at the queues of the scheduler. When that fails, we just don’t
+prefetch.
+"""
+
+from aqt import mw
+from anki.hooks import addHook
+
+prefetch_enabled = False
+# Set to True to start with prefetching on. It can also be switched on
+# and off in the Edit → Media menu.
+look_ahead = 3
+# Number of upcoming cards we download for.
+prefetch_deadline = 5 * 60
+# Seconds. Background jobs do their requests one after the other, so
+# they get more time.
+
+sides = ('question', 'answer')
+
+
+def side_key(field_data_list):
+    u"""Return what identifies the download for the fields of a side."""
+    return tuple((fd.audio_field_name, fd.word)
+                 for fd in field_data_list if not fd.empty)
+
+
+def upcoming_card_ids(count):
+    u"""Return the ids of about the next count cards to be reviewed."""
+    sched = mw.col.sched
+    card_ids = []
+    try:
+        # Learning cards that are due come first. The review and new
+        # queues are popped from the end.
+        card_ids += [card_id for __, card_id in sorted(sched._lrnQueue)]
+        card_ids += list(reversed(sched._revQueue))
+        card_ids += list(reversed(sched._newQueue))
+    except (AttributeError, TypeError, ValueError):
+        return []
+    current_id = mw.reviewer.card.id if mw.reviewer.card else None
+    upcoming_ids = []
+    for card_id in card_ids:
+        if card_id != current_id and card_id not in upcoming_ids:
+            upcoming_ids.append(card_id)
+        if len(upcoming_ids) >= count:
+            break
+    return upcoming_ids
+
+
+class Prefetcher(object):
+    u"""The background jobs for the next cards."""
+    def __init__(self):
+        self.jobs = {}
+        # (card id, side_key) -> DownloadJob
+
+    def update(self):
+        u"""Start jobs for the next cards, drop those for cards gone."""
+        if not prefetch_enabled or not mw.reviewer.card:
+            self.clear()
+            return
+        upcoming_ids = upcoming_card_ids(look_ahead)
+        keep_ids = set(upcoming_ids)
+        keep_ids.add(mw.reviewer.card.id)
+        for key in list(self.jobs):
+            if key[0] not in keep_ids:
+                self.drop(key)
+        for card_id in upcoming_ids:
+            self.prefetch_card(mw.col.getCard(card_id))
+
+    def prefetch_card(self, card):
+        u"""Start a job for each side with only empty audio fields."""
+        # Import here, so that the downloaders are only loaded when we
+        # need them.
+        from .get_fields import get_side_fields
+        from .language import language_code_from_card
+        from .scheduler import DownloadJob
+        note = card.note()
+        for side in sides:
+            field_data_list = [
+                fd for fd in get_side_fields(card, note, side)
+                if not fd.empty]
+            if not field_data_list or any(
+                    note[fd.audio_field_name].strip()
+                    for fd in field_data_list):
+                continue
+            key = (card.id, side_key(field_data_list))
+            if key in self.jobs:
+                # Both sides show the same fields, or we already have it.
+                continue
+            job = DownloadJob(
+                field_data_list, language_code_from_card(card),
+                background=True, deadline=prefetch_deadline)
+            job.start()
+            self.jobs[key] = job
+
+    def take(self, card, field_data_list):
+        u"""
+        Return the prefetched job for these fields of the card, or None.
+
+        The job belongs to the caller then, who has to cancel it. It is
+        a foreground job now: the user waits for it.
+        """
+        job = self.jobs.pop((card.id, side_key(field_data_list)), None)
+        if job is not None:
+            job.promote()
+        return job
+
+    def drop(self, key):
+        u"""Cancel a job and delete its files."""
+        from .scheduler import remove_file
+        job = self.jobs.pop(key)
+        job.cancel()
+        for entry in job.results():
+            remove_file(entry)
+
+    def clear(self):
+        for key in list(self.jobs):
+            self.drop(key)
+
+
+prefetcher = Prefetcher()
+# The one prefetcher.
+
+
+def set_prefetch_enabled(enabled):
+    u"""Switch prefetching on or off."""
+    global prefetch_enabled
+    prefetch_enabled = enabled
+    if not enabled:
+        prefetcher.clear()
+
+
+addHook('showQuestion', prefetcher.update)
+addHook('reviewCleanup', prefetcher.clear)
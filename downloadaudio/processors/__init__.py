@@ -8,13 +8,46 @@
 u"""
 One just moves files and isn’t used. The other does simple audio
 processing and nmoves the files.
+
+There are two ways to do the processing: with pydub (the default)
+or with one run of ffmpeg per file.
+
+pydub is only imported at the first download, with load_processor(),
+so that it doesn’t slow down the start of Anki.
 """
 
-try:
-    from pydub.silence import detect_nonsilent
-    # Look for a reasonable new pydub
-except ImportError:
-    processor = None
-else:
-    from .audio_processor import AudioProcessor
-    processor = AudioProcessor()
+import threading
+
+processor_backend = 'pydub'
+# Use 'ffmpeg' to process the files with the ffmpeg program directly.
+# When we can’t find ffmpeg, we use pydub. Use None to not process the
+# files at all.
+
+processor = None
+# The processor, once load_processor() was called. None when we can’t
+# process.
+processor_loaded = False
+_load_lock = threading.Lock()
+
+
+def load_processor():
+    u"""Return the processor, creating it the first time, or None."""
+    global processor, processor_loaded
+    with _load_lock:
+        if processor_loaded:
+            return processor
+        if processor_backend == 'ffmpeg':
+            from .ffmpeg_processor import FfmpegProcessor, have_ffmpeg
+            if have_ffmpeg():
+                processor = FfmpegProcessor()
+        if processor is None and processor_backend is not None:
+            try:
+                from pydub.silence import detect_nonsilent
+                # Look for a reasonable new pydub
+            except ImportError:
+                processor = None
+            else:
+                from .audio_processor import AudioProcessor
+                processor = AudioProcessor()
+        processor_loaded = True
+        return processor
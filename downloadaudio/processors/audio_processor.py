@@ -11,10 +11,14 @@ Process an audio file.
 
 
 from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
 from pydub.silence import detect_nonsilent
 import os
 import tempfile
 
+from . import numpy_trim
+from ..audio_info import AudioInfo, level, silence_ratio
+
 load_functions = {
     'mp3': AudioSegment.from_mp3, 'ogg': AudioSegment.from_ogg,
     'wav': AudioSegment.from_wav}
@@ -29,6 +33,9 @@ silence_fade_length = 100  # Quick fade in and out where we found silence
 rapid_fade_length = 20
 # Rapid fade in and at the beginning or end. Mostly to avoid the click
 # of a DC offset.
+use_numpy = True
+# Look for silence with NumPy when we have it. Much faster for longer
+# files. Set to False to use pydub’s own detect_nonsilent.
 
 
 class AudioProcessor(object):
@@ -41,6 +48,8 @@ class AudioProcessor(object):
     # That was gone temporarily. Now we do something similar
     # again. Check __init__ and DownloadEntry.process. That checks if
     # there *is* a processor, rather than ask if it is useful.
+    decode_errors = (CouldntDecodeError,)
+    # What we get for a file we can’t use. The entry is deleted.
 
     def process(self, dl_entry):
         """Make new audio file in the media directory.
@@ -48,16 +57,51 @@ class AudioProcessor(object):
         Take the audio file pointed to by dl_entry, normalize, remove silence,
         convert to output_format.
         """
-        input_format = dl_entry.file_extension.lstrip('.')
+        new_fp, new_sffx, dl_entry.audio_info = self.process_file(
+            dl_entry.file_path, dl_entry.file_extension)
+        dl_entry.duration = dl_entry.audio_info.duration
+        return new_fp, new_sffx
+
+    def process_file(self, file_path, file_extension):
+        u"""Process the file, return new path, suffix and AudioInfo.
+
+        This is the work of process(), without the DownloadEntry, so
+        that it can be sent to another process.
+        """
+        input_format = file_extension.lstrip('.')
         try:
             loader = load_functions[input_format]
         except KeyError:
             loader = lambda file: AudioSegment.from_file(
                 file=file, format=input_format)
-        segment = loader(dl_entry.file_path) # This
+        segment = loader(file_path) # This
         # sometimes raised a pydub.exceptions.CouldntDecodeError
+        peak, rms = level(segment.max_dBFS), level(segment.dBFS)
+        full_length = len(segment)
         segment = segment.normalize()  # First normalize
-        # Try to remove silence
+        segment = self.trim(segment)
+        info = AudioInfo(
+            len(segment) / 1000.0, peak, rms,
+            silence_ratio(len(segment), full_length))
+        # Now write
+        tof = tempfile.NamedTemporaryFile(
+            delete=False, suffix=output_suffix, prefix=u'anki_audio_')
+        temp_out_file_name = tof.name
+        tof.close()
+        segment.export(temp_out_file_name, output_format)
+        os.unlink(file_path)  # Get rid of unprocessed version
+        return temp_out_file_name, output_suffix, info
+
+    def trim(self, segment):
+        u"""Remove silence at the start and end, fade in and out."""
+        if use_numpy and numpy_trim.can_trim(segment):
+            return numpy_trim.trim(
+                segment, silence_threshold, minimum_silence_length,
+                silence_fade_length, rapid_fade_length)
+        return self.trim_pydub(segment)
+
+    def trim_pydub(self, segment):
+        u"""Remove silence and fade, the slow way."""
         loud_pos = detect_nonsilent(
             segment, min_silence_len=minimum_silence_length,
             silence_thresh=silence_threshold)
@@ -71,12 +115,4 @@ class AudioProcessor(object):
                 fade_out_length = silence_fade_length
             if loud_p[0] > 0 or loud_p[1] < len(segment):
                 segment = segment[loud_p[0] : loud_p[1]]
-        segment = segment.fade_in(fade_in_length).fade_out(fade_out_length)
-        # Now write
-        tof = tempfile.NamedTemporaryFile(
-            delete=False, suffix=output_suffix, prefix=u'anki_audio_')
-        temp_out_file_name = tof.name
-        tof.close()
-        segment.export(temp_out_file_name, output_format)
-        os.unlink(dl_entry.file_path)  # Get rid of unprocessed version
-        return temp_out_file_name, output_suffix
+        return segment.fade_in(fade_in_length).fade_out(fade_out_length)
@@ -0,0 +1,152 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Process an audio file with one run of ffmpeg.
+
+The pydub AudioProcessor decodes the whole file to a temp file, loads
+that into memory, normalizes, cuts and fades in Python and writes
+another temp file for the encoder. Here ffmpeg does all of that in one
+filter graph, reading the download and writing the FLAC file.
+
+The results are close to, but not quite the same as, the pydub ones.
+We normalize the loudness (EBU R128) rather than the peak, and as we
+don’t know in advance where the silence is, we keep a little of it
+and always use the rapid fade. The levels for the AudioInfo come from
+an astats filter at the start of the graph.
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from ..audio_info import AudioInfo, level, silence_ratio
+
+ffmpeg_command = 'ffmpeg'
+# Name or full path of the ffmpeg program.
+output_format = 'flac'
+output_suffix = '.' + output_format
+output_sample_rate = 44100
+# loudnorm works at 192 kHz. Go back to something normal.
+target_loudness = -16
+# LUFS. Use lower values for quieter files.
+silence_threshold = -30
+# dB, like in audio_processor. Use lower values like -40, -50 when
+# stuff gets cut off.
+minimum_silence_length = 150
+# Milliseconds. The window we measure the loudness in.
+silence_fade_length = 100
+# Milliseconds of silence we keep before and after the sound.
+rapid_fade_length = 20
+# Rapid fade in and out. Mostly to avoid the click of a DC offset.
+
+time_re = re.compile(r'^out_time_(?:us|ms)=(\d+)$', re.MULTILINE)
+# ffmpeg -progress output. out_time_ms is in microseconds, too.
+input_duration_re = re.compile(
+    r'Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)')
+peak_re = re.compile(r'Peak level dB: (\S+)')
+rms_re = re.compile(r'RMS level dB: (\S+)')
+# astats output. The overall values come after those of the channels.
+
+
+class FfmpegError(Exception):
+    u"""ffmpeg couldn’t read or process a file."""
+    pass
+
+
+def have_ffmpeg():
+    u"""Whether we can find the ffmpeg program."""
+    return shutil.which(ffmpeg_command) is not None
+
+
+def trim_filter():
+    u"""Return the filter that removes the silence at the start."""
+    return (
+        'silenceremove=start_periods=1:start_threshold={threshold}dB:'
+        'start_silence={keep:.3f}:detection=rms:window={window:.3f}'.format(
+            threshold=silence_threshold, keep=silence_fade_length / 1000.0,
+            window=minimum_silence_length / 1000.0))
+
+
+def filter_graph():
+    u"""
+    Return the whole ffmpeg audio filter.
+
+    Measure, normalize, cut the silence at the start, then turn the
+    sound around to do the same at the end. The fade out is a fade in
+    of the reversed sound.
+    """
+    fade_in = 'afade=t=in:d={0:.3f}'.format(rapid_fade_length / 1000.0)
+    return ','.join([
+        'astats', 'loudnorm=I={0}'.format(target_loudness),
+        'aresample={0}'.format(output_sample_rate),
+        trim_filter(), fade_in, 'areverse', trim_filter(), fade_in,
+        'areverse'])
+
+
+def audio_info(log_text, duration):
+    u"""Return the AudioInfo from ffmpeg’s log and the output duration."""
+    def last_level(level_re):
+        levels = level_re.findall(log_text)
+        try:
+            return level(float(levels[-1]))
+        except (IndexError, ValueError):
+            return None
+    input_duration = input_duration_re.search(log_text)
+    silence = None
+    if input_duration and duration is not None:
+        hours, minutes, seconds = input_duration.groups()
+        silence = silence_ratio(
+            duration, int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+    return AudioInfo(
+        duration, last_level(peak_re), last_level(rms_re), silence)
+
+
+class FfmpegProcessor(object):
+    u"""Class to do the audio processing with ffmpeg."""
+    decode_errors = (FfmpegError,)
+    # What we get for a file we can’t use. The entry is deleted.
+
+    def process(self, dl_entry):
+        """Make new audio file, in one go.
+
+        Take the audio file pointed to by dl_entry, normalize, remove
+        silence, convert to output_format.
+        """
+        new_fp, new_sffx, dl_entry.audio_info = self.process_file(
+            dl_entry.file_path, dl_entry.file_extension)
+        dl_entry.duration = dl_entry.audio_info.duration
+        return new_fp, new_sffx
+
+    def process_file(self, file_path, file_extension):
+        u"""Process the file, return new path, suffix and AudioInfo."""
+        tof = tempfile.NamedTemporaryFile(
+            delete=False, suffix=output_suffix, prefix=u'anki_audio_')
+        temp_out_file_name = tof.name
+        tof.close()
+        command = [
+            ffmpeg_command, '-nostdin', '-hide_banner', '-loglevel', 'info',
+            '-y', '-i', file_path, '-vn', '-af', filter_graph(),
+            '-c:a', output_format, '-progress', 'pipe:1', '-nostats',
+            temp_out_file_name]
+        try:
+            result = subprocess.run(
+                command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        except OSError as ose:
+            os.unlink(temp_out_file_name)
+            raise FfmpegError(u'Could not run ffmpeg: {0}'.format(ose))
+        if result.returncode != 0:
+            os.unlink(temp_out_file_name)
+            raise FfmpegError(result.stderr.decode('utf-8', 'replace'))
+        times = time_re.findall(result.stdout.decode('utf-8', 'replace'))
+        duration = int(times[-1]) / 1000000.0 if times else None
+        os.unlink(file_path)  # Get rid of unprocessed version
+        return temp_out_file_name, output_suffix, audio_info(
+            result.stderr.decode('utf-8', 'replace'), duration)
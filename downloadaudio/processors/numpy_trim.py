@@ -0,0 +1,162 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Remove silence and fade with NumPy.
+
+pydub.silence.detect_nonsilent() cuts a new AudioSegment for every
+millisecond of the file and computes its RMS. For a sentence of a few
+seconds that is thousands of slices. Here we look at the raw samples
+as a NumPy array and compute the RMS of all windows at once from a
+running sum of the squared samples.
+
+We look at the same windows with the same threshold as pydub. The RMS
+is cut to an integer, like audioop.rms() does for pydub, and for 8 and
+16 bit audio the sums are exact, so we find the same ranges. The fades
+are the same linear fades, done on the array, too.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+sample_types = {1: 'i1', 2: '<i2', 4: '<i4'}
+# numpy dtypes for the sample widths we know. 24 bit audio goes the
+# slow way.
+sum_types = {1: 'i8', 2: 'i8', 4: 'f8'}
+# What we add up the squared samples as. 64 bit integers are exact for
+# 8 and 16 bit samples, but would overflow for 32 bit ones.
+
+
+def can_trim(segment):
+    u"""Whether we can do this segment with NumPy."""
+    return numpy is not None and segment.sample_width in sample_types
+
+
+def samples_of(segment):
+    u"""Return the samples as a (frames, channels) array view."""
+    samples = numpy.frombuffer(
+        segment.raw_data, dtype=sample_types[segment.sample_width])
+    return samples.reshape(-1, segment.channels)
+
+
+def frame_index(ms, frame_rate):
+    u"""Return the index of the frame at ms milliseconds, like pydub."""
+    return ms * frame_rate // 1000
+
+
+def loud_ranges(segment, silence_threshold, minimum_silence_length):
+    u"""
+    Return the non-silent ranges of segment, in milliseconds.
+
+    This returns the same as pydub.silence.detect_nonsilent(segment,
+    minimum_silence_length, silence_threshold), with a seek step of
+    1 ms. For 32 bit audio the sums are floats, and a window right at
+    the threshold may come out differently.
+    """
+    length = len(segment)
+    if length < minimum_silence_length:
+        return [[0, length]]
+    frames = samples_of(segment)
+    frame_rate = segment.frame_rate
+    sum_type = sum_types[segment.sample_width]
+    squares = numpy.square(frames, dtype=sum_type).sum(axis=1)
+    running_sum = numpy.concatenate(
+        (numpy.zeros(1, dtype=sum_type), numpy.cumsum(squares)))
+    window_starts = numpy.arange(length - minimum_silence_length + 1)
+    first_frames = numpy.minimum(
+        frame_index(window_starts, frame_rate), len(frames))
+    end_frames = numpy.minimum(
+        frame_index(window_starts + minimum_silence_length, frame_rate),
+        len(frames))
+    sample_counts = (end_frames - first_frames) * segment.channels
+    threshold = 10 ** (silence_threshold / 20.0) \
+        * segment.max_possible_amplitude
+    # audioop.rms() truncates to an integer, so we do, too.
+    window_sums = running_sum[end_frames] - running_sum[first_frames]
+    silent_starts = numpy.flatnonzero(
+        numpy.floor(numpy.sqrt(
+            window_sums / numpy.maximum(sample_counts, 1).astype(
+                numpy.float64))) <= threshold)
+    if not len(silent_starts):
+        return [[0, length]]
+    # Windows that overlap or touch make one silent range.
+    breaks = numpy.flatnonzero(
+        numpy.diff(silent_starts) > minimum_silence_length)
+    range_starts = numpy.concatenate(
+        ([silent_starts[0]], silent_starts[breaks + 1]))
+    range_ends = numpy.concatenate(
+        (silent_starts[breaks], [silent_starts[-1]])) \
+        + minimum_silence_length
+    silent_ranges = [
+        [int(start), int(end)] for start, end in zip(range_starts, range_ends)]
+    if silent_ranges[0] == [0, length]:
+        return []
+    nonsilent_ranges = []
+    previous_end = 0
+    for start, end in silent_ranges:
+        nonsilent_ranges.append([previous_end, start])
+        previous_end = end
+    if previous_end != length:
+        nonsilent_ranges.append([previous_end, length])
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+    return nonsilent_ranges
+
+
+def fade(samples, frame_count, fade_in):
+    u"""
+    Fade the first or last frame_count frames of samples in place.
+
+    This is pydub’s precise fade between -120 dB and 0 dB: the gain
+    goes up (or down) linearly, one step per frame.
+    """
+    frame_count = min(frame_count, len(samples))
+    if frame_count <= 0:
+        return
+    low_gain = 10 ** (-120 / 20.0)
+    gains = low_gain + (1.0 - low_gain) / frame_count \
+        * numpy.arange(frame_count)
+    if fade_in:
+        part = samples[:frame_count]
+    else:
+        gains = gains[::-1]
+        part = samples[-frame_count:]
+    info = numpy.iinfo(samples.dtype)
+    part[...] = numpy.clip(
+        numpy.floor(part * gains[:, numpy.newaxis]), info.min, info.max)
+
+
+def trim(segment, silence_threshold, minimum_silence_length,
+         silence_fade_length, rapid_fade_length):
+    u"""
+    Remove the silence at the start and end and fade in and out.
+
+    Return the new segment. This does the same as the pydub code in
+    AudioProcessor.trim_pydub().
+    """
+    loud_pos = loud_ranges(segment, silence_threshold, minimum_silence_length)
+    fade_in_length = rapid_fade_length
+    fade_out_length = rapid_fade_length
+    frame_rate = segment.frame_rate
+    frames = samples_of(segment)
+    first_frame = 0
+    end_frame = len(frames)
+    if len(loud_pos) == 1:
+        loud_p = loud_pos[0]
+        if loud_p[0] > silence_fade_length:
+            fade_in_length = silence_fade_length
+        if loud_p[1] < len(segment) - silence_fade_length:
+            fade_out_length = silence_fade_length
+        if loud_p[0] > 0 or loud_p[1] < len(segment):
+            first_frame = frame_index(loud_p[0], frame_rate)
+            end_frame = frame_index(loud_p[1], frame_rate)
+    samples = frames[first_frame:end_frame].copy()
+    fade(samples, frame_index(fade_in_length, frame_rate), True)
+    fade(samples, frame_index(fade_out_length, frame_rate), False)
+    return segment._spawn(samples.tobytes())
@@ -0,0 +1,177 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Run the audio processing in several processes.
+
+Decoding, normalizing, looking for silence and encoding to FLAC is
+CPU-bound work that holds the GIL most of the time. Once the downloads
+run concurrently it is what we wait for. So send the files to a pool
+of worker processes, one per core but one.
+
+Starting new processes only works reliably where we can fork: inside
+Anki on Windows and Mac, sys.executable is Anki itself. There we use a
+thread pool of the same size instead. That is also why we don’t use
+the spawn start method: it would start Anki’s main script, and with it
+this add-on’s __init__, in every worker.
+
+Forking a Qt program is only safe when the child doesn’t use anything
+another thread may have held at the fork. So:
+
+* All workers are forked in start(), from the main thread. That is
+  called by the first DownloadJob.start(), before that job submits
+  anything. None of our own threads exist then: the download pools
+  and the icon threads start later. (The pool’s own manager thread
+  may start between two forks. concurrent.futures is made for that.)
+  Anki’s threads, like the media server, do their own work with their
+  own locks.
+* A worker only runs process_file(): pydub, NumPy, ffmpeg and
+  hashlib. It never touches Qt, the collection, our SQLite files or
+  our locks. Python resets the import lock in the child, and the
+  workers end with os._exit(), so no atexit handler of Anki or of
+  ours runs there.
+* When start() is called from another thread, we use threads, too.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import sys
+import threading
+import time
+
+from ..blacklist import file_sha256
+
+use_processes = True
+# Set to False to process in threads everywhere.
+max_workers = max(1, (os.cpu_count() or 2) - 1)
+# Number of files processed at the same time.
+max_queued = 2 * max_workers
+# Number of files waiting or being processed. This bounds the memory
+# used for decoded audio. More requests wait until there is room.
+background_queued = 1
+# Number of files of background jobs waiting or being processed. They
+# don’t take from max_queued, so foreground files never wait for them.
+fork_timeout = 10
+# Seconds we wait for the workers to start.
+
+
+def process_file(file_path, file_extension):
+    u"""
+    Process one file, in a worker.
+
+    Return the new path, suffix and AudioInfo, the hex SHA-256 of the
+    new file and the time it took in seconds. We hash here, so that
+    this is done in parallel, too.
+    """
+    # Import here, so that we don’t need a processor to import the pool.
+    from . import load_processor
+    start_time = time.time()
+    new_fp, new_sffx, info = load_processor().process_file(
+        file_path, file_extension)
+    hex_digest = file_sha256(new_fp).hexdigest()
+    return new_fp, new_sffx, info, hex_digest, time.time() - start_time
+
+
+def wait_for_workers(barrier):
+    u"""Wait in each new worker until all workers are forked."""
+    try:
+        barrier.wait(fork_timeout)
+    except threading.BrokenBarrierError:
+        # Some didn’t start. The pool will fork them when needed.
+        pass
+
+
+def can_fork():
+    u"""Whether we can (and want to) use worker processes."""
+    if not use_processes or getattr(sys, 'frozen', False):
+        return False
+    if threading.current_thread() is not threading.main_thread():
+        # See the module doc string.
+        return False
+    # Import here. multiprocessing takes a while, and we may never
+    # need it.
+    import multiprocessing
+    return 'fork' in multiprocessing.get_all_start_methods() \
+        and sys.platform != 'darwin'
+
+
+class ProcessingPool(object):
+    u"""The pool of workers for the audio processing."""
+    def __init__(self):
+        self.executor = None
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_queued)
+        self.background_slots = threading.BoundedSemaphore(
+            background_queued)
+
+    def start(self):
+        u"""
+        Create the workers when needed.
+
+        Call this from the main thread before the download threads
+        start. Forking while other threads hold locks is asking for
+        trouble. So we fork all the workers here, rather than leave
+        that to the first submit, and only from the main thread. Called
+        first from any other thread, this makes a thread pool.
+        """
+        with self.lock:
+            if self.executor is not None:
+                return self.executor
+            if can_fork():
+                from concurrent.futures import ProcessPoolExecutor
+                import multiprocessing
+                context = multiprocessing.get_context('fork')
+                barrier = context.Barrier(max_workers)
+                try:
+                    self.executor = ProcessPoolExecutor(
+                        max_workers=max_workers, mp_context=context,
+                        initializer=wait_for_workers, initargs=(barrier,))
+                    # Some Python versions fork a worker only for a
+                    # task no idle worker can take. The new workers
+                    # wait for each other, so each of these no-ops
+                    # forks one.
+                    wait([self.executor.submit(int)
+                          for __ in range(max_workers)],
+                         timeout=fork_timeout)
+                except (TypeError, OSError, ValueError):
+                    # TypeError: Python 3.6 has no mp_context.
+                    self.executor = None
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=max_workers)
+            return self.executor
+
+    def submit(self, file_path, file_extension, background=False):
+        u"""
+        Queue a file for processing and return the future.
+
+        This blocks while max_queued files are waiting, so call it from
+        a worker thread, not from the GUI. Files of background jobs
+        wait for background_slots instead.
+        """
+        executor = self.start()
+        if background:
+            slots = self.background_slots
+        else:
+            slots = self.slots
+        slots.acquire()
+        try:
+            future = executor.submit(process_file, file_path, file_extension)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda __: slots.release())
+        return future
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+pool = ProcessingPool()
+# The one pool used for all processing.
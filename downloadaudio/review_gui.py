@@ -21,6 +21,7 @@ choices what to do wit each:
 
 import os
 
+from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QIcon, QPixmap
 from PyQt5.QtWidgets import QButtonGroup, QDialog, QDialogButtonBox, QFrame, \
     QGridLayout, QLabel, QPushButton, QScrollArea, QSizePolicy, QVBoxLayout
@@ -29,27 +30,46 @@ from aqt import mw
 from anki.lang import _
 from anki.sound import play, playFromText
 
+from .audio_info import info_text
 from .download_entry import Action
+from .scheduler import EntryState
 
 icons_dir = os.path.join(mw.pm.addonFolder(), 'downloadaudio', 'icons')
 
 
-def review_entries(note, retrieved_data, hide_text):
+def review_entries(note, job, hide_text):
     u"""
     Show a dialog box where the user decides what to do.
 
     Show a dialog box where the user can listen to the downloaded
     audio and to already present audio and then decide whether to add,
-    keep, delete, or blacklist the downloaded file.
+    keep, delete, or blacklist the downloaded file. The dialog opens
+    at once and shows the entries of the running DownloadJob as they
+    arrive. On OK, it waits for the files still being processed that
+    are not to be deleted.
     """
-    if not note or not retrieved_data:
+    if not note:
         raise ValueError('Nothing downloaded')
-    review_files = ReviewFiles(note, retrieved_data, hide_text)
-    if not review_files.exec_():
+    review_files = ReviewFiles(note, job, hide_text)
+    try:
+        accepted = review_files.exec_()
+    finally:
+        review_files.poll_timer.stop()
+        job.cancel()
+    retrieved_data = job.results()
+    if not retrieved_data and review_files.nothing_found:
+        raise ValueError('Nothing downloaded')
+    if not accepted:
         raise RuntimeError('User cancel')
-    # Go through the list and set the Action.
-    for idx, entry in enumerate(retrieved_data):
-        entry.action = review_files.buttons_groups[idx].checkedId()
+    # Go through the list and set the Action. Entries that got ready
+    # after the last look at the job have never been shown. Drop them.
+    for entry in retrieved_data:
+        try:
+            idx = review_files.entries_list.index(entry)
+        except ValueError:
+            entry.action = Action.Delete
+        else:
+            entry.action = review_files.buttons_groups[idx].checkedId()
     return retrieved_data
 
 
@@ -58,21 +78,22 @@ class ReviewFiles(QDialog):
     A Dialog to let the user keep or discard files.
     """
 
-    def __init__(self, note, entries_list, hide_text):
+    def __init__(self, note, job, hide_text):
         super(ReviewFiles, self).__init__()
         self.note = note
-        self.entries_list = entries_list
-        self.num_columns = 8
+        self.job = job
+        self.entries_list = []
+        # The entries we show, in the order they arrived.
+        self.ready_list = []
+        # Whether the entry at the same index has been processed.
+        self.num_columns = 9
         self.play_column = 2
         self.play_old_column = 3
         self.add_column = 4
         self.keep_column = 5
         self.delete_column = 6
         self.blacklist_column = 7
-        self.show_skull_and_bones = any(
-            entry.entry_hash for entry in self.entries_list)
-        if not self.show_skull_and_bones:
-            self.num_columns -= 1
+        self.status_column = 8
         self.hide_text = hide_text
         if self.hide_text:
             self.num_columns -= 1
@@ -82,7 +103,26 @@ class ReviewFiles(QDialog):
             self.keep_column -= 1
             self.delete_column -= 1
             self.blacklist_column -= 1
+            self.status_column -= 1
         self.buttons_groups = []
+        self.play_buttons = []
+        self.status_labels = []
+        self.info_labels = []
+        # The icon and text labels with the bubble help of each row.
+        self.nothing_found = False
+        self.grid_layout = None
+        self.inner_widget = None
+        self.explanation = None
+        self.progress_label = None
+        self.ok_button = None
+        self.accepting = False
+        # OK was clicked, and we wait for files still being processed.
+        self.blacklist_head_label = None
+        self.play_button_group = None
+        self.old_play_button_group = None
+        self.poll_timer = QTimer(self)
+        self.poll_interval = 100
+        # Milliseconds between two looks at the job.
         self.text_help = _(u"""<h4>Text used to retrieve audio.</h4>
 <p>Mouse over the icons or texts below to see further information.</p>""")
         self.text_hide_help = _(u"""<h4>Audio source</h4>
@@ -119,7 +159,18 @@ that they are sorry, will add this soon &c., click on this.""")
         self.blacklist_help_text_short = _(u"Blacklist this file")
         self.blacklist_empty_line_help = _(
             u"Blacklisting is only used for JapanesPod files.")
+        self.processing_text = _(u"processing…")
+        self.processing_help = _(
+            u"This file is still being processed. You can already "
+            u"select what to do with it. Unless you delete it, OK waits "
+            u"until it is done.")
+        self.waiting_text = _(u"Waiting for {0} more requests…")
+        self.processing_wait_text = _(
+            u"Waiting for {0} more files to be processed…")
+        self.all_done_text = _(u"All sites have answered.")
         self.initUI()
+        self.poll_timer.timeout.connect(self.poll_job)
+        self.poll_timer.start(self.poll_interval)
 
     def initUI(self):
         u"""Build the dialog box."""
@@ -127,13 +178,9 @@ that they are sorry, will add this soon &c., click on this.""")
         self.setWindowIcon(QIcon(":/icons/anki.png"))
         outer_layout = QVBoxLayout()
         self.setLayout(outer_layout)
-        explanation = QLabel(self)
-        if len(self.entries_list) > 1:
-            explanation.setText(
-                _(u'Please select an action for each downloaded file:'))
-        else:
-            explanation.setText(_(u'Please select what to do with the file:'))
-        outer_layout.addWidget(explanation)
+        self.explanation = QLabel(self)
+        self.explanation.setText(_(u'Looking for audio files…'))
+        outer_layout.addWidget(self.explanation)
         scroll_area = QScrollArea()
         scroll_area.setFrameStyle(QFrame.Plain)
         inner_widget = QFrame(self)
@@ -144,6 +191,8 @@ that they are sorry, will add this soon &c., click on this.""")
         scroll_area.setWidget(inner_widget)
         scroll_area.setWidgetResizable(True)
         outer_layout.addWidget(scroll_area)
+        self.grid_layout = layout
+        self.inner_widget = inner_widget
         if not self.hide_text:
             text_head_label = QLabel(_(u'<b>Source text</b>'), inner_widget)
             layout.addWidget(text_head_label, 0, 0, 1, 2)
@@ -170,112 +219,200 @@ that they are sorry, will add this soon &c., click on this.""")
         delete_head_label = QLabel(_(u'delete'), self)
         delete_head_label.setToolTip(self.delete_help_text_long)
         layout.addWidget(delete_head_label, 0, self.delete_column)
-        if self.show_skull_and_bones:
-            blacklist_head_label = QLabel(_(u'blacklist'), self)
-            blacklist_head_label.setToolTip(self.blacklist_help_text_long)
-            layout.addWidget(blacklist_head_label, 0, self.blacklist_column)
+        self.blacklist_head_label = QLabel(_(u'blacklist'), self)
+        self.blacklist_head_label.setToolTip(self.blacklist_help_text_long)
+        layout.addWidget(self.blacklist_head_label, 0, self.blacklist_column)
+        # We only show this when we get an entry with a hash.
+        self.blacklist_head_label.hide()
         rule_label = QLabel('<hr>')
         layout.addWidget(rule_label, 1, 0, 1, self.num_columns)
-        self.create_rows(layout, inner_widget)
+        self.play_button_group = QButtonGroup(inner_widget)
+        self.old_play_button_group = QButtonGroup(inner_widget)
+        self.play_button_group.buttonClicked.connect(
+            lambda button: play(
+                self.entries_list[
+                    self.play_button_group.id(button)].file_path))
+        # N.B.: anki.sound.play() plays files from anywhere, not just
+        # from the colection.media folder. We should be good,
+        # here. (This behaviour may be a security risk, idk.)
+        self.old_play_button_group.buttonClicked.connect(
+            lambda button: playFromText(
+                self.note[
+                    self.entries_list[
+                        self.old_play_button_group.id(
+                            button)].audio_field_name]))
+        self.progress_label = QLabel(
+            self.waiting_text.format(self.job.pending_count), self)
+        outer_layout.addWidget(self.progress_label)
         dialog_buttons = QDialogButtonBox(self)
         dialog_buttons.addButton(QDialogButtonBox.Cancel)
-        dialog_buttons.addButton(QDialogButtonBox.Ok)
+        self.ok_button = dialog_buttons.addButton(QDialogButtonBox.Ok)
         dialog_buttons.accepted.connect(self.accept)
         dialog_buttons.rejected.connect(self.reject)
         outer_layout.addWidget(dialog_buttons)
 
-    def create_rows(self, layout, sarea):
-        u"""Build the rows of the dialog box"""
-        play_button_group = QButtonGroup(sarea)
-        old_play_button_group = QButtonGroup(sarea)
-        for num, entry in enumerate(self.entries_list, 2):
-            tt_text = self.build_text_help_label(entry)
-            ico_label = QLabel('', sarea)
-            ico_label.setToolTip(tt_text)
-            if entry.icon:
-                ico_label.setPixmap(QPixmap.fromImage(entry.icon))
-            layout.addWidget(ico_label, num, 0)
-            tt_label = QLabel(entry.display_word, sarea)
-            tt_label.setToolTip(tt_text)
-            layout.addWidget(tt_label, num, 1)
-            if self.hide_text:
-                tt_label.hide()
-            # Play button.
-            t_play_button = QPushButton(sarea)
-            play_button_group.addButton(t_play_button, num-2)
-            t_play_button.setToolTip(self.play_help)
-            t_play_button.setIcon(QIcon(os.path.join(icons_dir, 'play.png')))
-            layout.addWidget(t_play_button, num, self.play_column)
-            if self.note[entry.audio_field_name]:
-                t_play_old_button = QPushButton(sarea)
-                old_play_button_group.addButton(t_play_old_button, num-2)
-                t_play_old_button.setIcon(
-                    QIcon(os.path.join(icons_dir, 'play.png')))
-                if not self.hide_text:
-                    t_play_old_button.setToolTip(
-                        self.note[entry.audio_field_name])
-                else:
-                    t_play_old_button.setToolTip(self.play_old_help_short)
-                layout.addWidget(t_play_old_button, num, self.play_old_column)
+    def unprocessed_rows(self):
+        u"""Return the rows still being processed and not to be deleted."""
+        return [
+            idx for idx, ready in enumerate(self.ready_list)
+            if not ready
+            and self.buttons_groups[idx].checkedId() != Action.Delete]
+
+    def accept(self):
+        u"""Close the dialog, once the files we keep are processed."""
+        if self.job.done or not self.unprocessed_rows():
+            self.poll_timer.stop()
+            super(ReviewFiles, self).accept()
+            return
+        # Closing now would cancel the job and lose these files.
+        self.accepting = True
+        self.ok_button.setEnabled(False)
+        self.progress_label.setText(
+            self.processing_wait_text.format(len(self.unprocessed_rows())))
+
+    def poll_job(self):
+        u"""Show what the download job has found since the last look."""
+        for state, entry in self.job.poll():
+            if state == EntryState.Pending:
+                self.add_row(entry)
             else:
-                dummy_label = QLabel('', sarea)
-                dummy_label.setToolTip(self.play_old_empty_line_help)
-                layout.addWidget(dummy_label, num, self.play_old_column)
-            # The group where we later look what to do:
-            t_button_group = QButtonGroup(sarea)
-            t_button_group.setExclusive(True)
-            # Now the four buttons
-            t_add_button = QPushButton(sarea)
-            t_add_button.setCheckable(True)
-            t_add_button.setFlat(True)
-            t_add_button.setToolTip(self.add_help_text_short)
-            t_add_button.setIcon(QIcon(os.path.join(icons_dir, 'add.png')))
-            layout.addWidget(t_add_button, num, self.add_column)
-            t_button_group.addButton(t_add_button, Action.Add)
-            t_keep_button = QPushButton(sarea)
-            t_keep_button.setCheckable(True)
-            t_keep_button.setFlat(True)
-            t_keep_button.setToolTip(self.keep_help_text_short)
-            t_keep_button.setIcon(QIcon(os.path.join(icons_dir, 'keep.png')))
-            layout.addWidget(t_keep_button, num, self.keep_column)
-            t_button_group.addButton(t_keep_button, Action.Keep)
-            t_delete_button = QPushButton(sarea)
-            t_delete_button.setCheckable(True)
-            t_delete_button.setFlat(True)
-            t_delete_button.setToolTip(self.delete_help_text_short)
-            t_delete_button.setIcon(
-                QIcon(os.path.join(icons_dir, 'delete.png')))
-            layout.addWidget(t_delete_button, num, self.delete_column)
-            t_button_group.addButton(t_delete_button,  Action.Delete)
-            t_blacklist_button = QPushButton(sarea)
-            t_blacklist_button.setCheckable(True)
-            t_blacklist_button.setFlat(True)
-            t_blacklist_button.setToolTip(self.blacklist_help_text_short)
-            t_blacklist_button.setIcon(
-                QIcon(os.path.join(icons_dir, 'blacklist.png')))
-            if entry.entry_hash:
-                layout.addWidget(
-                    t_blacklist_button, num, self.blacklist_column)
+                self.set_ready(entry)
+        if self.accepting:
+            self.accept()
+            return
+        if not self.job.done:
+            self.progress_label.setText(
+                self.waiting_text.format(self.job.pending_count))
+            return
+        self.poll_timer.stop()
+        self.progress_label.setText(self.all_done_text)
+        if not self.entries_list:
+            self.nothing_found = True
+            self.reject()
+
+    def add_row(self, entry):
+        u"""Add a row for a newly downloaded entry."""
+        layout = self.grid_layout
+        sarea = self.inner_widget
+        idx = len(self.entries_list)
+        num = idx + 2
+        self.entries_list.append(entry)
+        self.ready_list.append(False)
+        if len(self.entries_list) > 1:
+            self.explanation.setText(
+                _(u'Please select an action for each downloaded file:'))
+        else:
+            self.explanation.setText(
+                _(u'Please select what to do with the file:'))
+        tt_text = self.build_text_help_label(entry)
+        ico_label = QLabel('', sarea)
+        ico_label.setToolTip(tt_text)
+        if entry.icon:
+            ico_label.setPixmap(QPixmap.fromImage(entry.icon))
+        layout.addWidget(ico_label, num, 0)
+        tt_label = QLabel(entry.display_word, sarea)
+        tt_label.setToolTip(tt_text)
+        layout.addWidget(tt_label, num, 1)
+        if self.hide_text:
+            tt_label.hide()
+        self.info_labels.append((ico_label, tt_label))
+        # Play button. Switched on when the file is ready.
+        t_play_button = QPushButton(sarea)
+        self.play_button_group.addButton(t_play_button, idx)
+        t_play_button.setToolTip(self.play_help)
+        t_play_button.setIcon(QIcon(os.path.join(icons_dir, 'play.png')))
+        t_play_button.setEnabled(False)
+        layout.addWidget(t_play_button, num, self.play_column)
+        self.play_buttons.append(t_play_button)
+        if self.note[entry.audio_field_name]:
+            t_play_old_button = QPushButton(sarea)
+            self.old_play_button_group.addButton(t_play_old_button, idx)
+            t_play_old_button.setIcon(
+                QIcon(os.path.join(icons_dir, 'play.png')))
+            if not self.hide_text:
+                t_play_old_button.setToolTip(
+                    self.note[entry.audio_field_name])
             else:
-                t_blacklist_button.hide()
-                dummy_label_bl = QLabel('', sarea)
-                dummy_label_bl.setToolTip(self.blacklist_empty_line_help)
-                layout.addWidget(dummy_label_bl, num, self.blacklist_column)
-            t_button_group.button(entry.action).setChecked(True)
-            # New: check a button based on how good the downloader is.
-            t_button_group.addButton(t_blacklist_button, Action.Blacklist)
-            self.buttons_groups.append(t_button_group)
-        play_button_group.buttonClicked.connect(
-            lambda button: play(
-                self.entries_list[play_button_group.id(button)].file_path))
-        # N.B.: anki.sound.play() plays files from anywhere, not just
-        # from the colection.media folder. We should be good,
-        # here. (This behaviour may be a security risk, idk.)
-        old_play_button_group.buttonClicked.connect(
-            lambda button: playFromText(
-                self.note[
-                    self.entries_list[
-                        old_play_button_group.id(button)].audio_field_name]))
+                t_play_old_button.setToolTip(self.play_old_help_short)
+            layout.addWidget(t_play_old_button, num, self.play_old_column)
+        else:
+            dummy_label = QLabel('', sarea)
+            dummy_label.setToolTip(self.play_old_empty_line_help)
+            layout.addWidget(dummy_label, num, self.play_old_column)
+        # The group where we later look what to do:
+        t_button_group = QButtonGroup(sarea)
+        t_button_group.setExclusive(True)
+        # Now the four buttons
+        t_add_button = QPushButton(sarea)
+        t_add_button.setCheckable(True)
+        t_add_button.setFlat(True)
+        t_add_button.setToolTip(self.add_help_text_short)
+        t_add_button.setIcon(QIcon(os.path.join(icons_dir, 'add.png')))
+        layout.addWidget(t_add_button, num, self.add_column)
+        t_button_group.addButton(t_add_button, Action.Add)
+        t_keep_button = QPushButton(sarea)
+        t_keep_button.setCheckable(True)
+        t_keep_button.setFlat(True)
+        t_keep_button.setToolTip(self.keep_help_text_short)
+        t_keep_button.setIcon(QIcon(os.path.join(icons_dir, 'keep.png')))
+        layout.addWidget(t_keep_button, num, self.keep_column)
+        t_button_group.addButton(t_keep_button, Action.Keep)
+        t_delete_button = QPushButton(sarea)
+        t_delete_button.setCheckable(True)
+        t_delete_button.setFlat(True)
+        t_delete_button.setToolTip(self.delete_help_text_short)
+        t_delete_button.setIcon(
+            QIcon(os.path.join(icons_dir, 'delete.png')))
+        layout.addWidget(t_delete_button, num, self.delete_column)
+        t_button_group.addButton(t_delete_button,  Action.Delete)
+        t_blacklist_button = QPushButton(sarea)
+        t_blacklist_button.setCheckable(True)
+        t_blacklist_button.setFlat(True)
+        t_blacklist_button.setToolTip(self.blacklist_help_text_short)
+        t_blacklist_button.setIcon(
+            QIcon(os.path.join(icons_dir, 'blacklist.png')))
+        if entry.entry_hash:
+            layout.addWidget(
+                t_blacklist_button, num, self.blacklist_column)
+            self.blacklist_head_label.show()
+        else:
+            t_blacklist_button.hide()
+            dummy_label_bl = QLabel('', sarea)
+            dummy_label_bl.setToolTip(self.blacklist_empty_line_help)
+            layout.addWidget(dummy_label_bl, num, self.blacklist_column)
+        t_button_group.button(entry.action).setChecked(True)
+        # New: check a button based on how good the downloader is.
+        t_button_group.addButton(t_blacklist_button, Action.Blacklist)
+        self.buttons_groups.append(t_button_group)
+        status_label = QLabel(self.processing_text, sarea)
+        status_label.setToolTip(self.processing_help)
+        layout.addWidget(status_label, num, self.status_column)
+        self.status_labels.append(status_label)
+
+    def set_ready(self, entry):
+        u"""Switch the row of an entry to ready."""
+        try:
+            idx = self.entries_list.index(entry)
+        except ValueError:
+            # Missed the pending event? Shouldn’t happen.
+            self.add_row(entry)
+            idx = self.entries_list.index(entry)
+        self.ready_list[idx] = True
+        self.play_buttons[idx].setEnabled(True)
+        if entry.audio_info and entry.audio_info.duration is not None:
+            self.status_labels[idx].setText(
+                u'{0:.1f} s'.format(entry.audio_info.duration))
+            self.status_labels[idx].setToolTip(info_text(entry.audio_info))
+        else:
+            self.status_labels[idx].setText('')
+            self.status_labels[idx].setToolTip('')
+        # Now we know how long the processing took.
+        tt_text = self.build_text_help_label(entry)
+        for label in self.info_labels[idx]:
+            label.setToolTip(tt_text)
+        if entry.action == Action.Delete:
+            # Processing can fail. Then the processor sets this.
+            self.buttons_groups[idx].button(Action.Delete).setChecked(True)
 
     def build_text_help_label(self, entry):
         u"""Build the bubble help text label."""
@@ -283,4 +420,9 @@ that they are sorry, will add this soon &c., click on this.""")
         ret_text += u'<br>Audio field: {0}'.format(entry.audio_field_name)
         for key, value in entry.extras.items():
             ret_text += u'<br>{0}: {1}'.format(key, value)
+        if entry.audio_info is not None:
+            ret_text += u'<br>Sound: {0}'.format(info_text(entry.audio_info))
+        if entry.processing_time is not None:
+            ret_text += u'<br>Processing time: {0:.2f} s'.format(
+                entry.processing_time)
         return ret_text
@@ -0,0 +1,472 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Run the downloaders concurrently.
+
+Every (field, site) pair becomes one task in a shared thread pool. The
+downloaders from downloaders.load_downloaders() are only used as
+prototypes: each task works on its own copy (see
+AudioDownloader.request_copy()), so language, downloads_list and
+field_data are per-request state.
+
+Sites that can’t have audio for the language, or never had any, are
+not asked. The others are asked in the order of their expected value
+(hits per second, from site_stats), so that the likely answers come
+first when the pool is busy. The results keep the configured order.
+
+At most per_site_limit requests go to one site at a time. The tasks
+over that limit wait in a queue of their site, the SiteGate, and are
+only handed to the pool when a request to that site has finished. So
+they don’t sit in worker threads, and the other sites go on.
+"""
+
+from collections import deque
+from concurrent.futures import CancelledError, Future, \
+    ThreadPoolExecutor, wait
+from functools import partial
+import os
+import queue
+import threading
+import time
+
+from .download_entry import Action
+from .downloaders import load_downloaders
+from .downloaders.resilience import request_deadline
+from .processors import load_processor
+from .processors.processing_pool import pool as processing_pool
+from .site_stats import site_stats
+from .timing import Stage, span
+
+max_workers = 12
+# Number of requests that may run at the same time, over all sites.
+per_site_limit = 2
+# Number of requests that may run at the same time for a single site.
+download_deadline = 30
+# Seconds after which we stop waiting for slow sites. Whatever they
+# deliver after that is thrown away.
+stop_after_good = None
+# Set this to a number to stop as soon as every field has that many
+# good files (files the downloader and processor didn’t mark as bad).
+# The requests still running are cancelled.
+results_poll_interval = 0.1
+# Seconds. How often results() checks whether we stopped early.
+background_workers = 1
+# Threads for background jobs, like the prefetching for the next
+# cards. They get their own pool, and their requests only start on
+# sites with no foreground request running or waiting. A background
+# request that already runs is not stopped. It shares the site, the
+# rate limit of the host and the processing pool with the foreground
+# ones until it is done.
+
+_executor = None
+_background_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    u"""Return the shared thread pool, creating it when needed."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers)
+        return _executor
+
+
+def background_executor():
+    u"""Return the thread pool for background jobs."""
+    global _background_executor
+    with _executor_lock:
+        if _background_executor is None:
+            _background_executor = ThreadPoolExecutor(
+                max_workers=background_workers)
+        return _background_executor
+
+
+def site_key(dloader):
+    u"""Return the name used to group requests to one site."""
+    return type(dloader).__name__
+
+
+class SiteGate(object):
+    u"""
+    Hand tasks to a pool, at most per_site_limit per site at a time.
+
+    Background tasks only start on a site without foreground tasks
+    running or waiting, and at most background_workers of them over
+    all sites.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiting = {}
+        # site -> deque of (job, future, request, process)
+        self.running = {}
+        # site -> number of foreground requests handed to a pool and
+        # not finished
+        self.background_running = {}
+        # The same for background requests.
+
+    def submit(self, job, site, request, process):
+        u"""
+        Return a future for process(request()).
+
+        request() is run in a thread of the job’s pool when the site
+        has room. process() is run right after it in the same thread,
+        but no longer counts for the site. The future can be cancelled
+        as long as the task waits.
+        """
+        future = Future()
+        with self.lock:
+            self.waiting.setdefault(site, deque()).append(
+                (job, future, request, process))
+        self.start_next(site)
+        return future
+
+    def next_task(self, site):
+        u"""
+        Take the next task the site has room for, or None.
+
+        Call this with the lock held. Return (background, task).
+        """
+        waiting = self.waiting.get(site)
+        if not waiting:
+            return None
+        for task in [task for task in waiting if task[1].cancelled()]:
+            waiting.remove(task)
+            # Let wait() know.
+            task[1].set_running_or_notify_cancel()
+        if not waiting:
+            return None
+        for idx, task in enumerate(waiting):
+            if not task[0].background:
+                if self.running.get(site, 0) >= per_site_limit:
+                    return None
+                del waiting[idx]
+                self.running[site] = self.running.get(site, 0) + 1
+                return False, task
+        if self.running.get(site, 0) \
+                or sum(self.background_running.values()) \
+                >= background_workers:
+            return None
+        self.background_running[site] = \
+            self.background_running.get(site, 0) + 1
+        return True, waiting.popleft()
+
+    def start_next(self, site):
+        u"""Hand waiting tasks of the site to the pool while it has room."""
+        while True:
+            with self.lock:
+                next_task = self.next_task(site)
+            if next_task is None:
+                return
+            background, (job, future, request, process) = next_task
+            if background:
+                pool = background_executor()
+            else:
+                pool = executor()
+            pool.submit(
+                self.run, site, background, future, request, process)
+
+    def start_all(self):
+        u"""Look for tasks to start on all sites."""
+        with self.lock:
+            sites = list(self.waiting)
+        for site in sites:
+            self.start_next(site)
+
+    def run(self, site, background, future, request, process):
+        if not future.set_running_or_notify_cancel():
+            # Cancelled after we handed it to the pool.
+            self.leave(site, background)
+            return
+        try:
+            try:
+                response = request()
+            finally:
+                self.leave(site, background)
+            result = process(response)
+        except BaseException as exception:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def leave(self, site, background):
+        u"""Count a request to the site as finished, start the next one."""
+        with self.lock:
+            if background:
+                self.background_running[site] -= 1
+            else:
+                self.running[site] -= 1
+        if background:
+            # Background tasks of other sites may wait for this one.
+            self.start_all()
+        else:
+            self.start_next(site)
+
+
+site_gate = SiteGate()
+# The one gate, for all jobs.
+
+
+def run_task(prototype, field_data, language, deadline=None):
+    u"""
+    Download one field from one site.
+
+    This is run in a worker thread, through the SiteGate. Return the
+    list of DownloadEntries found. Errors are swallowed, just like the
+    serial loop did. Failed requests are not tried again when that
+    would go past deadline.
+    """
+    dloader = prototype.request_copy(language)
+    start_time = time.time()
+    try:
+        with span(Stage.DownloadFiles, site_key(prototype)), \
+                request_deadline(deadline):
+            # Make it easer inside the downloader. If anything goes
+            # wrong, don't catch, or raise whatever you want.
+            dloader.download_files(field_data)
+    except:
+        #  # Uncomment this raise while testing a new
+        #  # downloaders.  Also use the “For testing”
+        #  # downloaders list with your downloader in
+        #  # downloaders.__init__
+        # raise
+        site_stats.record(
+            site_key(prototype), language, False, time.time() - start_time,
+            error=True)
+        return []
+    site_stats.record(
+        site_key(prototype), language, bool(dloader.downloads_list),
+        time.time() - start_time)
+    if dloader.site_icon and not prototype.site_icon:
+        # Let the next copies use the icon we just got.
+        prototype.site_icon = dloader.site_icon
+    for entry in dloader.downloads_list:
+        entry.site = site_key(prototype)
+        entry.url = dloader.file_urls.get(entry.file_path)
+    return dloader.downloads_list
+
+
+def remove_file(entry):
+    u"""Remove the file of an entry we don’t want any more."""
+    try:
+        os.remove(entry.file_path)
+    except OSError:
+        pass
+
+
+class EntryState(object):
+    u"""What we know about a DownloadEntry in the job’s event queue."""
+    Pending, Ready = range(0, 2)
+    # Pending: downloaded, being processed. Ready: processed, the
+    # file_path won’t change any more.
+
+
+class DownloadJob(object):
+    u"""
+    Download all fields of a request from all sites at once.
+
+    The tasks are submitted to the shared pool, through the SiteGate,
+    when the job is started. Each task downloads and processes its
+    entries and reports them as events, so a dialog can show them as
+    they arrive. results() returns the ready entries in the configured
+    order: by field first, then by position in the downloaders list,
+    no matter which site answered first.
+
+    Once the job is cancelled, the entries that were reported as
+    Ready belong to the caller. Everything that arrives later is
+    deleted by the workers.
+
+    A background job runs in the small background pool and gives way
+    to foreground jobs on each site, see SiteGate. Give it a longer
+    deadline, as its tasks run one after the other. promote() turns it
+    into a foreground job.
+    """
+
+    def __init__(
+            self, field_data_list, language, dloaders=None, observer=None,
+            stop_after=None, background=False, deadline=None):
+        self.language = language
+        self.field_data_list = [
+            fd for fd in field_data_list if not fd.empty]
+        if dloaders is None:
+            dloaders = load_downloaders()
+        self.dloaders = dloaders
+        self.futures = []
+        # List of futures, in the configured order.
+        self.ready = []
+        # One list of ready entries per task, in the configured order.
+        self.events = queue.Queue()
+        # (EntryState, DownloadEntry) pairs, for streaming.
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.deadline = None
+        self.processing_futures = []
+        # So that we can cancel the processing, too.
+        self.observer = observer
+        # Called as observer(EntryState, entry) from the worker thread
+        # for every entry, e.g. to keep a journal.
+        if stop_after is None:
+            stop_after = stop_after_good
+        self.stop_after = stop_after
+        self.good_counts = {}
+        # audio_field_name -> number of good entries
+        self.background = background
+        if deadline is None:
+            deadline = download_deadline
+        self.deadline_seconds = deadline
+
+    def start(self):
+        u"""Submit one task per field and site."""
+        if load_processor():
+            # Start the processing workers before the download threads.
+            processing_pool.start()
+        self.deadline = time.time() + self.deadline_seconds
+        tasks = []
+        for field_data in self.field_data_list:
+            for dloader in self.dloaders:
+                self.ready.append([])
+                tasks.append((len(self.ready) - 1, dloader, field_data))
+        tasks = [task for task in tasks if self.should_ask(task[1])]
+        tasks.sort(key=lambda task: -site_stats.expected_value(
+            site_key(task[1]), self.language))
+        # sort() is stable: same value, configured order.
+        for idx, dloader, field_data in tasks:
+            self.futures.append(site_gate.submit(
+                self, site_key(dloader),
+                partial(self.download, dloader, field_data),
+                partial(self.process_entries, idx)))
+
+    def promote(self):
+        u"""
+        Make a background job a foreground job, e.g. when the user waits.
+
+        The tasks that haven’t started yet go to the shared pool, with
+        the normal deadline. Those that run already finish where they
+        are.
+        """
+        with self.lock:
+            self.background = False
+            self.deadline = min(
+                self.deadline, time.time() + download_deadline)
+        site_gate.start_all()
+
+    def download(self, dloader, field_data):
+        u"""Run one task, with the deadline the job has when it starts."""
+        return run_task(dloader, field_data, self.language, self.deadline)
+
+    def should_ask(self, dloader):
+        u"""Whether the site may have something for our language."""
+        return dloader.can_answer(self.language) and \
+            not site_stats.should_skip(site_key(dloader), self.language)
+
+    def process_entries(self, idx, entries):
+        u"""Process the entries one field and site gave us."""
+        with self.lock:
+            if self.cancelled:
+                for entry in entries:
+                    remove_file(entry)
+                return
+            for entry in entries:
+                entry.task_index = idx
+                self.events.put((EntryState.Pending, entry))
+        futures = []
+        for entry in entries:
+            if self.observer:
+                self.observer(EntryState.Pending, entry)
+            future = entry.start_processing(self.background)
+            with self.lock:
+                if future is not None:
+                    self.processing_futures.append(future)
+                if self.cancelled and future is not None:
+                    future.cancel()
+            futures.append(future)
+        for entry, future in zip(entries, futures):
+            try:
+                entry.finish_processing(future)
+            except CancelledError:
+                remove_file(entry)
+                continue
+            except Exception:
+                # Keep the unprocessed file, but suggest to delete it,
+                # like a file we could not decode.
+                entry.action = Action.Delete
+            if self.observer:
+                self.observer(EntryState.Ready, entry)
+            with self.lock:
+                if self.cancelled:
+                    remove_file(entry)
+                    continue
+                self.ready[idx].append(entry)
+                self.events.put((EntryState.Ready, entry))
+                enough = self.count_good(entry)
+            if enough:
+                self.cancel()
+
+    def count_good(self, entry):
+        u"""
+        Count a good entry. Return whether we have enough of them.
+
+        Call this with the lock held.
+        """
+        if not self.stop_after or entry.action != Action.Add:
+            return False
+        self.good_counts[entry.audio_field_name] = \
+            self.good_counts.get(entry.audio_field_name, 0) + 1
+        return all(
+            self.good_counts.get(fd.audio_field_name, 0) >= self.stop_after
+            for fd in self.field_data_list)
+
+    def poll(self):
+        u"""Return the events that arrived since the last call."""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    @property
+    def done(self):
+        u"""Whether all tasks have finished or the deadline passed."""
+        if self.cancelled or time.time() > self.deadline:
+            return True
+        return all(future.done() for future in self.futures)
+
+    @property
+    def pending_count(self):
+        u"""The number of tasks that have not finished yet."""
+        return len([f for f in self.futures if not f.done()])
+
+    def results(self):
+        u"""
+        Wait for the tasks and return the ready DownloadEntries.
+
+        Wait at most until the global deadline. Tasks that are still
+        running then are abandoned.
+        """
+        while not self.done:
+            # Look again now and then: we may stop early.
+            wait(self.futures, timeout=max(
+                0, min(results_poll_interval, self.deadline - time.time())))
+        self.cancel()
+        site_stats.flush()
+        with self.lock:
+            return [entry for entries in self.ready for entry in entries]
+
+    def run(self):
+        u"""Start the job and return its results."""
+        self.start()
+        return self.results()
+
+    def cancel(self):
+        u"""Abandon all tasks that have not finished."""
+        with self.lock:
+            self.cancelled = True
+            processing_futures = list(self.processing_futures)
+        for future in self.futures + processing_futures:
+            future.cancel()
@@ -0,0 +1,190 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Remember how well each site does for each language.
+
+For every request we count whether the site found anything, whether
+it failed, and how long it took. The scheduler uses that to ask the
+sites most likely to answer quickly first, and to stop asking sites
+that never have anything for a language. Failures, like time-outs or
+a site that is down, don’t count as “nothing for that language”. The
+numbers are kept in an SQLite file.
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+
+stats_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'site_stats.db')
+prior_hit_rate = 0.5
+prior_latency = 2.0
+# Seconds. What we assume for sites we haven’t asked yet.
+skip_after = 50
+# Stop asking a site for a language after this many answers without
+# a single hit. Failed requests are no answers.
+probe_interval = 20
+# But still ask every probe_interval-th time, in case the site got
+# better.
+
+schema = u'''
+create table if not exists stats (
+  site text not null,
+  language text not null,
+  requests integer not null,
+  hits integer not null,
+  total_time real not null,
+  errors integer not null default 0,
+  primary key (site, language)
+);
+'''
+
+
+def open_db(path):
+    u"""Return a connection to the stats file, with the current schema."""
+    db = sqlite3.connect(path)
+    db.executescript(schema)
+    if u'errors' not in [
+            row[1] for row in db.execute(u'pragma table_info(stats)')]:
+        # A file from before we counted failures.
+        db.execute(u'alter table stats add column errors integer not null '
+                   u'default 0')
+    return db
+
+
+class SiteStat(object):
+    u"""The numbers for one site and language."""
+    def __init__(self, requests=0, hits=0, total_time=0.0, errors=0):
+        self.requests = requests
+        self.hits = hits
+        self.total_time = total_time
+        self.errors = errors
+        # The requests that failed, included in requests.
+        self.skipped = 0
+
+    @property
+    def answers(self):
+        u"""The requests that didn’t fail."""
+        return self.requests - self.errors
+
+    @property
+    def hit_rate(self):
+        u"""The share of requests with a hit, with a bit of prior."""
+        return (self.hits + prior_hit_rate) / (self.requests + 1.0)
+
+    @property
+    def latency(self):
+        u"""Mean seconds per request, with a bit of prior."""
+        return (self.total_time + prior_latency) / (self.requests + 1.0)
+
+    @property
+    def expected_value(self):
+        u"""Hits we expect per second of waiting."""
+        return self.hit_rate / max(self.latency, 0.1)
+
+    def as_dict(self):
+        return dict(
+            requests=self.requests, hits=self.hits, errors=self.errors,
+            hit_rate=self.hit_rate, latency=self.latency)
+
+
+class SiteStats(object):
+    u"""The SiteStats for all sites, in memory and on disk."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = None
+        # (site, language) -> SiteStat
+        self.changed = set()
+
+    def load(self):
+        u"""Read the numbers from disk. Call with the lock held."""
+        if self.stats is not None:
+            return
+        self.stats = {}
+        try:
+            db = open_db(self.path)
+        except sqlite3.Error:
+            return
+        try:
+            for site, language, requests, hits, total_time, errors \
+                    in db.execute(
+                        u'select site, language, requests, hits, '
+                        u'total_time, errors from stats'):
+                self.stats[(site, language)] = SiteStat(
+                    requests, hits, total_time, errors)
+        finally:
+            db.close()
+
+    def get(self, site, language):
+        u"""Return the SiteStat for site and language. Call with lock."""
+        self.load()
+        key = (site, language.lower())
+        try:
+            return self.stats[key]
+        except KeyError:
+            self.stats[key] = SiteStat()
+            return self.stats[key]
+
+    def record(self, site, language, hit, seconds, error=False):
+        u"""Count one request. error: it failed, rather than found nothing."""
+        with self.lock:
+            stat = self.get(site, language)
+            stat.requests += 1
+            if hit:
+                stat.hits += 1
+            if error:
+                stat.errors += 1
+            stat.total_time += seconds
+            self.changed.add((site, language.lower()))
+
+    def should_skip(self, site, language):
+        u"""Whether the site never has anything for the language."""
+        with self.lock:
+            stat = self.get(site, language)
+            if stat.hits or stat.answers < skip_after:
+                return False
+            stat.skipped += 1
+            return stat.skipped % probe_interval != 0
+
+    def expected_value(self, site, language):
+        with self.lock:
+            return self.get(site, language).expected_value
+
+    def as_dict(self):
+        u"""Return the numbers as a dict of dicts by site and language."""
+        with self.lock:
+            self.load()
+            return dict(
+                (u'{0} {1}'.format(*key), stat.as_dict())
+                for key, stat in self.stats.items())
+
+    def flush(self):
+        u"""Write the changed numbers to disk."""
+        with self.lock:
+            if not self.changed:
+                return
+            rows = [
+                key + (self.stats[key].requests, self.stats[key].hits,
+                       self.stats[key].total_time, self.stats[key].errors)
+                for key in self.changed]
+            self.changed = set()
+        db = open_db(self.path)
+        try:
+            db.executemany(
+                u'insert or replace into stats (site, language, requests, '
+                u'hits, total_time, errors) values (?, ?, ?, ?, ?, ?)', rows)
+            db.commit()
+        finally:
+            db.close()
+
+
+site_stats = SiteStats(stats_path)
+# The one store.
+atexit.register(site_stats.flush)
@@ -0,0 +1,151 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2012–17 Roland Sieker <ospalh@gmail.com>
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+u"""
+Measure where the time goes.
+
+Wrap the interesting steps in span(stage, site). The times are
+collected per stage and site in histograms with logarithmic buckets,
+plus the most recent times for the percentiles. They can be shown
+in the diagnostics dialog and written to JSON or CSV files.
+"""
+
+import bisect
+import collections
+import contextlib
+import csv
+import functools
+import json
+import threading
+import time
+
+enabled = True
+# Set to False to measure nothing.
+bucket_bounds = [0.001 * 2 ** n for n in range(18)]
+# Seconds. 1 ms, 2 ms, 4 ms … about 131 s, and one bucket for more.
+max_samples = 1000
+# Number of recent times we keep per stage and site for percentiles.
+
+
+class Stage(object):
+    u"""The names of the stages we measure."""
+    Download = u'do_download'
+    DownloadFiles = u'download_files'
+    GetData = u'get_data_from_url'
+    GetFile = u'stream_to_tempfile'
+    Process = u'process'
+    ReviewDialog = u'review_dialog'
+    ToMedia = u'unmunge_to_mediafile'
+    NoteFlush = u'note_flush'
+
+
+class Histogram(object):
+    u"""The times of one stage at one site."""
+    def __init__(self):
+        self.counts = [0] * (len(bucket_bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.samples = collections.deque(maxlen=max_samples)
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(bucket_bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        u"""Return the time below which fraction of the recent times are."""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def as_dict(self):
+        return dict(
+            count=self.count, total=self.total, maximum=self.maximum,
+            mean=self.total / self.count if self.count else None,
+            p50=self.percentile(0.5), p95=self.percentile(0.95),
+            buckets=[
+                dict(upper_bound=bound, count=count) for bound, count in zip(
+                    bucket_bounds + [None], self.counts)])
+
+
+class Timings(object):
+    u"""All histograms, by (stage, site)."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def add(self, stage, site, seconds):
+        if not enabled:
+            return
+        with self.lock:
+            try:
+                histogram = self.histograms[(stage, site)]
+            except KeyError:
+                histogram = self.histograms[(stage, site)] = Histogram()
+            histogram.add(seconds)
+
+    def summary(self):
+        u"""Return a list of dicts, one per stage and site."""
+        with self.lock:
+            items = sorted(
+                self.histograms.items(),
+                key=lambda item: (item[0][0], item[0][1] or u''))
+            return [dict(stage=stage, site=site, **histogram.as_dict())
+                    for (stage, site), histogram in items]
+
+    def export_json(self, path):
+        with open(path, 'w') as json_file:
+            json.dump(self.summary(), json_file, indent=1)
+
+    def export_csv(self, path):
+        u"""Write one row per stage and site, without the buckets."""
+        columns = ['stage', 'site', 'count', 'total', 'mean', 'p50', 'p95',
+                   'maximum']
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(columns)
+            for row in self.summary():
+                writer.writerow([row[column] for column in columns])
+
+    def clear(self):
+        with self.lock:
+            self.histograms = {}
+
+
+timings = Timings()
+# The one collection of times.
+
+
+@contextlib.contextmanager
+def span(stage, site=None):
+    u"""Measure the time the with block takes, also when it raises."""
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        timings.add(stage, site, time.time() - start_time)
+
+
+def timed(stage, per_site=False):
+    u"""
+    Decorator: measure every call of the function as a span.
+
+    With per_site, the function is a downloader method, and the times
+    are kept by the name of the downloader class.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            site = type(args[0]).__name__ if per_site else None
+            with span(stage, site):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorator